@@ -1,4 +1,5 @@
 # Arquivo de configurações globais
+import os
 
 # Versão do aplicativo
 VERSAO = '0.9.0'
@@ -17,11 +18,121 @@ MODELOS_DISPONIVEIS = [
 # Modelo padrão
 MODELO_PADRAO = 'isnet-general-use'
 
+# Memória máxima (estimada) para sessões de modelos mantidas em cache
+LIMITE_MEMORIA_SESSOES_MB = 1024
+
 # Configurações padrão
 ALPHA_MATTING_PADRAO = True
 LIMIAR_OBJETO_PADRAO = 250
 LIMIAR_FUNDO_PADRAO = 10
 EROSAO_MASCARA_PADRAO = 5
 
+# Alpha matting em blocos: acima de LIMITE_PIXELS_MATTING_COMPLETO pixels, o
+# matting roda só nos blocos com faixa desconhecida do trimap, cada um com
+# SOBREPOSICAO_BLOCO_MATTING pixels de contexto. A memória de pico passa a
+# depender do tamanho do bloco e não do tamanho da imagem. A diferença média
+# do alpha na faixa desconhecida em relação ao matting da imagem inteira
+# deve ficar abaixo de TOLERANCIA_MATTING_BLOCOS (escala 0-255)
+LIMITE_PIXELS_MATTING_COMPLETO = 4_000_000
+TAMANHO_BLOCO_MATTING = 512
+SOBREPOSICAO_BLOCO_MATTING = 64
+TOLERANCIA_MATTING_BLOCOS = 4.0
+
+# Refinamento rápido: filtro guiado pela imagem sobre a máscara do modelo,
+# alternativa ao alpha matting com custo linear. EPS controla a suavização
+# (menor = segue mais as bordas da imagem); o raio parte da erosão e acompanha
+# a resolução a cada RESOLUCAO_BASE_REFINAMENTO pixels do maior lado. As
+# imagens são filtradas em faixas de ALTURA_FAIXA_REFINAMENTO linhas
+REFINAMENTO_RAPIDO_PADRAO = False
+EPS_REFINAMENTO_RAPIDO = 1e-4
+RESOLUCAO_BASE_REFINAMENTO = 1024
+ALTURA_FAIXA_REFINAMENTO = 1024
+
+# Inferência em resolução reduzida: a imagem é reduzida (Image.reduce ou
+# decodificação reduzida do JPEG) para perto da resolução do modelo antes da
+# inferência. A máscara volta ao tamanho original por LANCZOS ou, com
+# AMPLIACAO_GUIADA_MASCARA, por um filtro guiado pela imagem completa
+# (raio em pixels da imagem reduzida)
+AMPLIACAO_GUIADA_MASCARA = False
+RAIO_AMPLIACAO_MASCARA = 2
+
+# Prévia ao vivo dos ajustes (recalculada em baixa resolução, com atraso
+# para agrupar os movimentos dos sliders)
+PREVIA_AO_VIVO_PADRAO = True
+ATRASO_PREVIA_MS = 150
+
+# Previews dos painéis: pixmaps em cache por (imagem, versão, tamanho) e
+# atraso para refazê-los depois que a janela para de ser redimensionada
+TAMANHO_CACHE_PREVIEWS = 8
+ATRASO_REDIMENSIONAMENTO_MS = 120
+
+# Processos usados no processamento em lote (1 = sessão única, sem pool)
+NUM_PROCESSOS_LOTE_PADRAO = 1
+NUM_PROCESSOS_LOTE_MAXIMO = os.cpu_count() or 1
+
+# Retomada do lote: um manifesto na pasta de destino registra o que já foi
+# processado, e é gravado a cada INTERVALO_GRAVACAO_MANIFESTO arquivos
+RETOMAR_LOTE_PADRAO = True
+INTERVALO_GRAVACAO_MANIFESTO = 20
+
+# Codificação dos resultados (veja app/processadores/codificador_saida.py):
+# formato 'png' (RGBA), 'webp' (com alpha) ou 'mascara' (PNG em tons de
+# cinza só com o alpha). O nível de compressão do PNG vai de 0 (rápido,
+# arquivo grande) a 9; CORES_PALETA_PADRAO > 0 quantiza o PNG numa paleta
+FORMATOS_SAIDA = ('png', 'webp', 'mascara')
+FORMATO_SAIDA_PADRAO = 'png'
+NIVEL_COMPRESSAO_PNG_PADRAO = 6
+OTIMIZAR_PNG_PADRAO = False
+WEBP_SEM_PERDAS_PADRAO = True
+QUALIDADE_WEBP_PADRAO = 90
+CORES_PALETA_PADRAO = 0
+
+# Formatos de saída oferecidos na interface (argumentos da ConfiguracaoSaida)
+OPCOES_FORMATO_SAIDA = {
+    'PNG': {'formato': 'png'},
+    'PNG com Paleta (256 cores)': {'formato': 'png', 'cores_paleta': 256},
+    'WebP sem Perdas': {'formato': 'webp'},
+    'WebP com Perdas': {'formato': 'webp', 'webp_sem_perdas': False},
+    'Máscara (PNG)': {'formato': 'mascara'},
+}
+
+# Gravação dos resultados do lote: arquivo temporário + rename, então uma
+# interrupção nunca deixa saídas truncadas. Até TAMANHO_FILA_ESCRITA gravações
+# ficam pendentes; com a fila cheia, quem produz os resultados espera. Com
+# LOTE_FSYNC_ESCRITA > 0, os arquivos são sincronizados com o disco (fsync)
+# em grupos desse tamanho antes do rename (0 = sem fsync)
+NUM_THREADS_ESCRITA = 2
+TAMANHO_FILA_ESCRITA = 8
+LOTE_FSYNC_ESCRITA = 0
+
+# Varredura das pastas do lote: com subpastas, a estrutura de pastas da
+# origem é reproduzida no destino
+INCLUIR_SUBPASTAS_PADRAO = False
+
+# Pipeline do lote com sessão única: threads de leitura e escrita e o
+# tamanho das filas entre as etapas (limita as imagens mantidas em memória)
+NUM_LEITORES_PIPELINE = 2
+NUM_ESCRITORES_PIPELINE = 2
+TAMANHO_FILA_PIPELINE = 4
+
+# Máscaras brutas mantidas em memória por (imagem, modelo), para que
+# mudanças de limiar/erosão não precisem executar o modelo novamente
+TAMANHO_CACHE_MASCARAS = 4
+
+# Imagens enviadas juntas ao modelo em uma única execução (micro-lote)
+TAMANHO_LOTE_INFERENCIA = 4
+
+# Serviço HTTP local (python -m app.processadores.servidor)
+PORTA_SERVIDOR_PADRAO = 8765
+TAMANHO_FILA_SERVIDOR = 32
+LATENCIA_MAXIMA_LOTE_MS = 25
+TAMANHO_MAXIMO_UPLOAD_MB = 64
+
+# Exibição das imagens com zoom (visualizador, recorte e borracha): só os
+# blocos visíveis são gerados, com até MAX_BLOCOS_CANVAS em cache (LRU;
+# 256 blocos de 256 px ocupam cerca de 64 MB)
+TAMANHO_BLOCO_CANVAS = 256
+MAX_BLOCOS_CANVAS = 256
+
 # Extensões de imagem suportadas
 EXTENSOES_SUPORTADAS = ('.png', '.jpg', '.jpeg', '.webp')
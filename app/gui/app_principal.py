@@ -1,16 +1,33 @@
+import os
+
+from PyQt6.QtCore import QEvent, QTimer
 from PyQt6.QtWidgets import QMainWindow, QMessageBox, QVBoxLayout, QWidget
 from PyQt6.QtGui import QIcon
 
-from app.configuracoes import (ALPHA_MATTING_PADRAO, EROSAO_MASCARA_PADRAO,
+from app.configuracoes import (ALPHA_MATTING_PADRAO, ATRASO_PREVIA_MS,
+                              ATRASO_REDIMENSIONAMENTO_MS,
+                              EROSAO_MASCARA_PADRAO,
+                              INCLUIR_SUBPASTAS_PADRAO,
                               LIMIAR_FUNDO_PADRAO, LIMIAR_OBJETO_PADRAO,
-                              MODELO_PADRAO, TITULO_APP, VERSAO)
+                              MODELO_PADRAO, NIVEL_COMPRESSAO_PNG_PADRAO,
+                              NUM_PROCESSOS_LOTE_PADRAO, OPCOES_FORMATO_SAIDA,
+                              REFINAMENTO_RAPIDO_PADRAO,
+                              TITULO_APP, VERSAO)
 from app.utils.estilos import configurar_paleta, obter_estilo_global
+from app.processadores.codificador_saida import ConfiguracaoSaida
 from app.processadores.removedor_fundo import RemoveFundo
+from app.utils.gravador_trace import GravadorTrace, nome_arquivo_trace
+from app.utils.instrumentacao import (EstatisticasDesempenho,
+                                      cancelar_inscricao, inscrever)
+from app.utils.piramide_imagem import PiramideImagem
 
 # Importação dos módulos refatorados
+from app.gui.cache_previews import CachePreviews
 from app.gui.interface_construtor import InterfaceConstrutor
 from app.gui.operacoes_imagem import OperacoesImagem
 from app.gui.operacoes_arquivo import OperacoesArquivo
+from app.gui.threads import (ConversorPreviewThread, PreviaAjustesThread,
+                             ProcessadorThread)
 
 class AplicativoRemoveFundo(QMainWindow):
     def __init__(self):
@@ -26,8 +43,10 @@ class AplicativoRemoveFundo(QMainWindow):
         # Variáveis para guardar o modelo selecionado
         self.modelo_selecionado = MODELO_PADRAO
 
-        # Objeto removedor de fundo
+        # Objeto removedor de fundo (a sessão é carregada sob demanda)
         self.removedor = RemoveFundo(self.modelo_selecionado)
+        self.carregando_modelo = False
+        self.threads_modelo = []
 
         # Widget central
         self.widget_central = QWidget()
@@ -47,17 +66,62 @@ class AplicativoRemoveFundo(QMainWindow):
         # --- Variáveis de Estado ---
         self.imagem_entrada_completa = None
         self.imagem_resultado_completa = None
+        self.piramides = []
         self.pixmap_entrada = None
         self.pixmap_resultado = None
         self.caminho_arquivo_atual = None
         self.processamento_ativo = False
 
+        # Abertura e salvamento em segundo plano (veja OperacoesArquivo)
+        self.threads_arquivo = []
+        self.thread_abertura = None
+
+        # Previews dos labels: pixmaps em cache, preparados fora da thread
+        # da interface e refeitos quando os labels mudam de tamanho
+        self.imagens_exibidas = {}
+        self.cache_previews = CachePreviews()
+        self.conversor_preview = ConversorPreviewThread(self)
+        self.conversor_preview.concluido.connect(self.exibir_preview_pronto)
+        self.conversor_preview.start()
+        self.temporizador_redimensionamento = QTimer(self)
+        self.temporizador_redimensionamento.setSingleShot(True)
+        self.temporizador_redimensionamento.setInterval(
+            ATRASO_REDIMENSIONAMENTO_MS
+        )
+        self.temporizador_redimensionamento.timeout.connect(
+            self.atualizar_previews
+        )
+        self.label_imagem_original.installEventFilter(self)
+        self.label_imagem_resultado.installEventFilter(self)
+
+        # Prévia ao vivo: os pedidos são agrupados pelo temporizador e
+        # calculados por uma thread persistente
+        self.thread_previa = PreviaAjustesThread(self.removedor, self)
+        self.thread_previa.concluido.connect(self.exibir_previa)
+        self.thread_previa.start()
+        self.temporizador_previa = QTimer(self)
+        self.temporizador_previa.setSingleShot(True)
+        self.temporizador_previa.setInterval(ATRASO_PREVIA_MS)
+        self.temporizador_previa.timeout.connect(self.atualizar_previa)
+
+        # Desempenho ao vivo dos lotes (imagens/s e tempo médio por etapa)
+        self.estatisticas_desempenho = None
+        self.gravador_trace = None
+        self.temporizador_desempenho = QTimer(self)
+        self.temporizador_desempenho.setInterval(1000)
+        self.temporizador_desempenho.timeout.connect(
+            self.atualizar_desempenho
+        )
+
         # Inicializar as configurações padrão
         self.restaurar_padroes()
 
         # Atualizar estados dos menus
         self.atualizar_estados_menu()
 
+        # Carregar o modelo padrão sem bloquear a abertura da janela
+        self.carregar_modelo(self.modelo_selecionado)
+
     def configurar_estilo(self):
         """Configura o estilo visual da aplicação"""
         # Definir paleta de cores
@@ -75,9 +139,14 @@ class AplicativoRemoveFundo(QMainWindow):
         self.acao_recorte.setEnabled(tem_imagem)
         self.acao_borracha.setEnabled(tem_imagem)
         self.botao_ver_resultado.setEnabled(tem_resultado)
+        self.acao_pasta.setEnabled(not self.carregando_modelo)
         
         # Atualizar o estado do botão principal
-        self.botao_remover_fundo.setEnabled(tem_imagem and not self.processamento_ativo)
+        self.botao_remover_fundo.setEnabled(
+            tem_imagem
+            and not self.processamento_ativo
+            and not self.carregando_modelo
+        )
 
     def mostrar_sobre(self):
         """Exibe informações sobre o aplicativo"""
@@ -99,23 +168,70 @@ class AplicativoRemoveFundo(QMainWindow):
     def ao_mudar_modelo(self, modelo_selecionado):
         """Chamado quando o usuário seleciona um novo modelo"""
         print(f'Modelo selecionado: {modelo_selecionado}')
-        try:
-            # Atualiza o modelo no removedor
-            self.modelo_selecionado = modelo_selecionado
-            self.removedor.mudar_modelo(modelo_selecionado)
+        self.modelo_selecionado = modelo_selecionado
+        self.carregar_modelo(modelo_selecionado)
+
+    def carregar_modelo(self, nome_modelo):
+        """Carrega o modelo em segundo plano, sem travar a interface"""
+        if self.removedor.modelo_carregado(nome_modelo):
+            # Modelo já está em cache: troca instantânea
+            self.removedor.mudar_modelo(nome_modelo)
+            self.carregando_modelo = False
             print('Sessão rembg atualizada.')
             # Habilita o botão de reprocessar se uma imagem estiver carregada
             self.ao_mudar_configuracoes()
-        except Exception as e:
-            QMessageBox.critical(
-                self,
-                'Erro de Modelo',
-                f"Não foi possível carregar o modelo '{modelo_selecionado}':\n{e}\n\n"
-                'Verifique se o rembg e suas dependências estão instalados corretamente '
-                'ou se o modelo é válido.',
-            )
+            return
+
+        self.carregando_modelo = True
+        self.rotulo_status.setText(f"Carregando modelo '{nome_modelo}'...")
+        self.atualizar_estados_menu()
+
+        thread = ProcessadorThread(
+            self.removedor.gerenciador_sessoes.obter_sessao, nome_modelo
+        )
+        thread.concluido.connect(
+            lambda _: self.modelo_carregado(nome_modelo)
+        )
+        thread.erro.connect(
+            lambda mensagem: self.erro_carregar_modelo(nome_modelo, mensagem)
+        )
+        thread.finished.connect(lambda: self.threads_modelo.remove(thread))
+
+        # Manter referência enquanto a thread estiver ativa
+        self.threads_modelo.append(thread)
+        thread.start()
+
+    def modelo_carregado(self, nome_modelo):
+        """Chamado quando o carregamento em segundo plano termina"""
+        if nome_modelo != self.modelo_selecionado:
+            # O usuário já escolheu outro modelo; este fica apenas em cache
+            return
+
+        self.removedor.mudar_modelo(nome_modelo)
+        self.carregando_modelo = False
+        print('Sessão rembg atualizada.')
+        self.rotulo_status.setText(f"Modelo '{nome_modelo}' carregado.")
+        self.atualizar_estados_menu()
+
+    def erro_carregar_modelo(self, nome_modelo, mensagem_erro):
+        """Chamado quando o carregamento de um modelo falha"""
+        if nome_modelo != self.modelo_selecionado:
+            return
+
+        self.carregando_modelo = False
+        QMessageBox.critical(
+            self,
+            'Erro de Modelo',
+            f"Não foi possível carregar o modelo '{nome_modelo}':\n{mensagem_erro}\n\n"
+            'Verifique se o rembg e suas dependências estão instalados corretamente '
+            'ou se o modelo é válido.',
+        )
+        self.rotulo_status.setText('Erro ao carregar modelo!')
+        if nome_modelo != MODELO_PADRAO:
+            # A troca no combo dispara o carregamento do modelo padrão
             self.combo_modelo.setCurrentText(MODELO_PADRAO)
-            self.removedor.mudar_modelo(MODELO_PADRAO)
+        else:
+            self.atualizar_estados_menu()
 
     def atualizar_rotulo_slider(self, valor, rotulo, prefixo):
         """Atualiza o texto do rótulo de um slider e habilita reprocessamento"""
@@ -126,6 +242,115 @@ class AplicativoRemoveFundo(QMainWindow):
         """Chamado quando qualquer controle de ajuste (slider, checkbox, modelo) muda"""
         if self.imagem_entrada_completa and not self.processamento_ativo:
             self.atualizar_estados_menu()
+            if self.check_previa.isChecked():
+                # Reinicia a contagem: só calcula quando o slider parar
+                self.temporizador_previa.start()
+
+    def atualizar_previa(self):
+        """Solicita uma prévia dos ajustes atuais em baixa resolução"""
+        if (
+            not self.imagem_entrada_completa
+            or self.processamento_ativo
+            or not self.check_previa.isChecked()
+        ):
+            return
+
+        # A prévia só reaproveita a máscara; sem ela seria preciso o modelo
+        if not self.removedor.mascara_em_cache(self.imagem_entrada_completa):
+            return
+
+        parametros = (
+            self.check_alpha_matting.isChecked(),
+            self.slider_limiar_objeto.value(),
+            self.slider_limiar_fundo.value(),
+            self.slider_erosao.value(),
+            self.check_refinamento_rapido.isChecked(),
+        )
+        largura = max(self.label_imagem_resultado.width(), 400)
+        altura = max(self.label_imagem_resultado.height(), 300)
+        self.thread_previa.solicitar(
+            self.imagem_entrada_completa,
+            parametros,
+            largura,
+            altura,
+            self.obter_piramide(self.imagem_entrada_completa),
+        )
+
+    def exibir_previa(self, id_pedido, imagem_previa):
+        """Exibe a prévia calculada, se ainda for a mais recente"""
+        if (
+            self.processamento_ativo
+            or self.thread_previa.pedido_obsoleto(id_pedido)
+        ):
+            return
+
+        OperacoesImagem.exibir_imagem_no_label(
+            self, self.label_imagem_resultado, imagem_previa
+        )
+        self.rotulo_status.setText(
+            'Prévia dos ajustes - clique em "Remover Fundo" para aplicar.'
+        )
+
+    def exibir_preview_pronto(self, label, imagem, versao, tamanho, buffer):
+        """Guarda o preview preparado pela thread e o exibe no label"""
+        pixmap = buffer.pixmap()
+        self.cache_previews.guardar(imagem, versao, tamanho, pixmap)
+        # O label pode ter passado a exibir outra imagem nesse meio tempo
+        if self.imagens_exibidas.get(label) is imagem:
+            label.setPixmap(pixmap)
+
+    def eventFilter(self, objeto, evento):
+        """Agenda novos previews quando os labels mudam de tamanho"""
+        if (
+            evento.type() == QEvent.Type.Resize
+            and objeto in self.imagens_exibidas
+        ):
+            self.temporizador_redimensionamento.start()
+        return super().eventFilter(objeto, evento)
+
+    def atualizar_previews(self):
+        """Refaz os previews no tamanho atual dos labels"""
+        for label, imagem in list(self.imagens_exibidas.items()):
+            OperacoesImagem.exibir_imagem_no_label(self, label, imagem)
+
+    def closeEvent(self, evento):
+        """Encerra as threads de prévia antes de fechar a janela
+
+        Uma abertura em andamento é cancelada, mas um salvamento em andamento
+        termina antes de a janela fechar.
+        """
+        self.temporizador_previa.stop()
+        self.temporizador_redimensionamento.stop()
+        self.thread_previa.parar()
+        self.conversor_preview.parar()
+        if self.thread_abertura is not None:
+            self.thread_abertura.cancelar()
+        for thread in list(self.threads_arquivo):
+            thread.wait()
+        super().closeEvent(evento)
+
+    def obter_piramide(self, imagem):
+        """Pirâmide da imagem de entrada ou do resultado atual
+
+        A pirâmide acompanha a imagem: quando o processamento, o recorte ou
+        a borracha substituem o resultado, a do resultado anterior é
+        descartada e uma nova é criada. Para outras imagens, retorna None.
+        """
+        atuais = (self.imagem_entrada_completa, self.imagem_resultado_completa)
+        if imagem is None or not any(imagem is atual for atual in atuais):
+            return None
+
+        self.piramides = [
+            piramide
+            for piramide in self.piramides
+            if any(piramide.imagem is atual for atual in atuais)
+        ]
+        for piramide in self.piramides:
+            if piramide.imagem is imagem:
+                return piramide
+        piramide = PiramideImagem(imagem)
+        self.piramides.append(piramide)
+        return piramide
 
     # Métodos delegados para módulos
     def selecionar_imagem(self):
@@ -197,7 +422,11 @@ class AplicativoRemoveFundo(QMainWindow):
         self.menu_ajuda.setEnabled(estado)
         
         # Desabilitar o botão principal durante o processamento
-        self.botao_remover_fundo.setEnabled(estado and self.imagem_entrada_completa is not None)
+        self.botao_remover_fundo.setEnabled(
+            estado
+            and self.imagem_entrada_completa is not None
+            and not self.carregando_modelo
+        )
 
         # Exibir ou ocultar a barra de progresso
         self.barra_progresso.setVisible(processando)
@@ -210,8 +439,8 @@ class AplicativoRemoveFundo(QMainWindow):
         self.imagem_resultado_completa = None
         self.caminho_arquivo_atual = None
 
-        self.label_imagem_original.clear()
-        self.label_imagem_resultado.clear()
+        OperacoesImagem.limpar_label(self, self.label_imagem_original)
+        OperacoesImagem.limpar_label(self, self.label_imagem_resultado)
 
         self.definir_interface_processando(False)
         self.rotulo_status.setText('Pronto')
@@ -224,23 +453,20 @@ class AplicativoRemoveFundo(QMainWindow):
 
     def restaurar_padroes(self):
         """Restaura as configurações para os valores padrão"""
-        # Modelo
+        # Modelo (a troca no combo dispara o carregamento em segundo plano)
         self.modelo_selecionado = MODELO_PADRAO
         self.combo_modelo.setCurrentText(MODELO_PADRAO)
 
-        try:
-            self.removedor.mudar_modelo(MODELO_PADRAO)
-            print('Sessão rembg restaurada para o padrão:', MODELO_PADRAO)
-        except Exception as e:
-            QMessageBox.critical(
-                self, 'Erro', f'Falha ao restaurar o modelo padrão:\n{e}'
-            )
-
         # Outros controles
         self.check_alpha_matting.setChecked(ALPHA_MATTING_PADRAO)
+        self.check_refinamento_rapido.setChecked(REFINAMENTO_RAPIDO_PADRAO)
         self.slider_limiar_objeto.setValue(LIMIAR_OBJETO_PADRAO)
         self.slider_limiar_fundo.setValue(LIMIAR_FUNDO_PADRAO)
         self.slider_erosao.setValue(EROSAO_MASCARA_PADRAO)
+        self.spin_processos.setValue(NUM_PROCESSOS_LOTE_PADRAO)
+        self.check_subpastas.setChecked(INCLUIR_SUBPASTAS_PADRAO)
+        self.combo_formato_saida.setCurrentIndex(0)
+        self.spin_compressao_png.setValue(NIVEL_COMPRESSAO_PNG_PADRAO)
 
         # Atualizar rótulos
         self.rotulo_limiar_objeto.setText(
@@ -261,18 +487,96 @@ class AplicativoRemoveFundo(QMainWindow):
         self.barra_progresso.setValue(int(valor_progresso * 100))
         self.rotulo_status.setText(texto_status)
 
+    def obter_configuracao_saida(self, formato=None):
+        """Monta a ConfiguracaoSaida a partir do painel de ajustes
+
+        Com `formato`, usa esse formato no lugar do escolhido no painel.
+        """
+        opcoes = dict(
+            OPCOES_FORMATO_SAIDA[self.combo_formato_saida.currentText()]
+        )
+        if formato is not None and formato != opcoes['formato']:
+            opcoes = {'formato': formato}
+        return ConfiguracaoSaida(
+            nivel_compressao=self.spin_compressao_png.value(), **opcoes
+        )
+
+    def iniciar_medicao_desempenho(self, pasta_destino, prefixo_trace):
+        """Passa a medir as etapas do lote e exibir o resumo na barra de status
+
+        Com "Gravar Trace dos Lotes" marcado, a linha do tempo do lote também
+        é gravada em `pasta_destino`.
+        """
+        self.encerrar_medicao_desempenho()
+        self.estatisticas_desempenho = EstatisticasDesempenho()
+        inscrever(self.estatisticas_desempenho)
+        if self.acao_trace.isChecked():
+            self.gravador_trace = GravadorTrace(
+                os.path.join(pasta_destino, nome_arquivo_trace(prefixo_trace))
+            )
+            inscrever(self.gravador_trace)
+        self.rotulo_desempenho.setText('')
+        self.rotulo_desempenho.setVisible(True)
+        self.temporizador_desempenho.start()
+
+    def atualizar_desempenho(self):
+        """Mostra imagens/s e o tempo médio de cada etapa"""
+        if self.estatisticas_desempenho is not None:
+            self.rotulo_desempenho.setText(
+                self.estatisticas_desempenho.texto_resumo()
+            )
+
+    def encerrar_medicao_desempenho(self):
+        """Para de medir; o rótulo mantém o último resumo
+
+        Retorna uma mensagem sobre o trace gravado (ou vazia).
+        """
+        if self.estatisticas_desempenho is None:
+            return ''
+        self.atualizar_desempenho()
+        self.temporizador_desempenho.stop()
+        cancelar_inscricao(self.estatisticas_desempenho)
+        self.estatisticas_desempenho = None
+
+        if self.gravador_trace is None:
+            return ''
+        cancelar_inscricao(self.gravador_trace)
+        gravador, self.gravador_trace = self.gravador_trace, None
+        try:
+            return f'\n\nTrace gravado em:\n{gravador.salvar()}'
+        except OSError as e:
+            print(f'Erro ao gravar o trace: {e}')
+            return f'\n\nNão foi possível gravar o trace: {e}'
+
     def finalizar_processamento_lote(self, resultado):
         """Finaliza o processamento em lote e atualiza a interface"""
+        mensagem_trace = self.encerrar_medicao_desempenho()
         self.processamento_ativo = False
         self.definir_interface_processando(False)
         self.barra_progresso.setVisible(False)
 
-        processados, total, erros, nome_modelo = resultado
+        processados, total, erros, nome_modelo, ignorados = resultado
+
+        # A pasta só é varrida durante o lote
+        if total == 0 and not ignorados:
+            QMessageBox.information(
+                self,
+                'Informação',
+                'Nenhuma imagem compatível encontrada na pasta selecionada.'
+                + mensagem_trace,
+            )
+            self.rotulo_status.setText('Nenhuma imagem encontrada.')
+            return
 
         mensagem_final = f'Processamento em lote ({nome_modelo}) concluído.\n'
         mensagem_final += (
             f'{processados}/{total} imagem(ns) processada(s) com sucesso!'
         )
+        if ignorados:
+            mensagem_final += (
+                f'\n{ignorados} imagem(ns) já processada(s) anteriormente '
+                'foram mantidas.'
+            )
 
         texto_status = f'Lote ({nome_modelo}) finalizado: {processados} sucesso(s), {len(erros)} erro(s).'
 
@@ -285,6 +589,8 @@ class AplicativoRemoveFundo(QMainWindow):
                     '\n- ... (veja o console/log para mais detalhes)'
                 )
 
+        mensagem_final += mensagem_trace
+        if erros:
             QMessageBox.warning(
                 self, 'Lote Concluído com Erros', mensagem_final
             )
@@ -304,12 +610,23 @@ class AplicativoRemoveFundo(QMainWindow):
 
     def finalizar_recorte_em_massa(self, resultado):
         """Finaliza o recorte em massa e exibe o resultado"""
+        mensagem_trace = self.encerrar_medicao_desempenho()
         self.processamento_ativo = False
         self.definir_interface_processando(False)
         self.barra_progresso.setVisible(False)
 
         processados, total, erros = resultado
 
+        if total == 0:
+            QMessageBox.information(
+                self,
+                'Informação',
+                'Nenhuma imagem compatível encontrada na pasta.'
+                + mensagem_trace,
+            )
+            self.rotulo_status.setText('Nenhuma imagem encontrada.')
+            return
+
         mensagem_final = f'Recorte em massa concluído.\n{processados}/{total} imagem(ns) processada(s) com sucesso.'
 
         if erros:
@@ -321,6 +638,8 @@ class AplicativoRemoveFundo(QMainWindow):
             if len(erros) > 5:
                 mensagem_final += '\n- ... (veja o console para mais detalhes)'
 
+        mensagem_final += mensagem_trace
+        if erros:
             QMessageBox.warning(self, 'Concluído', mensagem_final)
         else:
             QMessageBox.information(self, 'Concluído', mensagem_final)
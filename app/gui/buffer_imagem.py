@@ -0,0 +1,68 @@
+import sys
+
+import numpy as np
+from PyQt6.QtGui import QImage, QPixmap
+
+# ARGB32 guarda cada pixel como um inteiro de 32 bits na ordem nativa: na
+# memória, B, G, R, A em máquinas little-endian. Nas demais, RGBA8888 (sempre
+# R, G, B, A) evita depender da ordem, ao custo de uma conversão no Qt.
+if sys.byteorder == 'little':
+    _FORMATO = QImage.Format.Format_ARGB32_Premultiplied
+    _ORDEM_BYTES = 'BGRa'
+else:
+    _FORMATO = QImage.Format.Format_RGBA8888_Premultiplied
+    _ORDEM_BYTES = 'RGBa'
+
+
+class BufferImagem:
+    """Pixels de uma imagem no formato de exibição do Qt
+
+    Os pixels ficam num array NumPy contíguo (altura × largura × 4) já no
+    layout ARGB32 premultiplicado, o formato nativo do QPixmap: a conversão
+    a partir da imagem PIL é uma única passada do Pillow (troca de canais e
+    premultiplicação juntas), `qimage` só aponta um QImage para essa memória
+    e `QPixmap.fromImage` não precisa converter nada. O array é somente
+    leitura.
+
+    O QImage não copia nem segura os pixels; o QImage retornado guarda uma
+    referência a este buffer, que vive enquanto o objeto Python do QImage
+    existir. Cópias feitas pelo próprio Qt (como ao passar o QImage num sinal
+    entre threads) não levam essa referência: entre threads, envie o
+    BufferImagem e crie o QImage do outro lado.
+    """
+
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self.altura, self.largura = pixels.shape[:2]
+
+    @classmethod
+    def de_imagem(cls, imagem):
+        """Cria o buffer a partir de uma imagem PIL"""
+        if imagem.mode != 'RGBA':
+            imagem = imagem.convert('RGBA')
+        dados = imagem.tobytes('raw', _ORDEM_BYTES)
+        pixels = np.frombuffer(dados, dtype=np.uint8).reshape(
+            imagem.height, imagem.width, 4
+        )
+        return cls(pixels)
+
+    def qimage(self):
+        """Retorna um QImage sobre os pixels do buffer, sem cópia"""
+        q_imagem = QImage(
+            self.pixels.data,
+            self.largura,
+            self.altura,
+            self.pixels.strides[0],
+            _FORMATO,
+        )
+        q_imagem.buffer_imagem = self
+        return q_imagem
+
+    def pixmap(self):
+        """Cria um QPixmap com os pixels (só na thread da interface)"""
+        return QPixmap.fromImage(self.qimage())
+
+
+def imagem_para_qimage(imagem):
+    """Converte uma imagem PIL para QImage, sem cópias intermediárias"""
+    return BufferImagem.de_imagem(imagem).qimage()
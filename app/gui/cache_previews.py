@@ -0,0 +1,39 @@
+import weakref
+from collections import OrderedDict
+
+from app.configuracoes import TAMANHO_CACHE_PREVIEWS
+
+
+class CachePreviews:
+    """Pixmaps de preview por (imagem, versão, tamanho do label), com LRU
+
+    A imagem é identificada pela identidade do objeto, guardada por
+    referência fraca: o cache não mantém vivas imagens já substituídas, e
+    um id reaproveitado por outra imagem não devolve o pixmap errado. A versão
+    muda quando a imagem é alterada no lugar (veja PiramideImagem.versao).
+    """
+
+    def __init__(self, max_itens=TAMANHO_CACHE_PREVIEWS):
+        self.max_itens = max(1, max_itens)
+        self.itens = OrderedDict()
+
+    def buscar(self, imagem, versao, tamanho):
+        """Retorna o pixmap em cache, ou None"""
+        chave = (id(imagem), versao, tamanho)
+        item = self.itens.get(chave)
+        if item is None:
+            return None
+        referencia, pixmap = item
+        if referencia() is not imagem:
+            del self.itens[chave]
+            return None
+        self.itens.move_to_end(chave)
+        return pixmap
+
+    def guardar(self, imagem, versao, tamanho, pixmap):
+        """Guarda o pixmap, descartando os usados há mais tempo"""
+        chave = (id(imagem), versao, tamanho)
+        self.itens[chave] = (weakref.ref(imagem), pixmap)
+        self.itens.move_to_end(chave)
+        while len(self.itens) > self.max_itens:
+            self.itens.popitem(last=False)
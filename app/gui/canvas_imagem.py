@@ -0,0 +1,182 @@
+import math
+from collections import OrderedDict
+
+from PyQt6.QtCore import QPoint, QRect
+from PyQt6.QtGui import QPainter, QPixmap
+from PyQt6.QtWidgets import QWidget
+
+from app.configuracoes import MAX_BLOCOS_CANVAS, TAMANHO_BLOCO_CANVAS
+from app.gui.buffer_imagem import imagem_para_qimage
+from app.utils.piramide_imagem import PiramideImagem
+
+
+class CanvasImagem(QWidget):
+    """Exibe uma imagem com zoom, desenhando só os blocos visíveis
+
+    O widget tem o tamanho da imagem ampliada, mas essa imagem nunca é
+    criada inteira: a tela é dividida em blocos de `tamanho_bloco` pixels e
+    cada pintura gera só os blocos da área exposta (dentro de uma QScrollArea,
+    a parte visível). Os blocos ficam em cache com descarte LRU, então rolar a
+    imagem de volta não reamostra nada. A reamostragem é NEAREST, a partir do
+    nível da PiramideImagem mais próximo do zoom (abaixo de 50%, a imagem
+    reduzida por média, e não a completa).
+
+    Pontos em coordenadas da tela são convertidos com `para_imagem` e
+    `para_tela`; as subclasses desenham por cima em `paintEvent`.
+    """
+
+    def __init__(
+        self,
+        imagem,
+        parent=None,
+        piramide=None,
+        tamanho_bloco=TAMANHO_BLOCO_CANVAS,
+        max_blocos=MAX_BLOCOS_CANVAS,
+    ):
+        super().__init__(parent)
+        self.imagem = imagem
+        self.piramide = piramide or PiramideImagem(imagem)
+        self.tamanho_bloco = max(16, tamanho_bloco)
+        self.max_blocos = max(1, max_blocos)
+        # Blocos por (tamanho exibido, coluna, linha), com descarte LRU
+        self.blocos = OrderedDict()
+        self.zoom = 1.0
+        self.tamanho_exibido = (imagem.width, imagem.height)
+        self.indice_nivel = 0
+        self.definir_zoom(1.0)
+
+    def definir_imagem(self, imagem, piramide=None):
+        """Troca a imagem exibida, mantendo o zoom"""
+        self.imagem = imagem
+        self.piramide = piramide or PiramideImagem(imagem)
+        self.blocos.clear()
+        self.definir_zoom(self.zoom)
+
+    def definir_zoom(self, zoom):
+        """Ajusta o tamanho do widget ao zoom; os blocos são gerados depois"""
+        self.zoom = zoom
+        self.tamanho_exibido = (
+            max(1, int(self.imagem.width * zoom)),
+            max(1, int(self.imagem.height * zoom)),
+        )
+        # Um único nível para todos os blocos deste zoom
+        self.indice_nivel = self.piramide.indice_para_escala(max(self.escala()))
+        self.setFixedSize(*self.tamanho_exibido)
+        self.update()
+
+    def escala(self):
+        """Escala real (tela / imagem) em x e y"""
+        largura, altura = self.tamanho_exibido
+        return largura / self.imagem.width, altura / self.imagem.height
+
+    def para_imagem(self, x, y):
+        """Converte um ponto da tela para a imagem, dentro dos limites"""
+        escala_x, escala_y = self.escala()
+        return (
+            min(max(x / escala_x, 0), self.imagem.width),
+            min(max(y / escala_y, 0), self.imagem.height),
+        )
+
+    def para_tela(self, x, y):
+        """Converte um ponto da imagem para a tela"""
+        escala_x, escala_y = self.escala()
+        return QPoint(round(x * escala_x), round(y * escala_y))
+
+    def renderizar(self, u1, v1, u2, v2):
+        """Reamostra a região (u1, v1, u2, v2) da tela a partir da imagem
+
+        Usa a mesma escala da imagem ampliada inteira, então blocos vizinhos
+        se encaixam sem costuras.
+        """
+        escala_x, escala_y = self.escala()
+        regiao = self.piramide.regiao(
+            (u2 - u1, v2 - v1),
+            (u1 / escala_x, v1 / escala_y, u2 / escala_x, v2 / escala_y),
+            self.indice_nivel,
+        )
+        return imagem_para_qimage(regiao)
+
+    def obter_bloco(self, coluna, linha):
+        """Retorna o pixmap de um bloco, gerando-o se não estiver no cache"""
+        chave = (self.tamanho_exibido, coluna, linha)
+        bloco = self.blocos.get(chave)
+        if bloco is not None:
+            self.blocos.move_to_end(chave)
+            return bloco
+
+        largura, altura = self.tamanho_exibido
+        u1 = coluna * self.tamanho_bloco
+        v1 = linha * self.tamanho_bloco
+        u2 = min(largura, u1 + self.tamanho_bloco)
+        v2 = min(altura, v1 + self.tamanho_bloco)
+        if u2 <= u1 or v2 <= v1:
+            return None
+
+        bloco = QPixmap.fromImage(self.renderizar(u1, v1, u2, v2))
+        self.blocos[chave] = bloco
+        while len(self.blocos) > self.max_blocos:
+            self.blocos.popitem(last=False)
+        return bloco
+
+    def atualizar_regiao(self, caixa):
+        """Atualiza a exibição depois que a `caixa` da imagem foi alterada
+
+        Os níveis da pirâmide são refeitos na caixa, e só a parte dos blocos
+        em cache que cobre a caixa é reamostrada e pintada por cima; blocos
+        de outros zooms são descartados.
+        """
+        self.piramide.atualizar_regiao(caixa)
+        largura, altura = self.tamanho_exibido
+        escala_x, escala_y = self.escala()
+        # Um pixel do nível usado cobre vários pixels da imagem
+        x1, y1, x2, y2 = self.piramide.alinhar_caixa(caixa, self.indice_nivel)
+
+        # Pixels exibidos que amostram a caixa (com 1 px de folga)
+        u1 = max(0, math.floor(x1 * escala_x) - 1)
+        v1 = max(0, math.floor(y1 * escala_y) - 1)
+        u2 = min(largura, math.ceil(x2 * escala_x) + 1)
+        v2 = min(altura, math.ceil(y2 * escala_y) + 1)
+        if u2 <= u1 or v2 <= v1:
+            return
+
+        for chave in [c for c in self.blocos if c[0] != self.tamanho_exibido]:
+            del self.blocos[chave]
+
+        t = self.tamanho_bloco
+        for linha in range(v1 // t, (v2 - 1) // t + 1):
+            for coluna in range(u1 // t, (u2 - 1) // t + 1):
+                bloco = self.blocos.get((self.tamanho_exibido, coluna, linha))
+                if bloco is None:
+                    continue
+                # Interseção da região alterada com o bloco
+                bu1 = max(u1, coluna * t)
+                bv1 = max(v1, linha * t)
+                bu2 = min(u2, (coluna + 1) * t)
+                bv2 = min(v2, (linha + 1) * t)
+                q_imagem = self.renderizar(bu1, bv1, bu2, bv2)
+
+                pintor = QPainter(bloco)
+                # Substitui os pixels (inclusive o alfa) em vez de misturar
+                pintor.setCompositionMode(
+                    QPainter.CompositionMode.CompositionMode_Source
+                )
+                pintor.drawImage(
+                    QPoint(bu1 - coluna * t, bv1 - linha * t), q_imagem
+                )
+                pintor.end()
+
+        self.update(QRect(u1, v1, u2 - u1, v2 - v1))
+
+    def paintEvent(self, evento):
+        """Desenha os blocos que cruzam a área exposta"""
+        area = evento.rect()
+        t = self.tamanho_bloco
+        pintor = QPainter(self)
+        for linha in range(max(0, area.top()) // t, area.bottom() // t + 1):
+            for coluna in range(
+                max(0, area.left()) // t, area.right() // t + 1
+            ):
+                bloco = self.obter_bloco(coluna, linha)
+                if bloco is not None:
+                    pintor.drawPixmap(coluna * t, linha * t, bloco)
+        pintor.end()
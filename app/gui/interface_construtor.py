@@ -2,12 +2,18 @@ from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QAction, QFont, QIcon
 from PyQt6.QtWidgets import (QCheckBox, QComboBox, QFrame, QHBoxLayout, 
                              QLabel, QProgressBar, QPushButton, QScrollArea, 
-                             QSlider, QVBoxLayout, QWidget)
+                             QSizePolicy, QSlider, QSpinBox, QVBoxLayout,
+                             QWidget)
 
 from app.configuracoes import (ALPHA_MATTING_PADRAO, EROSAO_MASCARA_PADRAO,
-                               LIMIAR_FUNDO_PADRAO, LIMIAR_OBJETO_PADRAO,
+                               INCLUIR_SUBPASTAS_PADRAO, LIMIAR_FUNDO_PADRAO,
+                               LIMIAR_OBJETO_PADRAO,
                                MODELO_PADRAO, MODELOS_DISPONIVEIS, 
-                               TITULO_APP, VERSAO)
+                               NUM_PROCESSOS_LOTE_MAXIMO,
+                               NUM_PROCESSOS_LOTE_PADRAO,
+                               NIVEL_COMPRESSAO_PNG_PADRAO,
+                               OPCOES_FORMATO_SAIDA, PREVIA_AO_VIVO_PADRAO,
+                               REFINAMENTO_RAPIDO_PADRAO, TITULO_APP, VERSAO)
 from app.utils.estilos import CORES, ESTILOS_COMPONENTES
 
 
@@ -106,6 +112,13 @@ class InterfaceConstrutor:
         )
         app.menu_ferramentas.addAction(app.acao_recorte_massa)
 
+        app.menu_ferramentas.addSeparator()
+
+        # Grava a linha do tempo dos lotes na pasta de destino
+        app.acao_trace = QAction('Gravar Trace dos Lotes', app)
+        app.acao_trace.setCheckable(True)
+        app.menu_ferramentas.addAction(app.acao_trace)
+
         # Menu Ajuda
         app.menu_ajuda = app.menu_principal.addMenu('Ajuda')
 
@@ -155,6 +168,10 @@ class InterfaceConstrutor:
         app.label_imagem_original = QLabel()
         app.label_imagem_original.setAlignment(Qt.AlignmentFlag.AlignCenter)
         app.label_imagem_original.setMinimumSize(400, 300)
+        # Segue o tamanho da área, e não o do pixmap, para poder encolher
+        app.label_imagem_original.setSizePolicy(
+            QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored
+        )
         app.label_imagem_original.setStyleSheet(
             ESTILOS_COMPONENTES['label_scroll_area']
         )
@@ -204,6 +221,9 @@ class InterfaceConstrutor:
         app.label_imagem_resultado = QLabel()
         app.label_imagem_resultado.setAlignment(Qt.AlignmentFlag.AlignCenter)
         app.label_imagem_resultado.setMinimumSize(400, 300)
+        app.label_imagem_resultado.setSizePolicy(
+            QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored
+        )
         app.label_imagem_resultado.setStyleSheet(
             ESTILOS_COMPONENTES['label_scroll_area']
         )
@@ -283,6 +303,34 @@ class InterfaceConstrutor:
         app.check_alpha_matting.setStyleSheet('font-weight: bold;')
         app.layout_ajustes.addWidget(app.check_alpha_matting)
 
+        # Refinamento rápido (filtro guiado): alternativa ao alpha matting
+        app.check_refinamento_rapido = QCheckBox('Refinamento Rápido')
+        app.check_refinamento_rapido.setChecked(REFINAMENTO_RAPIDO_PADRAO)
+        app.check_refinamento_rapido.setToolTip(
+            'Refina as bordas com um filtro guiado pela imagem. Bem mais '
+            'rápido que o Alpha Matting, com bordas um pouco menos precisas.'
+        )
+        app.check_refinamento_rapido.stateChanged.connect(
+            app.ao_mudar_configuracoes
+        )
+        app.layout_ajustes.addWidget(app.check_refinamento_rapido)
+
+        # As duas formas de refinamento são exclusivas
+        app.check_alpha_matting.toggled.connect(
+            lambda marcado: marcado
+            and app.check_refinamento_rapido.setChecked(False)
+        )
+        app.check_refinamento_rapido.toggled.connect(
+            lambda marcado: marcado
+            and app.check_alpha_matting.setChecked(False)
+        )
+
+        # Prévia ao vivo dos ajustes
+        app.check_previa = QCheckBox('Prévia ao Vivo')
+        app.check_previa.setChecked(PREVIA_AO_VIVO_PADRAO)
+        app.check_previa.stateChanged.connect(app.ao_mudar_configuracoes)
+        app.layout_ajustes.addWidget(app.check_previa)
+
         app.layout_ajustes.addSpacing(10)
 
         # Limiar Objeto
@@ -364,6 +412,68 @@ class InterfaceConstrutor:
 
         app.layout_ajustes.addWidget(grupo_erosao)
 
+        # Processos usados no processamento em lote
+        grupo_processos = QWidget()
+        layout_processos = QHBoxLayout(grupo_processos)
+        layout_processos.setContentsMargins(0, 0, 0, 0)
+        layout_processos.setSpacing(5)
+
+        rotulo_processos = QLabel('Processos no Lote')
+        rotulo_processos.setStyleSheet('font-weight: bold;')
+        layout_processos.addWidget(rotulo_processos)
+
+        app.spin_processos = QSpinBox()
+        app.spin_processos.setRange(1, NUM_PROCESSOS_LOTE_MAXIMO)
+        app.spin_processos.setValue(NUM_PROCESSOS_LOTE_PADRAO)
+        layout_processos.addWidget(app.spin_processos)
+
+        app.layout_ajustes.addWidget(grupo_processos)
+
+        # Lotes e recortes em massa também nas subpastas da origem
+        app.check_subpastas = QCheckBox('Incluir Subpastas')
+        app.check_subpastas.setChecked(INCLUIR_SUBPASTAS_PADRAO)
+        app.check_subpastas.setToolTip(
+            'Processa também as imagens das subpastas, reproduzindo a '
+            'estrutura de pastas no destino.'
+        )
+        app.layout_ajustes.addWidget(app.check_subpastas)
+
+        # Codificação dos resultados do lote
+        grupo_formato = QWidget()
+        layout_formato = QHBoxLayout(grupo_formato)
+        layout_formato.setContentsMargins(0, 0, 0, 0)
+        layout_formato.setSpacing(5)
+
+        rotulo_formato = QLabel('Formato no Lote')
+        rotulo_formato.setStyleSheet('font-weight: bold;')
+        layout_formato.addWidget(rotulo_formato)
+
+        app.combo_formato_saida = QComboBox()
+        app.combo_formato_saida.addItems(OPCOES_FORMATO_SAIDA)
+        layout_formato.addWidget(app.combo_formato_saida)
+
+        app.layout_ajustes.addWidget(grupo_formato)
+
+        grupo_compressao = QWidget()
+        layout_compressao = QHBoxLayout(grupo_compressao)
+        layout_compressao.setContentsMargins(0, 0, 0, 0)
+        layout_compressao.setSpacing(5)
+
+        rotulo_compressao = QLabel('Compressão PNG')
+        rotulo_compressao.setStyleSheet('font-weight: bold;')
+        layout_compressao.addWidget(rotulo_compressao)
+
+        app.spin_compressao_png = QSpinBox()
+        app.spin_compressao_png.setRange(0, 9)
+        app.spin_compressao_png.setValue(NIVEL_COMPRESSAO_PNG_PADRAO)
+        app.spin_compressao_png.setToolTip(
+            '0 grava mais rápido com arquivos maiores; 9 gera os menores '
+            'arquivos, com gravação mais lenta.'
+        )
+        layout_compressao.addWidget(app.spin_compressao_png)
+
+        app.layout_ajustes.addWidget(grupo_compressao)
+
         app.layout_ajustes.addSpacing(20)
 
         # Botão Restaurar Padrões com estilo melhorado
@@ -387,6 +497,14 @@ class InterfaceConstrutor:
         app.rotulo_status.setStyleSheet('color: white; padding: 0 10px;')
         app.barra_status.addWidget(app.rotulo_status, 1)
 
+        # Resumo de desempenho exibido durante os lotes
+        app.rotulo_desempenho = QLabel('')
+        app.rotulo_desempenho.setStyleSheet(
+            f"color: {CORES['texto_secundario']}; padding: 0 10px;"
+        )
+        app.rotulo_desempenho.setVisible(False)
+        app.barra_status.addPermanentWidget(app.rotulo_desempenho)
+
         app.barra_progresso = QProgressBar()
         app.barra_progresso.setFixedWidth(200)
         app.barra_progresso.setFixedHeight(18)
@@ -1,9 +1,12 @@
-from PIL import Image, ImageDraw, ImageQt
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QBrush, QColor, QPainter, QPen, QPixmap
+import math
+
+from PyQt6.QtCore import QRect, Qt
+from PyQt6.QtGui import QBrush, QColor, QPainter, QPen
 from PyQt6.QtWidgets import (QDialog, QHBoxLayout, QLabel, QPushButton,
                              QScrollArea, QSlider, QVBoxLayout, QWidget)
 
+from app.gui.canvas_imagem import CanvasImagem
+from app.processadores.editor_imagem import EditorImagem
 from app.utils.estilos import estilo_janela_ferramentas
 
  
@@ -77,39 +80,26 @@ class JanelaBorracha(QDialog):
 
     def atualizar_canvas(self):
         """Atualiza a imagem exibida com o zoom atual"""
-        largura = int(self.imagem_editavel.width * self.zoom_atual)
-        altura = int(self.imagem_editavel.height * self.zoom_atual)
-
-        imagem_redimensionada = self.imagem_editavel.resize(
-            (largura, altura), Image.Resampling.NEAREST
-        )
-
-        # Converter de PIL para QPixmap
-        q_imagem = ImageQt.ImageQt(imagem_redimensionada)
-        self.pixmap = QPixmap.fromImage(q_imagem)
-
-        # Atualizar o widget de desenho
-        self.area_desenho.setPixmap(self.pixmap)
-        self.area_desenho.setFixedSize(largura, altura)
-        self.area_desenho.update()
-
-    def apagar(self, x, y):
-        """Apaga a área onde o mouse é clicado ou arrastado"""
-        x_real = int(x / self.zoom_atual)
-        y_real = int(y / self.zoom_atual)
-
-        desenho = ImageDraw.Draw(self.imagem_editavel)
-        desenho.ellipse(
-            (
-                x_real - self.tamanho_borracha,
-                y_real - self.tamanho_borracha,
-                x_real + self.tamanho_borracha,
-                y_real + self.tamanho_borracha,
-            ),
-            fill=(0, 0, 0, 0),
+        self.area_desenho.definir_zoom(self.zoom_atual)
+
+    def apagar(self, x, y, anterior=None):
+        """Apaga a área onde o mouse é clicado ou arrastado
+
+        Com `anterior` (a posição do evento anterior), apaga o traço inteiro
+        entre as duas posições.
+        """
+        if anterior is None:
+            anterior = (x, y)
+        # Mesma conversão usada para desenhar a imagem (e presa a ela)
+        inicio = tuple(map(int, self.area_desenho.para_imagem(*anterior)))
+        fim = tuple(map(int, self.area_desenho.para_imagem(x, y)))
+
+        caixa = EditorImagem.apagar_traco(
+            self.imagem_editavel, inicio, fim, self.tamanho_borracha
         )
-
-        self.atualizar_canvas()
+        if caixa is not None:
+            # Só a região do traço é redesenhada
+            self.area_desenho.atualizar_regiao(caixa)
 
     def atualizar_tamanho_borracha(self, valor):
         """Atualiza o tamanho da borracha com base no slider"""
@@ -132,28 +122,54 @@ class JanelaBorracha(QDialog):
         self.accept()
 
 
-class AreaDesenhoBorracha(QLabel):
-    def __init__(self, parent=None):
-        super().__init__(parent)
+class AreaDesenhoBorracha(CanvasImagem):
+    def __init__(self, parent):
+        super().__init__(parent.imagem_editavel, parent)
         self.setMouseTracking(True)
         self.parent = parent
         self.ultima_posicao = None
+        self.posicao_cursor = None
         self.tamanho_cursor = parent.tamanho_borracha
 
+    def retangulo_cursor(self, posicao):
+        """Área ocupada pelo cursor da borracha em uma posição"""
+        raio = math.ceil(self.tamanho_cursor * self.parent.zoom_atual) + 2
+        x, y = posicao
+        return QRect(x - raio, y - raio, raio * 2, raio * 2)
+
+    def mover_cursor(self, posicao):
+        """Redesenha só as áreas do cursor antigo e do novo"""
+        if self.posicao_cursor is not None:
+            self.update(self.retangulo_cursor(self.posicao_cursor))
+        self.posicao_cursor = posicao
+        self.update(self.retangulo_cursor(posicao))
+
     def mousePressEvent(self, evento):
         """Iniciar o apagamento"""
         pos = evento.position()
         self.ultima_posicao = (int(pos.x()), int(pos.y()))
-        self.parent.apagar(int(pos.x()), int(pos.y()))
+        self.parent.apagar(*self.ultima_posicao)
 
     def mouseMoveEvent(self, evento):
         """Continuar apagando enquanto arrasta o mouse"""
         pos = evento.position()
+        x, y = int(pos.x()), int(pos.y())
         if evento.buttons() & Qt.MouseButton.LeftButton:
-            x, y = int(pos.x()), int(pos.y())
-            self.parent.apagar(x, y)
+            # Liga ao evento anterior, para não deixar falhas no traço
+            self.parent.apagar(x, y, self.ultima_posicao)
+            self.ultima_posicao = (x, y)
+
+        self.mover_cursor((x, y))
+
+    def mouseReleaseEvent(self, evento):
+        """Encerra o traço atual"""
+        self.ultima_posicao = None
 
-        self.update()  # Atualiza o cursor
+    def leaveEvent(self, evento):
+        """Apaga o cursor ao sair da área de desenho"""
+        if self.posicao_cursor is not None:
+            self.update(self.retangulo_cursor(self.posicao_cursor))
+            self.posicao_cursor = None
 
     def wheelEvent(self, evento):
         """Propaga eventos de roda do mouse para o pai"""
@@ -1,14 +1,14 @@
-from PIL import Image, ImageQt
-from PyQt6.QtCore import QPoint, Qt
-from PyQt6.QtGui import QColor, QPainter, QPen, QPixmap
-from PyQt6.QtWidgets import (QDialog, QHBoxLayout, QLabel, QPushButton,
-                             QScrollArea, QVBoxLayout, QWidget)
+from PyQt6.QtCore import QRect, Qt
+from PyQt6.QtGui import QColor, QPainter, QPen
+from PyQt6.QtWidgets import (QDialog, QHBoxLayout, QPushButton, QScrollArea,
+                             QVBoxLayout, QWidget)
 
+from app.gui.canvas_imagem import CanvasImagem
 from app.utils.estilos import estilo_janela_ferramentas
 
 
 class JanelaRecorte(QDialog):
-    def __init__(self, parent, imagem, callback_concluido):
+    def __init__(self, parent, imagem, callback_concluido, piramide=None):
         super().__init__(parent)
         self.setWindowTitle('Ferramenta de Recorte')
         self.resize(800, 600)
@@ -18,6 +18,7 @@ class JanelaRecorte(QDialog):
         self.setStyleSheet(estilo_janela_ferramentas())
 
         self.imagem_original = imagem
+        self.piramide = piramide
         self.callback_concluido = callback_concluido
         self.inicio_x = None
         self.inicio_y = None
@@ -77,21 +78,7 @@ class JanelaRecorte(QDialog):
 
     def exibir_imagem(self):
         """Exibe a imagem no widget de desenho com o zoom atual"""
-        largura = int(self.imagem_original.width * self.zoom_atual)
-        altura = int(self.imagem_original.height * self.zoom_atual)
-
-        imagem_redimensionada = self.imagem_original.resize(
-            (largura, altura), Image.Resampling.NEAREST
-        )
-
-        # Converter de PIL para QPixmap
-        q_imagem = ImageQt.ImageQt(imagem_redimensionada)
-        self.pixmap = QPixmap.fromImage(q_imagem)
-
-        # Atualizar o widget de desenho
-        self.area_desenho.setPixmap(self.pixmap)
-        self.area_desenho.setFixedSize(largura, altura)
-        self.area_desenho.update()
+        self.area_desenho.definir_zoom(self.zoom_atual)
 
     def zoom(self, fator):
         """Aplica zoom na imagem"""
@@ -100,10 +87,8 @@ class JanelaRecorte(QDialog):
         # Limita o zoom entre 0.1x e 10x
         if 0.1 <= novo_zoom <= 10.0:
             self.zoom_atual = novo_zoom
+            # A seleção está em coordenadas da imagem e continua valendo
             self.exibir_imagem()
-            # Resetar o retângulo de seleção
-            self.area_desenho.inicio = None
-            self.area_desenho.fim = None
 
     def confirmar_recorte(self):
         """Confirma o recorte e chama o callback com a imagem recortada"""
@@ -111,23 +96,21 @@ class JanelaRecorte(QDialog):
             self.reject()
             return
 
-        # Obter coordenadas do retângulo
-        x1 = min(self.area_desenho.inicio.x(), self.area_desenho.fim.x())
-        y1 = min(self.area_desenho.inicio.y(), self.area_desenho.fim.y())
-        x2 = max(self.area_desenho.inicio.x(), self.area_desenho.fim.x())
-        y2 = max(self.area_desenho.inicio.y(), self.area_desenho.fim.y())
+        # Coordenadas do retângulo (já na imagem)
+        (x_inicio, y_inicio), (x_fim, y_fim) = (
+            self.area_desenho.inicio,
+            self.area_desenho.fim,
+        )
+        x1_real = int(min(x_inicio, x_fim))
+        y1_real = int(min(y_inicio, y_fim))
+        x2_real = int(max(x_inicio, x_fim))
+        y2_real = int(max(y_inicio, y_fim))
 
         # Verificar se a área selecionada é válida
-        if x2 - x1 <= 0 or y2 - y1 <= 0:
+        if x2_real - x1_real <= 0 or y2_real - y1_real <= 0:
             self.reject()
             return
 
-        # Converter coordenadas de acordo com o zoom
-        x1_real = int(x1 / self.zoom_atual)
-        y1_real = int(y1 / self.zoom_atual)
-        x2_real = int(x2 / self.zoom_atual)
-        y2_real = int(y2 / self.zoom_atual)
-
         # Área de recorte para processamento em lote
         caixa_recorte = (x1_real, y1_real, x2_real, y2_real)
 
@@ -142,29 +125,44 @@ class JanelaRecorte(QDialog):
         self.accept()
 
 
-class AreaDesenhoRecorte(QLabel):
-    def __init__(self, parent=None):
-        super().__init__(parent)
+class AreaDesenhoRecorte(CanvasImagem):
+    def __init__(self, parent):
+        super().__init__(
+            parent.imagem_original, parent, piramide=parent.piramide
+        )
         self.setMouseTracking(True)
+        # Cantos da seleção em coordenadas da imagem
         self.inicio = None
         self.fim = None
         self.parent = parent
 
+    def retangulo_selecao(self):
+        """Retângulo da seleção em coordenadas da tela"""
+        return QRect(
+            self.para_tela(*self.inicio), self.para_tela(*self.fim)
+        ).normalized()
+
+    def atualizar_selecao(self, anterior):
+        """Redesenha só as áreas da seleção anterior e da atual"""
+        for retangulo in (anterior, self.retangulo_selecao()):
+            if retangulo is not None:
+                self.update(retangulo.adjusted(-2, -2, 2, 2))
+
     def mousePressEvent(self, evento):
         """Inicia o desenho do retângulo"""
-        self.inicio = QPoint(
-            int(evento.position().x()), int(evento.position().y())
-        )
+        anterior = self.retangulo_selecao() if self.inicio else None
+        pos = evento.position()
+        self.inicio = self.para_imagem(pos.x(), pos.y())
         self.fim = self.inicio
-        self.update()
+        self.atualizar_selecao(anterior)
 
     def mouseMoveEvent(self, evento):
         """Atualiza o retângulo enquanto o mouse se move"""
         if evento.buttons() & Qt.MouseButton.LeftButton and self.inicio:
-            self.fim = QPoint(
-                int(evento.position().x()), int(evento.position().y())
-            )
-            self.update()
+            anterior = self.retangulo_selecao()
+            pos = evento.position()
+            self.fim = self.para_imagem(pos.x(), pos.y())
+            self.atualizar_selecao(anterior)
 
     def wheelEvent(self, evento):
         """Propaga eventos de roda do mouse para o pai"""
@@ -180,10 +178,4 @@ class AreaDesenhoRecorte(QLabel):
             caneta = QPen(QColor(255, 0, 0))
             caneta.setWidth(2)
             pintor.setPen(caneta)
-
-            x = min(self.inicio.x(), self.fim.x())
-            y = min(self.inicio.y(), self.fim.y())
-            largura = abs(self.fim.x() - self.inicio.x())
-            altura = abs(self.fim.y() - self.inicio.y())
-
-            pintor.drawRect(x, y, largura, altura)
+            pintor.drawRect(self.retangulo_selecao())
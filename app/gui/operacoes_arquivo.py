@@ -3,8 +3,9 @@ import os
 from PyQt6.QtWidgets import QFileDialog, QMessageBox
 
 from app.configuracoes import EXTENSOES_SUPORTADAS
+from app.gui.threads import (AbrirImagemThread, ProcessadorLoteThread,
+                             RecorteMassaThread, SalvarImagemThread)
 from app.utils.imagem_utils import carregar_imagem
-from app.gui.threads import ProcessadorLoteThread, RecorteMassaThread
 
 
 class OperacoesArquivo:
@@ -24,34 +25,96 @@ class OperacoesArquivo:
             app, 'Selecione a Imagem', '', tipos_arquivo
         )
 
-        if caminho_arquivo:
-            try:
-                app.rotulo_status.setText('Carregando imagem...')
+        if not caminho_arquivo:
+            return
 
-                imagem = carregar_imagem(caminho_arquivo)
-                app.imagem_entrada_completa = imagem
-                app.caminho_arquivo_atual = caminho_arquivo
-                app.imagem_resultado_completa = None
+        # Uma abertura anterior ainda em andamento perde o sentido
+        if app.thread_abertura is not None:
+            app.thread_abertura.cancelar()
+
+        # A imagem anterior sai de cena enquanto a nova é decodificada
+        from app.gui.operacoes_imagem import OperacoesImagem
+        app.imagem_entrada_completa = None
+        app.imagem_resultado_completa = None
+        app.caminho_arquivo_atual = None
+        OperacoesImagem.limpar_label(app, app.label_imagem_original)
+        OperacoesImagem.limpar_label(app, app.label_imagem_resultado)
+        app.botao_ver_original.setEnabled(False)
+        app.atualizar_estados_menu()
+        app.rotulo_status.setText(
+            f'Carregando imagem: {os.path.basename(caminho_arquivo)}...'
+        )
 
-                from app.gui.operacoes_imagem import OperacoesImagem
-                OperacoesImagem.exibir_imagem_no_label(
-                    app, app.label_imagem_original, app.imagem_entrada_completa
-                )
-                app.label_imagem_resultado.clear()
+        tamanho_rascunho = (
+            max(app.label_imagem_original.width(), 400),
+            max(app.label_imagem_original.height(), 300),
+        )
+        thread = AbrirImagemThread(caminho_arquivo, tamanho_rascunho, app)
+        thread.rascunho.connect(
+            lambda rascunho: OperacoesArquivo.exibir_rascunho(
+                app, thread, rascunho
+            )
+        )
+        thread.concluido.connect(
+            lambda imagem: OperacoesArquivo.imagem_aberta(
+                app, thread, caminho_arquivo, imagem
+            )
+        )
+        thread.erro.connect(
+            lambda mensagem: OperacoesArquivo.erro_abertura(
+                app, thread, mensagem
+            )
+        )
+        thread.finished.connect(lambda: app.threads_arquivo.remove(thread))
 
-                app.botao_ver_original.setEnabled(True)
-                app.botao_ver_resultado.setEnabled(False)
-                app.rotulo_status.setText(
-                    f'Imagem carregada: {os.path.basename(caminho_arquivo)}'
-                )
-                app.atualizar_estados_menu()
+        # Manter referência enquanto a thread estiver ativa
+        app.threads_arquivo.append(thread)
+        app.thread_abertura = thread
+        thread.start()
 
-            except Exception as e:
-                QMessageBox.critical(
-                    app, 'Erro', f'Falha ao abrir a imagem:\n{e}'
-                )
-                app.rotulo_status.setText('Erro ao carregar imagem!')
-                app.resetar_estado_interface()
+    @staticmethod
+    def exibir_rascunho(app, thread, rascunho):
+        """Mostra o rascunho reduzido enquanto a imagem completa carrega"""
+        if thread is not app.thread_abertura:
+            return
+        from app.gui.operacoes_imagem import OperacoesImagem
+        OperacoesImagem.exibir_imagem_no_label(
+            app, app.label_imagem_original, rascunho
+        )
+
+    @staticmethod
+    def imagem_aberta(app, thread, caminho_arquivo, imagem):
+        """Troca o rascunho pela imagem completa"""
+        if thread is not app.thread_abertura:
+            return
+        app.thread_abertura = None
+        app.imagem_entrada_completa = imagem
+        app.caminho_arquivo_atual = caminho_arquivo
+        app.imagem_resultado_completa = None
+
+        from app.gui.operacoes_imagem import OperacoesImagem
+        OperacoesImagem.exibir_imagem_no_label(
+            app, app.label_imagem_original, app.imagem_entrada_completa
+        )
+
+        app.botao_ver_original.setEnabled(True)
+        app.botao_ver_resultado.setEnabled(False)
+        app.rotulo_status.setText(
+            f'Imagem carregada: {os.path.basename(caminho_arquivo)}'
+        )
+        app.atualizar_estados_menu()
+
+    @staticmethod
+    def erro_abertura(app, thread, mensagem):
+        """Informa a falha ao abrir a imagem"""
+        if thread is not app.thread_abertura:
+            return
+        app.thread_abertura = None
+        QMessageBox.critical(
+            app, 'Erro', f'Falha ao abrir a imagem:\n{mensagem}'
+        )
+        app.rotulo_status.setText('Erro ao carregar imagem!')
+        app.resetar_estado_interface()
 
     @staticmethod
     def salvar_imagem(app):
@@ -76,20 +139,69 @@ class OperacoesArquivo:
         nome, _ = os.path.splitext(nome_arquivo_original)
         nome_padrao = f'{nome}_editado.png'
 
-        caminho_arquivo, _ = QFileDialog.getSaveFileName(
-            app, 'Salvar Imagem', nome_padrao, 'Arquivos PNG (*.png)'
+        caminho_arquivo, filtro = QFileDialog.getSaveFileName(
+            app,
+            'Salvar Imagem',
+            nome_padrao,
+            'Arquivos PNG (*.png);;Arquivos WebP (*.webp)',
         )
 
         if caminho_arquivo:
-            try:
-                app.rotulo_status.setText('Salvando imagem...')
-                app.imagem_resultado_completa.save(caminho_arquivo)
-                app.rotulo_status.setText('Imagem salva com sucesso!')
-            except Exception as e:
-                QMessageBox.critical(
-                    app, 'Erro', f'Falha ao salvar a imagem:\n{e}'
+            # O formato segue a extensão (ou o filtro, se não houver uma)
+            if caminho_arquivo.lower().endswith('.webp'):
+                formato = 'webp'
+            elif caminho_arquivo.lower().endswith('.png'):
+                formato = 'png'
+            else:
+                formato = 'webp' if 'webp' in filtro.lower() else 'png'
+                caminho_arquivo += f'.{formato}'
+            # Um salvamento ainda pendente no mesmo arquivo é substituído por
+            # este, para que o conteúdo antigo não termine por último
+            destino = os.path.normcase(os.path.abspath(caminho_arquivo))
+            for anterior in app.threads_arquivo:
+                if not isinstance(anterior, SalvarImagemThread):
+                    continue
+                caminho_anterior = os.path.abspath(anterior.caminho_arquivo)
+                if os.path.normcase(caminho_anterior) == destino:
+                    anterior.cancelar()
+
+            app.rotulo_status.setText('Salvando imagem...')
+            thread = SalvarImagemThread(
+                app.imagem_resultado_completa,
+                caminho_arquivo,
+                app.obter_configuracao_saida(formato),
+                app,
+            )
+            thread.concluido.connect(
+                lambda caminho: OperacoesArquivo.imagem_salva(app, caminho)
+            )
+            thread.erro.connect(
+                lambda mensagem: OperacoesArquivo.erro_salvamento(
+                    app, mensagem
                 )
-                app.rotulo_status.setText('Erro ao salvar!')
+            )
+            thread.finished.connect(
+                lambda: app.threads_arquivo.remove(thread)
+            )
+
+            # Manter referência enquanto a thread estiver ativa
+            app.threads_arquivo.append(thread)
+            thread.start()
+
+    @staticmethod
+    def imagem_salva(app, caminho_arquivo):
+        """Informa que o salvamento terminou"""
+        app.rotulo_status.setText(
+            f'Imagem salva com sucesso: {os.path.basename(caminho_arquivo)}'
+        )
+
+    @staticmethod
+    def erro_salvamento(app, mensagem):
+        """Informa a falha ao salvar a imagem"""
+        QMessageBox.critical(
+            app, 'Erro', f'Falha ao salvar a imagem:\n{mensagem}'
+        )
+        app.rotulo_status.setText('Erro ao salvar!')
 
     @staticmethod
     def processar_pasta(app):
@@ -120,23 +232,6 @@ class OperacoesArquivo:
             )
             return
 
-        # Identificar as imagens na pasta
-        imagens = [
-            f
-            for f in os.listdir(pasta_origem)
-            if os.path.isfile(os.path.join(pasta_origem, f))
-            and f.lower().endswith(tuple(EXTENSOES_SUPORTADAS))
-        ]
-
-        if not imagens:
-            QMessageBox.information(
-                app,
-                'Informação',
-                'Nenhuma imagem compatível encontrada na pasta selecionada.',
-            )
-            return
-
-        total_arquivos = len(imagens)
         nome_modelo = app.modelo_selecionado
 
         # Preparar interface para processamento
@@ -145,20 +240,25 @@ class OperacoesArquivo:
         app.barra_progresso.setVisible(True)
         app.barra_progresso.setValue(0)
         app.rotulo_status.setText(
-            f'Iniciando lote ({nome_modelo}): {total_arquivos} imagens...'
+            f'Iniciando lote ({nome_modelo}): procurando imagens...'
         )
 
-        # Criar thread do processador de lotes
+        # Criar thread do processador de lotes; a pasta é varrida pela
+        # própria thread, enquanto as primeiras imagens já são processadas
         app.thread_lote = ProcessadorLoteThread(
             app,
             pasta_origem,
             pasta_destino,
-            imagens,
+            None,
             app.modelo_selecionado,
             app.check_alpha_matting.isChecked(),
             app.slider_limiar_objeto.value(),
             app.slider_limiar_fundo.value(),
             app.slider_erosao.value(),
+            app.check_refinamento_rapido.isChecked(),
+            app.spin_processos.value(),
+            app.check_subpastas.isChecked(),
+            app.obter_configuracao_saida(),
         )
 
         # Conectar sinais
@@ -166,6 +266,7 @@ class OperacoesArquivo:
         app.thread_lote.concluido.connect(app.finalizar_processamento_lote)
 
         # Iniciar o thread
+        app.iniciar_medicao_desempenho(pasta_destino, 'trace_lote')
         app.thread_lote.start()
 
     @staticmethod
@@ -216,35 +317,23 @@ class OperacoesArquivo:
     @staticmethod
     def iniciar_recorte_em_massa(app, pasta_origem, pasta_destino, caixa_recorte):
         """Inicia o processamento de recorte em massa"""
-        imagens = [
-            f
-            for f in os.listdir(pasta_origem)
-            if os.path.isfile(os.path.join(pasta_origem, f))
-            and f.lower().endswith(tuple(EXTENSOES_SUPORTADAS))
-        ]
-
-        total_arquivos = len(imagens)
-
-        if total_arquivos == 0:
-            QMessageBox.information(
-                app,
-                'Informação',
-                'Nenhuma imagem compatível encontrada na pasta.',
-            )
-            return
-
         # Preparar interface para processamento
         app.processamento_ativo = True
         app.definir_interface_processando(True)
         app.barra_progresso.setVisible(True)
         app.barra_progresso.setValue(0)
         app.rotulo_status.setText(
-            f'Iniciando recorte em massa: {total_arquivos} imagens...'
+            'Iniciando recorte em massa: procurando imagens...'
         )
 
-        # Criar thread para processamento
+        # Criar thread para processamento (a pasta é varrida pela thread)
         app.thread_recorte = RecorteMassaThread(
-            app, pasta_origem, pasta_destino, imagens, caixa_recorte
+            app,
+            pasta_origem,
+            pasta_destino,
+            None,
+            caixa_recorte,
+            app.check_subpastas.isChecked(),
         )
 
         # Conectar sinais
@@ -252,4 +341,5 @@ class OperacoesArquivo:
         app.thread_recorte.concluido.connect(app.finalizar_recorte_em_massa)
 
         # Iniciar o thread
+        app.iniciar_medicao_desempenho(pasta_destino, 'trace_recorte')
         app.thread_recorte.start()
@@ -1,13 +1,10 @@
 import os
 
-from PIL import ImageQt
-from PyQt6.QtGui import QPixmap
 from PyQt6.QtWidgets import QMessageBox
 
 from app.gui.visualizador import VisualizadorImagem
 from app.gui.janela_recorte import JanelaRecorte
 from app.gui.janela_borracha import JanelaBorracha
-from app.utils.imagem_utils import criar_preview
 from app.gui.threads import ProcessadorThread
 
 
@@ -16,7 +13,12 @@ class OperacoesImagem:
     
     @staticmethod
     def exibir_imagem_no_label(app, label, imagem_pil):
-        """Exibe uma imagem PIL no label especificado"""
+        """Exibe uma imagem PIL no label especificado
+
+        Se a imagem já foi exibida nesse tamanho, o pixmap vem do cache;
+        senão, o preview é preparado pelo ConversorPreviewThread e exibido
+        quando ficar pronto (veja AplicativoRemoveFundo.exibir_preview_pronto).
+        """
         try:
             # Obter o tamanho disponível para exibição
             largura_disponivel = label.width()
@@ -27,19 +29,30 @@ class OperacoesImagem:
                 largura_disponivel = 400
                 altura_disponivel = 300
 
-            # Criar preview redimensionado
-            imagem_preview = criar_preview(
-                imagem_pil, largura_disponivel, altura_disponivel
-            )
+            tamanho = (largura_disponivel, altura_disponivel)
+            piramide = app.obter_piramide(imagem_pil)
+            versao = piramide.versao if piramide is not None else 0
+            app.imagens_exibidas[label] = imagem_pil
 
-            # Converter de PIL para QPixmap
-            q_imagem = ImageQt.ImageQt(imagem_preview)
-            pixmap = QPixmap.fromImage(q_imagem)
+            pixmap = app.cache_previews.buscar(imagem_pil, versao, tamanho)
+            if pixmap is not None:
+                app.conversor_preview.cancelar(label)
+                label.setPixmap(pixmap)
+                return
 
-            # Definir a imagem no label
-            label.setPixmap(pixmap)
+            # Redução e conversão para QImage fora da thread da interface
+            app.conversor_preview.solicitar(
+                label, imagem_pil, versao, tamanho, piramide
+            )
         except Exception as e:
             print(f'Erro ao exibir imagem no label: {e}')
+
+    @staticmethod
+    def limpar_label(app, label):
+        """Limpa o label e descarta o preview que estiver sendo preparado"""
+        app.imagens_exibidas.pop(label, None)
+        app.conversor_preview.cancelar(label)
+        label.clear()
     
     @staticmethod
     def processar_imagem(app):
@@ -61,13 +74,22 @@ class OperacoesImagem:
         limiar_objeto = app.slider_limiar_objeto.value()
         limiar_fundo = app.slider_limiar_fundo.value()
         tamanho_erosao = app.slider_erosao.value()
+        refinamento_rapido = app.check_refinamento_rapido.isChecked()
+
+        # A prévia em andamento perde o sentido com o resultado completo
+        app.temporizador_previa.stop()
+        app.thread_previa.cancelar()
 
         # Iniciar thread de processamento
         app.processamento_ativo = True
         app.definir_interface_processando(True)
-        app.rotulo_status.setText(
-            f"Processando com modelo '{app.modelo_selecionado}'..."
-        )
+        if app.removedor.mascara_em_cache(app.imagem_entrada_completa):
+            # Apenas os ajustes mudaram: só o recorte é refeito
+            app.rotulo_status.setText('Reaplicando ajustes...')
+        else:
+            app.rotulo_status.setText(
+                f"Processando com modelo '{app.modelo_selecionado}'..."
+            )
 
         # Criar thread de processamento
         app.thread_processamento = ProcessadorThread(
@@ -77,6 +99,7 @@ class OperacoesImagem:
             limiar_objeto,
             limiar_fundo,
             tamanho_erosao,
+            refinamento_rapido,
         )
 
         # Conectar sinais
@@ -109,7 +132,10 @@ class OperacoesImagem:
         try:
             # Criar a janela visualizadora
             visualizador = VisualizadorImagem(
-                app, imagem_para_mostrar, titulo
+                app,
+                imagem_para_mostrar,
+                titulo,
+                app.obter_piramide(imagem_para_mostrar),
             )
             visualizador.exec()
         except Exception as e:
@@ -135,7 +161,12 @@ class OperacoesImagem:
             else app.imagem_entrada_completa
         )
 
-        janela_recorte = JanelaRecorte(app, imagem_base, app.aplicar_recorte)
+        janela_recorte = JanelaRecorte(
+            app,
+            imagem_base,
+            app.aplicar_recorte,
+            app.obter_piramide(imagem_base),
+        )
         janela_recorte.exec()
     
     @staticmethod
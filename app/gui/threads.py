@@ -1,9 +1,18 @@
 import os
+import threading
 from PIL import Image
-from PyQt6.QtCore import QThread, pyqtSignal
+from PyQt6.QtCore import QMutex, QThread, QWaitCondition, pyqtSignal
 
-from app.utils.imagem_utils import carregar_imagem
+from app.gui.buffer_imagem import BufferImagem
+from app.utils.imagem_utils import (carregar_imagem, carregar_rascunho,
+                                    criar_preview)
+from app.utils.instrumentacao import iniciar_medicao
+from app.utils.varredura import VarreduraPasta
+from app.processadores.codificador_saida import ConfiguracaoSaida
 from app.processadores.editor_imagem import EditorImagem
+from app.processadores.escritor_resultados import (EscritorResultados,
+                                                   gravar_atomico)
+from app.processadores.processador_lote import ProcessadorLote
 
 
 class ProcessadorThread(QThread):
@@ -27,6 +36,272 @@ class ProcessadorThread(QThread):
             self.erro.emit(str(e))
 
 
+class AbrirImagemThread(QThread):
+    """Thread que abre uma imagem sem travar a interface
+
+    Emite primeiro um rascunho reduzido, quando o formato permite decodificar
+    em escala menor (veja carregar_rascunho), e depois a imagem completa.
+    Depois de `cancelar`, a thread termina ao fim da etapa em andamento sem
+    emitir mais nada (a decodificação do Pillow não pode ser interrompida no
+    meio).
+    """
+
+    rascunho = pyqtSignal(object)
+    concluido = pyqtSignal(object)
+    erro = pyqtSignal(str)
+
+    def __init__(self, caminho_arquivo, tamanho_rascunho, parent=None):
+        super().__init__(parent)
+        self.caminho_arquivo = caminho_arquivo
+        self.tamanho_rascunho = tamanho_rascunho
+        self.cancelada = False
+
+    def cancelar(self):
+        """Descarta o resultado da abertura"""
+        self.cancelada = True
+
+    def run(self):
+        try:
+            rascunho = carregar_rascunho(
+                self.caminho_arquivo, self.tamanho_rascunho
+            )
+        except Exception:
+            # A abertura completa informa o erro
+            rascunho = None
+        if rascunho is not None and not self.cancelada:
+            self.rascunho.emit(rascunho)
+
+        if self.cancelada:
+            return
+        try:
+            imagem = carregar_imagem(self.caminho_arquivo)
+        except Exception as e:
+            if not self.cancelada:
+                self.erro.emit(str(e))
+            return
+        if not self.cancelada:
+            self.concluido.emit(imagem)
+
+
+class SalvarImagemThread(QThread):
+    """Thread que codifica e grava uma imagem sem travar a interface
+
+    A gravação é atômica (veja gravar_atomico): mesmo interrompida, nunca
+    deixa um arquivo pela metade no destino. Depois de `cancelar`, a thread
+    para depois da codificação ou descarta o arquivo temporário antes do
+    rename, sem emitir nada; se o rename já aconteceu, o arquivo fica salvo.
+    """
+
+    concluido = pyqtSignal(str)
+    erro = pyqtSignal(str)
+
+    def __init__(self, imagem, caminho_arquivo, saida, parent=None):
+        super().__init__(parent)
+        self.imagem = imagem
+        self.caminho_arquivo = caminho_arquivo
+        self.saida = saida
+        self.cancelada = False
+
+    def cancelar(self):
+        """Desiste do salvamento, se o arquivo ainda não foi substituído"""
+        self.cancelada = True
+
+    def run(self):
+        try:
+            dados = self.saida.codificar(self.imagem)
+            if self.cancelada:
+                return
+            gravado = gravar_atomico(
+                dados, self.caminho_arquivo, cancelado=lambda: self.cancelada
+            )
+        except Exception as e:
+            if not self.cancelada:
+                self.erro.emit(str(e))
+            return
+        if gravado:
+            self.concluido.emit(self.caminho_arquivo)
+
+
+class PreviaAjustesThread(QThread):
+    """Thread persistente que recalcula a prévia dos ajustes em baixa resolução
+
+    Usa a máscara já em cache no removedor, então só o recorte é refeito.
+    Apenas o pedido mais recente é atendido: pedidos acumulados são
+    descartados e o resultado é ignorado se outro pedido chegar durante o
+    cálculo.
+    """
+
+    concluido = pyqtSignal(int, object)
+
+    def __init__(self, removedor, parent=None):
+        super().__init__(parent)
+        self.removedor = removedor
+        self.mutex = QMutex()
+        self.condicao = QWaitCondition()
+        self.pedido = None
+        self.id_pedido = 0
+        self.ativo = True
+
+    def solicitar(self, imagem, parametros, largura, altura, piramide=None):
+        """Agenda uma nova prévia, substituindo qualquer pedido pendente"""
+        self.mutex.lock()
+        self.id_pedido += 1
+        id_pedido = self.id_pedido
+        self.pedido = (
+            id_pedido, imagem, parametros, largura, altura, piramide
+        )
+        self.condicao.wakeOne()
+        self.mutex.unlock()
+        return id_pedido
+
+    def cancelar(self):
+        """Descarta o pedido pendente e invalida o que estiver em cálculo"""
+        self.mutex.lock()
+        self.id_pedido += 1
+        self.pedido = None
+        self.mutex.unlock()
+
+    def parar(self):
+        """Encerra a thread e aguarda o término"""
+        self.mutex.lock()
+        self.ativo = False
+        self.pedido = None
+        self.condicao.wakeOne()
+        self.mutex.unlock()
+        self.wait()
+
+    def pedido_obsoleto(self, id_pedido):
+        """Indica se um pedido mais novo já substituiu este"""
+        self.mutex.lock()
+        obsoleto = id_pedido != self.id_pedido
+        self.mutex.unlock()
+        return obsoleto
+
+    def run(self):
+        while True:
+            self.mutex.lock()
+            while self.ativo and self.pedido is None:
+                self.condicao.wait(self.mutex)
+            if not self.ativo:
+                self.mutex.unlock()
+                return
+            pedido = self.pedido
+            self.pedido = None
+            self.mutex.unlock()
+
+            id_pedido = pedido[0]
+            try:
+                resultado = self.calcular_previa(*pedido)
+            except Exception as e:
+                print(f'Erro ao calcular prévia: {e}')
+                continue
+
+            if resultado is not None and not self.pedido_obsoleto(id_pedido):
+                self.concluido.emit(id_pedido, resultado)
+
+    def calcular_previa(
+        self, id_pedido, imagem, parametros, largura, altura, piramide=None
+    ):
+        """Aplica os ajustes sobre uma versão reduzida da imagem"""
+        mascara = self.removedor.buscar_mascara_cache(
+            imagem, self.removedor.nome_modelo
+        )
+        if mascara is None:
+            return None
+
+        imagem_reduzida = criar_preview(imagem, largura, altura, piramide)
+        if self.pedido_obsoleto(id_pedido):
+            return None
+
+        if mascara.size != imagem_reduzida.size:
+            mascara = mascara.resize(
+                imagem_reduzida.size, Image.Resampling.BILINEAR
+            )
+
+        # A erosão é medida em pixels: acompanha a escala da prévia
+        (
+            usar_alpha_matting,
+            limiar_objeto,
+            limiar_fundo,
+            erosao,
+            refinamento_rapido,
+        ) = parametros
+        escala = imagem_reduzida.width / imagem.width
+        if erosao > 0:
+            erosao = max(1, round(erosao * escala))
+
+        return self.removedor.aplicar_mascara(
+            imagem_reduzida,
+            mascara,
+            usar_alpha_matting,
+            limiar_objeto,
+            limiar_fundo,
+            erosao,
+            refinamento_rapido,
+        )
+
+
+class ConversorPreviewThread(QThread):
+    """Thread persistente que prepara os previews dos labels
+
+    Reduz a imagem (a partir da pirâmide, se houver) e a converte para um
+    BufferImagem fora da thread da interface; o QPixmap, que só pode ser
+    criado na thread da interface, é montado por quem recebe o sinal. Só o pedido mais recente
+    de cada label é atendido.
+    """
+
+    concluido = pyqtSignal(object, object, int, object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.mutex = QMutex()
+        self.condicao = QWaitCondition()
+        self.pedidos = {}
+        self.ativo = True
+
+    def solicitar(self, label, imagem, versao, tamanho, piramide=None):
+        """Agenda o preview de um label, substituindo o pedido pendente"""
+        self.mutex.lock()
+        self.pedidos[label] = (imagem, versao, tamanho, piramide)
+        self.condicao.wakeOne()
+        self.mutex.unlock()
+
+    def cancelar(self, label):
+        """Descarta o pedido pendente de um label"""
+        self.mutex.lock()
+        self.pedidos.pop(label, None)
+        self.mutex.unlock()
+
+    def parar(self):
+        """Encerra a thread e aguarda o término"""
+        self.mutex.lock()
+        self.ativo = False
+        self.pedidos = {}
+        self.condicao.wakeOne()
+        self.mutex.unlock()
+        self.wait()
+
+    def run(self):
+        while True:
+            self.mutex.lock()
+            while self.ativo and not self.pedidos:
+                self.condicao.wait(self.mutex)
+            if not self.ativo:
+                self.mutex.unlock()
+                return
+            label, (imagem, versao, tamanho, piramide) = self.pedidos.popitem()
+            self.mutex.unlock()
+
+            try:
+                imagem_preview = criar_preview(imagem, *tamanho, piramide)
+                buffer = BufferImagem.de_imagem(imagem_preview)
+            except Exception as e:
+                print(f'Erro ao preparar preview: {e}')
+                continue
+
+            self.concluido.emit(label, imagem, versao, tamanho, buffer)
+
+
 class ProcessadorLoteThread(QThread):
     """Thread para processar imagens em lote"""
 
@@ -44,6 +319,10 @@ class ProcessadorLoteThread(QThread):
         limiar_objeto,
         limiar_fundo,
         erosao,
+        refinamento_rapido=False,
+        num_processos=1,
+        incluir_subpastas=False,
+        saida=None,
     ):
         super().__init__(parent)
         self.pasta_origem = pasta_origem
@@ -54,98 +333,155 @@ class ProcessadorLoteThread(QThread):
         self.limiar_objeto = limiar_objeto
         self.limiar_fundo = limiar_fundo
         self.erosao = erosao
+        self.refinamento_rapido = refinamento_rapido
+        self.num_processos = num_processos
+        self.incluir_subpastas = incluir_subpastas
+        self.saida = saida
         self.parent = parent
 
     def run(self):
-        removedor = self.parent.removedor
-        processados = 0
-        erros = []
-        total = len(self.arquivos)
-
-        for i, nome_arquivo in enumerate(self.arquivos):
-            caminho_entrada = os.path.join(self.pasta_origem, nome_arquivo)
-            nome_saida = f'{os.path.splitext(nome_arquivo)[0]}_{self.modelo}_sem_fundo.png'
-            caminho_saida = os.path.join(self.pasta_destino, nome_saida)
-
-            # Atualizar progresso
-            progresso = (i + 1) / total
-            status_texto = (
-                f'Lote ({self.modelo}) {i+1}/{total}: {nome_arquivo}'
-            )
-            self.progresso.emit(progresso, status_texto)
+        # O progresso de cada arquivo é repassado ao sinal da thread
+        processador = ProcessadorLote(
+            self.parent.removedor,
+            self.pasta_origem,
+            self.pasta_destino,
+            callback_progresso=self.progresso.emit,
+            num_processos=self.num_processos,
+            incluir_subpastas=self.incluir_subpastas,
+            saida=self.saida,
+        )
 
-            try:
-                # Carregar imagem e processar
-                imagem = carregar_imagem(caminho_entrada)
-                imagem_resultado = removedor.processar_imagem(
-                    imagem,
-                    self.alpha_matting,
-                    self.limiar_objeto,
-                    self.limiar_fundo,
-                    self.erosao,
-                )
-
-                # Salvar resultado
-                imagem_resultado.save(caminho_saida)
-                processados += 1
-
-            except Exception as e:
-                erro_msg = f"'{nome_arquivo}': {e}"
-                erros.append(erro_msg)
-                print(f'Erro ao processar {nome_arquivo}: {e}')
+        processados, total, erros = processador.processar(
+            self.alpha_matting,
+            self.limiar_objeto,
+            self.limiar_fundo,
+            self.erosao,
+            self.refinamento_rapido,
+            arquivos=self.arquivos,
+        )
 
         # Emitir resultado final
-        self.concluido.emit((processados, total, erros, self.modelo))
+        self.concluido.emit(
+            (
+                processados,
+                total,
+                erros,
+                self.modelo,
+                processador.arquivos_ignorados,
+            )
+        )
 
 
 class RecorteMassaThread(QThread):
-    """Thread para recortar imagens em massa"""
+    """Thread para recortar imagens em massa
+
+    Sem `arquivos`, a pasta de origem é varrida em segundo plano (veja
+    VarreduraPasta) e o recorte começa com os primeiros arquivos encontrados.
+    A gravação fica com o EscritorResultados, enquanto a thread segue para a
+    próxima imagem.
+    """
 
     progresso = pyqtSignal(float, str)
     concluido = pyqtSignal(tuple)
 
     def __init__(
-        self, parent, pasta_origem, pasta_destino, arquivos, caixa_recorte
+        self,
+        parent,
+        pasta_origem,
+        pasta_destino,
+        arquivos,
+        caixa_recorte,
+        incluir_subpastas=False,
     ):
         super().__init__(parent)
         self.pasta_origem = pasta_origem
         self.pasta_destino = pasta_destino
         self.arquivos = arquivos
         self.caixa_recorte = caixa_recorte
+        self.incluir_subpastas = incluir_subpastas
         self.parent = parent
 
     def run(self):
         processados = 0
         erros = []
-        total = len(self.arquivos)
+        trava = threading.Lock()
+        saida = ConfiguracaoSaida()
+        escritor = EscritorResultados().iniciar()
+
+        def concluir(nome_arquivo, medicao, erro):
+            nonlocal processados
+            medicao.concluir(erro)
+            with trava:
+                if erro is None:
+                    processados += 1
+                else:
+                    erros.append(f'{nome_arquivo}: {str(erro)}')
+
+        if self.arquivos is None:
+            varredura = VarreduraPasta(
+                self.pasta_origem,
+                self.incluir_subpastas,
+                ignorar=(self.pasta_destino,),
+            ).iniciar()
+            arquivos = varredura
+        else:
+            varredura = None
+            arquivos = self.arquivos
+        pastas_criadas = set()
+        i = 0
 
-        for i, nome_arquivo in enumerate(self.arquivos):
+        for i, nome_arquivo in enumerate(arquivos, 1):
+            medicao = iniciar_medicao('recorte_massa', nome_arquivo)
             try:
                 caminho_entrada = os.path.join(self.pasta_origem, nome_arquivo)
                 nome_base, ext = os.path.splitext(nome_arquivo)
+                # Subpastas da origem são reproduzidas no destino
                 caminho_saida = os.path.join(
                     self.pasta_destino, f'{nome_base}-recortado.png'
                 )
+                pasta_saida = os.path.dirname(caminho_saida)
+                if pasta_saida not in pastas_criadas:
+                    os.makedirs(pasta_saida, exist_ok=True)
+                    pastas_criadas.add(pasta_saida)
 
-                # Atualizar progresso
-                progresso = (i + 1) / total
+                # Atualizar progresso ('+' enquanto a varredura continua)
+                if varredura is None:
+                    total = len(arquivos)
+                    texto_total = str(total)
+                else:
+                    total = max(i, varredura.encontrados)
+                    texto_total = (
+                        str(total) if varredura.concluida else f'{total}+'
+                    )
+                progresso = i / total
                 texto_status = (
-                    f'Recorte em massa {i+1}/{total}: {nome_arquivo}'
+                    f'Recorte em massa {i}/{texto_total}: {nome_arquivo}'
                 )
                 self.progresso.emit(progresso, texto_status)
 
                 # Carregar e recortar a imagem
-                imagem = carregar_imagem(caminho_entrada)
-                imagem_recortada = EditorImagem.recortar_imagem(
-                    imagem, self.caixa_recorte
-                )
+                with medicao.etapa('carregar'):
+                    imagem = carregar_imagem(caminho_entrada)
+                with medicao.etapa('recortar'):
+                    imagem_recortada = EditorImagem.recortar_imagem(
+                        imagem, self.caixa_recorte
+                    )
 
-                # Salvar o resultado
-                imagem_recortada.save(caminho_saida)
-                processados += 1
+                # Codificar e agendar a gravação do resultado
+                with medicao.etapa('codificar'):
+                    dados = saida.codificar(imagem_recortada)
+                escritor.enviar(
+                    caminho_saida,
+                    dados,
+                    lambda erro, nome=nome_arquivo, medicao=medicao: concluir(
+                        nome, medicao, erro
+                    ),
+                    medicao,
+                )
 
             except Exception as e:
-                erro_msg = f'{nome_arquivo}: {str(e)}'
-                erros.append(erro_msg)
+                concluir(nome_arquivo, medicao, e)
 
-        self.concluido.emit((processados, total, erros))
+        # Espera as gravações pendentes antes de informar o resultado
+        escritor.encerrar()
+        self.concluido.emit((processados, i, erros))
@@ -1,14 +1,13 @@
-from PIL import Image, ImageQt
 from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPixmap
 from PyQt6.QtWidgets import (QDialog, QFrame, QHBoxLayout, QLabel, QPushButton,
                              QScrollArea, QVBoxLayout, QWidget)
 
+from app.gui.canvas_imagem import CanvasImagem
 from app.utils.estilos import estilo_visualizador
 
 
 class VisualizadorImagem(QDialog):
-    def __init__(self, parent, imagem, titulo):
+    def __init__(self, parent, imagem, titulo, piramide=None):
         super().__init__(parent)
         self.setWindowTitle(titulo)
         self.resize(800, 600)
@@ -29,10 +28,10 @@ class VisualizadorImagem(QDialog):
         self.scroll_area = QScrollArea()
         self.scroll_area.setWidgetResizable(True)
         self.scroll_area.setFrameShape(QFrame.Shape.NoFrame)
+        self.scroll_area.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
-        # Widget para conter a imagem
-        self.container_imagem = QLabel()
-        self.container_imagem.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        # Canvas que desenha só a parte visível da imagem
+        self.container_imagem = CanvasImagem(imagem, piramide=piramide)
         self.scroll_area.setWidget(self.container_imagem)
 
         self.layout_principal.addWidget(self.scroll_area)
@@ -75,26 +74,8 @@ class VisualizadorImagem(QDialog):
     def atualizar_canvas(self):
         """Atualiza a imagem com o zoom atual"""
         try:
-            largura = int(self.imagem_original.width * self.zoom_atual)
-            altura = int(self.imagem_original.height * self.zoom_atual)
-
-            if largura < 1 or altura < 1:
-                return
-
-            metodo_redimensionamento = Image.Resampling.NEAREST
-            if self.zoom_atual == 1.0:
-                metodo_redimensionamento = Image.Resampling.LANCZOS
-
-            imagem_redimensionada = self.imagem_original.resize(
-                (largura, altura), metodo_redimensionamento
-            )
-
-            # Converter de PIL para QPixmap
-            q_imagem = ImageQt.ImageQt(imagem_redimensionada)
-            pixmap = QPixmap.fromImage(q_imagem)
-
-            self.container_imagem.setPixmap(pixmap)
-            self.container_imagem.setFixedSize(largura, altura)
+            # Os blocos visíveis são gerados na próxima pintura
+            self.container_imagem.definir_zoom(self.zoom_atual)
 
             if hasattr(self, 'rotulo_zoom'):
                 self.rotulo_zoom.setText(f'Zoom: {self.zoom_atual:.1f}x')
@@ -0,0 +1,327 @@
+"""Processamento em lote pela linha de comando, sem interface gráfica
+
+Uso:
+    python -m app.processadores ENTRADA [ENTRADA ...] -o PASTA_DESTINO
+
+Cada ENTRADA pode ser uma pasta, um arquivo, um padrão glob ('fotos/*.jpg')
+ou '-' para ler caminhos da entrada padrão (um por linha). As entradas são
+consumidas sob demanda, e o processamento começa com os primeiros arquivos.
+No destino, cada saída reproduz o caminho da imagem relativo à sua raiz: a
+pasta informada, a parte fixa do padrão glob, a pasta de um arquivo informado
+diretamente ou, para caminhos da entrada padrão e de --lista, a pasta atual
+(fora dela, o caminho absoluto). Duas imagens que gerariam a mesma saída são
+recusadas. O progresso e o resumo final são escritos na saída padrão como
+JSON, um objeto por linha.
+
+Este módulo não importa o PyQt6.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from glob import iglob
+
+from app.configuracoes import (ALPHA_MATTING_PADRAO, CORES_PALETA_PADRAO,
+                               EROSAO_MASCARA_PADRAO, EXTENSOES_SUPORTADAS,
+                               FORMATO_SAIDA_PADRAO, FORMATOS_SAIDA,
+                               INCLUIR_SUBPASTAS_PADRAO, LIMIAR_FUNDO_PADRAO,
+                               LIMIAR_OBJETO_PADRAO, MODELO_PADRAO,
+                               MODELOS_DISPONIVEIS,
+                               NIVEL_COMPRESSAO_PNG_PADRAO,
+                               NUM_PROCESSOS_LOTE_PADRAO, OTIMIZAR_PNG_PADRAO,
+                               QUALIDADE_WEBP_PADRAO,
+                               REFINAMENTO_RAPIDO_PADRAO, RETOMAR_LOTE_PADRAO,
+                               WEBP_SEM_PERDAS_PADRAO)
+from app.processadores.codificador_saida import ConfiguracaoSaida
+from app.processadores.processador_lote import ProcessadorLote
+from app.processadores.removedor_fundo import RemoveFundo
+from app.utils.gravador_trace import GravadorTrace
+from app.utils.instrumentacao import cancelar_inscricao, inscrever
+from app.utils.varredura import varrer_imagens
+
+
+def criar_parser():
+    """Define os argumentos aceitos pela linha de comando"""
+    parser = argparse.ArgumentParser(
+        prog='python -m app.processadores',
+        description='Remove o fundo de imagens em lote, sem interface gráfica.',
+    )
+    parser.add_argument(
+        'entradas',
+        nargs='*',
+        help="pastas, arquivos, padrões glob ou '-' para ler da entrada padrão",
+    )
+    parser.add_argument(
+        '-l',
+        '--lista',
+        action='append',
+        default=[],
+        help='arquivo com um caminho de imagem por linha (pode repetir)',
+    )
+    parser.add_argument(
+        '-o', '--destino', required=True, help='pasta de destino'
+    )
+    parser.add_argument(
+        '-r',
+        '--subpastas',
+        action='store_true',
+        default=INCLUIR_SUBPASTAS_PADRAO,
+        help='inclui as subpastas das pastas informadas',
+    )
+    parser.add_argument(
+        '-m',
+        '--modelo',
+        choices=MODELOS_DISPONIVEIS,
+        default=MODELO_PADRAO,
+        help=f'modelo de IA (padrão: {MODELO_PADRAO})',
+    )
+    parser.add_argument(
+        '--alpha-matting',
+        dest='alpha_matting',
+        action='store_true',
+        default=ALPHA_MATTING_PADRAO,
+        help='ativa o alpha matting',
+    )
+    parser.add_argument(
+        '--sem-alpha-matting',
+        dest='alpha_matting',
+        action='store_false',
+        help='desativa o alpha matting',
+    )
+    parser.add_argument(
+        '--refinamento-rapido',
+        action='store_true',
+        default=REFINAMENTO_RAPIDO_PADRAO,
+        help='refina as bordas com filtro guiado em vez do alpha matting',
+    )
+    parser.add_argument(
+        '--limiar-objeto', type=int, default=LIMIAR_OBJETO_PADRAO
+    )
+    parser.add_argument(
+        '--limiar-fundo', type=int, default=LIMIAR_FUNDO_PADRAO
+    )
+    parser.add_argument('--erosao', type=int, default=EROSAO_MASCARA_PADRAO)
+    parser.add_argument(
+        '-p',
+        '--processos',
+        type=int,
+        default=NUM_PROCESSOS_LOTE_PADRAO,
+        help='número de processos trabalhadores',
+    )
+    parser.add_argument(
+        '--sem-manifesto',
+        dest='usar_manifesto',
+        action='store_false',
+        default=RETOMAR_LOTE_PADRAO,
+        help='reprocessa tudo, sem consultar nem gravar o manifesto',
+    )
+    parser.add_argument(
+        '-f',
+        '--formato',
+        choices=FORMATOS_SAIDA,
+        default=FORMATO_SAIDA_PADRAO,
+        help="formato da saída; 'mascara' grava só o alpha em tons de cinza",
+    )
+    parser.add_argument(
+        '--compressao',
+        type=int,
+        default=NIVEL_COMPRESSAO_PNG_PADRAO,
+        help='nível de compressão do PNG, de 0 (rápido) a 9 (menor)',
+    )
+    parser.add_argument(
+        '--otimizar-png',
+        action='store_true',
+        default=OTIMIZAR_PNG_PADRAO,
+        help='otimiza o PNG (mais lento, usa o nível 9)',
+    )
+    parser.add_argument(
+        '--paleta',
+        type=int,
+        metavar='CORES',
+        default=CORES_PALETA_PADRAO,
+        help='quantiza o PNG numa paleta com até CORES cores (0 desativa)',
+    )
+    parser.add_argument(
+        '--webp-com-perdas',
+        dest='webp_sem_perdas',
+        action='store_false',
+        default=WEBP_SEM_PERDAS_PADRAO,
+        help='usa WebP com perdas (o padrão é sem perdas)',
+    )
+    parser.add_argument(
+        '--qualidade',
+        type=int,
+        default=QUALIDADE_WEBP_PADRAO,
+        help='qualidade do WebP (0-100)',
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='ARQUIVO',
+        help='grava a linha do tempo das etapas (trace do Chrome/Perfetto)',
+    )
+    return parser
+
+
+def eh_imagem(caminho):
+    """Indica se o caminho é um arquivo com extensão suportada"""
+    return caminho.lower().endswith(EXTENSOES_SUPORTADAS) and os.path.isfile(
+        caminho
+    )
+
+
+def ler_linhas(arquivo):
+    """Retorna os caminhos não vazios de um arquivo de lista"""
+    for linha in arquivo:
+        linha = linha.strip()
+        if linha:
+            yield linha
+
+
+def tem_curinga(caminho):
+    """Indica se o caminho é um padrão glob"""
+    return any(caractere in caminho for caractere in '*?[')
+
+
+def caminho_relativo(caminho, raiz):
+    """Caminho do arquivo a partir da raiz da entrada, sem sair do destino
+
+    Fora da raiz, usa o caminho absoluto sem a unidade e a barra inicial.
+    """
+    try:
+        relativo = os.path.relpath(caminho, raiz)
+    except ValueError:
+        # No Windows, raiz e arquivo em unidades diferentes
+        relativo = os.pardir
+    if relativo == os.pardir or relativo.startswith(os.pardir + os.sep):
+        relativo = os.path.splitdrive(os.path.abspath(caminho))[1]
+        relativo = relativo.lstrip('\\/')
+    return relativo
+
+
+def expandir_entradas(entradas, listas, incluir_subpastas=False, ignorar=()):
+    """Transforma pastas, globs, listas e stdin em imagens, sob demanda
+
+    Gera pares (caminho, nome_relativo), em que o nome relativo é o caminho
+    a partir da raiz da entrada (veja a descrição do módulo) e define onde a
+    saída fica no destino.
+    """
+    vistos = set()
+
+    def candidatos():
+        for entrada in entradas:
+            if entrada == '-':
+                for caminho in ler_linhas(sys.stdin):
+                    yield caminho, os.curdir
+            elif os.path.isdir(entrada):
+                for nome in varrer_imagens(
+                    entrada, incluir_subpastas, ignorar=ignorar
+                ):
+                    yield os.path.join(entrada, nome), entrada
+            elif tem_curinga(entrada):
+                # A raiz é a parte do padrão antes do primeiro curinga
+                raiz = entrada
+                while tem_curinga(raiz):
+                    raiz = os.path.dirname(raiz)
+                # Ordenado, como na varredura de pastas: a ordem decide qual
+                # entrada fica com uma saída disputada
+                for caminho in sorted(iglob(entrada, recursive=True)):
+                    if eh_imagem(caminho):
+                        yield caminho, raiz or os.curdir
+            else:
+                yield entrada, os.path.dirname(entrada) or os.curdir
+
+        for caminho_lista in listas:
+            with open(caminho_lista, 'r', encoding='utf-8') as arquivo:
+                for caminho in ler_linhas(arquivo):
+                    yield caminho, os.curdir
+
+    for caminho, raiz in candidatos():
+        caminho = os.path.normpath(caminho)
+        if caminho not in vistos:
+            vistos.add(caminho)
+            yield caminho, caminho_relativo(caminho, raiz)
+
+
+def main(argumentos=None):
+    parser = criar_parser()
+    args = parser.parse_args(argumentos)
+    if not args.entradas and not args.lista:
+        parser.error('informe ao menos uma entrada ou --lista')
+
+    saida_json = sys.stdout
+
+    def emitir(evento, **dados):
+        saida_json.write(json.dumps({'evento': evento, **dados}) + '\n')
+        saida_json.flush()
+
+    def ao_progredir(progresso, status):
+        emitir('progresso', progresso=round(progresso, 4), status=status)
+
+    os.makedirs(args.destino, exist_ok=True)
+    arquivos = expandir_entradas(
+        args.entradas, args.lista, args.subpastas, ignorar=(args.destino,)
+    )
+
+    removedor = RemoveFundo(args.modelo)
+    processador = ProcessadorLote(
+        removedor,
+        '',
+        args.destino,
+        callback_progresso=ao_progredir,
+        num_processos=args.processos,
+        usar_manifesto=args.usar_manifesto,
+        incluir_subpastas=args.subpastas,
+        saida=ConfiguracaoSaida(
+            args.formato,
+            args.compressao,
+            args.otimizar_png,
+            args.webp_sem_perdas,
+            args.qualidade,
+            args.paleta,
+        ),
+    )
+
+    gravador_trace = GravadorTrace(args.trace) if args.trace else None
+    if gravador_trace is not None:
+        inscrever(gravador_trace)
+
+    # O total só é conhecido no fim: as entradas são lidas sob demanda
+    emitir('inicio', modelo=args.modelo)
+    inicio = time.perf_counter()
+
+    # Mensagens de diagnóstico vão para stderr, deixando stdout só com JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            processados, total, erros = processador.processar(
+                args.alpha_matting,
+                args.limiar_objeto,
+                args.limiar_fundo,
+                args.erosao,
+                args.refinamento_rapido,
+                arquivos=arquivos,
+            )
+        finally:
+            if gravador_trace is not None:
+                cancelar_inscricao(gravador_trace)
+                gravador_trace.salvar()
+
+    segundos = time.perf_counter() - inicio
+    emitir(
+        'resumo',
+        modelo=args.modelo,
+        processados=processados,
+        total=total,
+        ignorados=processador.arquivos_ignorados,
+        erros=erros,
+        segundos=round(segundos, 3),
+        imagens_por_segundo=round(processados / segundos, 3)
+        if segundos > 0
+        else 0.0,
+    )
+    return 1 if erros else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import io
+
+from PIL import Image
+
+from app.configuracoes import (CORES_PALETA_PADRAO, FORMATO_SAIDA_PADRAO,
+                               FORMATOS_SAIDA, NIVEL_COMPRESSAO_PNG_PADRAO,
+                               OTIMIZAR_PNG_PADRAO, QUALIDADE_WEBP_PADRAO,
+                               WEBP_SEM_PERDAS_PADRAO)
+
+
+class ConfiguracaoSaida:
+    """Define como os resultados são codificados e gravados
+
+    - 'png': recorte RGBA, com `nivel_compressao` (0-9) e `otimizar`
+      (o Pillow usa o nível 9 quando `otimizar` está ativo). Com
+      `cores_paleta`, a imagem é quantizada numa paleta com transparência.
+    - 'webp': recorte com alpha, sem perdas ou com `qualidade_webp` (0-100).
+      No modo sem perdas a qualidade controla o esforço de compressão.
+    - 'mascara': só o canal alfa, em PNG de 8 bits em tons de cinza.
+
+    Objetos simples e serializáveis: são enviados aos processos trabalhadores
+    do lote.
+    """
+
+    def __init__(
+        self,
+        formato=FORMATO_SAIDA_PADRAO,
+        nivel_compressao=NIVEL_COMPRESSAO_PNG_PADRAO,
+        otimizar=OTIMIZAR_PNG_PADRAO,
+        webp_sem_perdas=WEBP_SEM_PERDAS_PADRAO,
+        qualidade_webp=QUALIDADE_WEBP_PADRAO,
+        cores_paleta=CORES_PALETA_PADRAO,
+    ):
+        if formato not in FORMATOS_SAIDA:
+            raise ValueError(f'Formato de saída desconhecido: {formato}')
+        self.formato = formato
+        self.nivel_compressao = min(9, max(0, int(nivel_compressao)))
+        self.otimizar = bool(otimizar)
+        self.webp_sem_perdas = bool(webp_sem_perdas)
+        self.qualidade_webp = min(100, max(0, int(qualidade_webp)))
+        self.cores_paleta = min(256, max(0, int(cores_paleta)))
+
+    @property
+    def extensao(self):
+        return '.webp' if self.formato == 'webp' else '.png'
+
+    @property
+    def tipo_mime(self):
+        return 'image/webp' if self.formato == 'webp' else 'image/png'
+
+    @property
+    def sufixo(self):
+        """Sufixo do nome dos arquivos gerados no lote"""
+        return 'mascara' if self.formato == 'mascara' else 'sem_fundo'
+
+    def preparar(self, imagem):
+        """Converte o recorte RGBA para o que será gravado"""
+        if self.formato == 'mascara':
+            if 'A' in imagem.getbands():
+                return imagem.getchannel('A')
+            return imagem.convert('L')
+        if self.formato == 'png' and self.cores_paleta:
+            # FASTOCTREE é o método do Pillow que preserva o alpha
+            return imagem.quantize(
+                self.cores_paleta, method=Image.Quantize.FASTOCTREE
+            )
+        return imagem
+
+    def opcoes(self):
+        """Argumentos de `Image.save` para o formato escolhido"""
+        if self.formato == 'webp':
+            return {
+                'format': 'WEBP',
+                'lossless': self.webp_sem_perdas,
+                'quality': self.qualidade_webp,
+            }
+        return {
+            'format': 'PNG',
+            'compress_level': self.nivel_compressao,
+            'optimize': self.otimizar,
+        }
+
+    def salvar(self, imagem, destino):
+        """Codifica e grava a imagem em um caminho ou arquivo aberto"""
+        self.preparar(imagem).save(destino, **self.opcoes())
+
+    def codificar(self, imagem):
+        """Codifica a imagem e retorna os bytes"""
+        buffer = io.BytesIO()
+        self.salvar(imagem, buffer)
+        return buffer.getvalue()
+
+    def descrever(self):
+        """Descreve a configuração (usado no manifesto e no benchmark)"""
+        descricao = {'formato': self.formato}
+        if self.formato == 'webp':
+            descricao['sem_perdas'] = self.webp_sem_perdas
+            descricao['qualidade'] = self.qualidade_webp
+        else:
+            descricao['nivel_compressao'] = self.nivel_compressao
+            descricao['otimizar'] = self.otimizar
+            if self.formato == 'png' and self.cores_paleta:
+                descricao['cores_paleta'] = self.cores_paleta
+        return descricao
+
+    def eh_padrao(self):
+        """Indica se a configuração é a padrão (PNG RGBA, sem paleta)"""
+        return self.descrever() == ConfiguracaoSaida().descrever()
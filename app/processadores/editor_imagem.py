@@ -1,8 +1,9 @@
+import math
 import os
 
 from PIL import Image, ImageDraw, ImageOps
 
-from app.configuracoes import EXTENSOES_SUPORTADAS
+from app.utils.varredura import varrer_imagens
 
 
 class EditorImagem:
@@ -50,6 +51,47 @@ class EditorImagem:
 
         return imagem_copia
 
+    @staticmethod
+    def apagar_traco(imagem, inicio, fim, raio):
+        """Apaga, na própria imagem, um traço circular de `inicio` a `fim`
+
+        O traço cobre todo o segmento entre os pontos (sem falhas quando o
+        mouse se move rápido) e só a caixa envolvente é lida e alterada.
+        Retorna essa caixa (x1, y1, x2, y2), ou None se ficar fora da imagem.
+        """
+        (xa, ya), (xb, yb) = inicio, fim
+        x1 = max(0, min(xa, xb) - raio)
+        y1 = max(0, min(ya, yb) - raio)
+        x2 = min(imagem.width, max(xa, xb) + raio + 1)
+        y2 = min(imagem.height, max(ya, yb) + raio + 1)
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        # Máscara do traço, só do tamanho da caixa: círculos nas pontas
+        # ligados por um retângulo com a largura da borracha
+        mascara = Image.new('L', (x2 - x1, y2 - y1), 0)
+        desenho = ImageDraw.Draw(mascara)
+        (xa, ya), (xb, yb) = (xa - x1, ya - y1), (xb - x1, yb - y1)
+        for x, y in ((xa, ya), (xb, yb)):
+            desenho.ellipse((x - raio, y - raio, x + raio, y + raio), fill=255)
+        distancia = math.hypot(xb - xa, yb - ya)
+        if distancia:
+            # Meio pixel a mais para acompanhar a largura das elipses
+            nx = (ya - yb) / distancia * (raio + 0.5)
+            ny = (xb - xa) / distancia * (raio + 0.5)
+            desenho.polygon(
+                [
+                    (xa + nx, ya + ny),
+                    (xb + nx, yb + ny),
+                    (xb - nx, yb - ny),
+                    (xa - nx, ya - ny),
+                ],
+                fill=255,
+            )
+
+        imagem.paste((0, 0, 0, 0), (x1, y1, x2, y2), mascara)
+        return x1, y1, x2, y2
+
     @staticmethod
     def recortar_em_massa(pasta_origem, pasta_destino, caixa_recorte):
         """Aplica o mesmo recorte a várias imagens em uma pasta"""
@@ -60,13 +102,9 @@ class EditorImagem:
         erros = []
 
         try:
-            todos_arquivos = os.listdir(pasta_origem)
-            imagens = [
-                f
-                for f in todos_arquivos
-                if os.path.isfile(os.path.join(pasta_origem, f))
-                and f.lower().endswith(EXTENSOES_SUPORTADAS)
-            ]
+            imagens = list(
+                varrer_imagens(pasta_origem, ignorar=(pasta_destino,))
+            )
 
             for nome_arquivo in imagens:
                 caminho_entrada = os.path.join(pasta_origem, nome_arquivo)
@@ -0,0 +1,203 @@
+import os
+import queue
+import threading
+import time
+
+from app.configuracoes import (LOTE_FSYNC_ESCRITA, NUM_THREADS_ESCRITA,
+                               TAMANHO_FILA_ESCRITA)
+from app.utils.instrumentacao import MEDICAO_NULA
+
+# Marcador de fim enviado pela fila
+_FIM = object()
+
+
+def caminho_temporario(caminho):
+    """Arquivo temporário na mesma pasta do destino (o rename é atômico)"""
+    pasta, nome = os.path.split(caminho)
+    return os.path.join(
+        pasta, f'.{nome}.{os.getpid()}-{threading.get_ident()}.tmp'
+    )
+
+
+def remover_temporario(caminho):
+    """Remove um arquivo temporário, ignorando se ele não existir"""
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+def sincronizar_pastas(pastas):
+    """Grava no disco as entradas de diretório (os renames), fora do Windows"""
+    if os.name == 'nt':
+        return
+    for pasta in pastas:
+        descritor = os.open(pasta or '.', os.O_RDONLY)
+        try:
+            os.fsync(descritor)
+        finally:
+            os.close(descritor)
+
+
+def gravar_atomico(dados, caminho, sincronizar=False, cancelado=None):
+    """Grava os bytes em `caminho` via arquivo temporário + rename
+
+    Quem lê o destino vê o arquivo anterior ou o novo completo, nunca um
+    arquivo truncado. Com `sincronizar`, os dados vão para o disco (fsync)
+    antes do rename. Se `cancelado()` for verdadeiro logo antes do rename, o
+    temporário é descartado e o destino fica intacto; retorna False nesse
+    caso e True quando o arquivo foi gravado.
+    """
+    temporario = caminho_temporario(caminho)
+    try:
+        with open(temporario, 'wb') as arquivo:
+            arquivo.write(dados)
+            if sincronizar:
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+        if cancelado is not None and cancelado():
+            remover_temporario(temporario)
+            return False
+        os.replace(temporario, caminho)
+    except BaseException:
+        remover_temporario(temporario)
+        raise
+    if sincronizar:
+        sincronizar_pastas([os.path.dirname(caminho)])
+    return True
+
+
+class EscritorResultados:
+    """Grava resultados já codificados em segundo plano
+
+    `enviar` entrega os bytes a threads de gravação por uma fila limitada:
+    com a fila cheia, quem envia espera, então um disco lento segura a
+    produção em vez de acumular resultados na memória. Cada arquivo é gravado
+    de forma atômica (veja `gravar_atomico`) e `ao_concluir(erro)` é chamado
+    depois do rename, com `erro=None` em caso de sucesso.
+
+    Com `lote_fsync` > 0, cada thread mantém até esse número de arquivos
+    temporários abertos e faz o fsync do grupo de uma vez, antes dos renames;
+    o grupo também é gravado quando a fila esvazia.
+    """
+
+    def __init__(
+        self,
+        num_threads=NUM_THREADS_ESCRITA,
+        tamanho_fila=TAMANHO_FILA_ESCRITA,
+        lote_fsync=LOTE_FSYNC_ESCRITA,
+    ):
+        self.num_threads = max(1, num_threads)
+        self.lote_fsync = max(0, lote_fsync)
+        self.fila = queue.Queue(maxsize=max(1, tamanho_fila))
+        self.threads = []
+
+    def iniciar(self):
+        """Inicia as threads de gravação e retorna o próprio escritor"""
+        self.threads = [
+            threading.Thread(target=self.executar, daemon=True)
+            for _ in range(self.num_threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def enviar(self, caminho, dados, ao_concluir=None, medicao=MEDICAO_NULA):
+        """Agenda a gravação; espera se houver muitas gravações pendentes"""
+        self.fila.put((caminho, dados, ao_concluir, medicao))
+
+    def encerrar(self):
+        """Espera as gravações pendentes e encerra as threads"""
+        for _ in self.threads:
+            self.fila.put(_FIM)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def executar(self):
+        pendentes = []
+        while True:
+            if pendentes:
+                try:
+                    item = self.fila.get_nowait()
+                except queue.Empty:
+                    # Fila vazia: não segura o grupo esperando mais arquivos
+                    self.concluir_grupo(pendentes)
+                    pendentes = []
+                    continue
+            else:
+                item = self.fila.get()
+            if item is _FIM:
+                break
+
+            caminho, dados, ao_concluir, medicao = item
+            temporario = caminho_temporario(caminho)
+            try:
+                with medicao.etapa('gravar'):
+                    arquivo = open(temporario, 'wb')
+                    try:
+                        arquivo.write(dados)
+                        arquivo.flush()
+                    except BaseException:
+                        arquivo.close()
+                        raise
+                    if not self.lote_fsync:
+                        arquivo.close()
+                        os.replace(temporario, caminho)
+            except Exception as e:
+                remover_temporario(temporario)
+                self.notificar(ao_concluir, e)
+                continue
+
+            if not self.lote_fsync:
+                self.notificar(ao_concluir, None)
+                continue
+
+            pendentes.append(
+                (caminho, temporario, arquivo, ao_concluir, medicao)
+            )
+            if len(pendentes) >= self.lote_fsync:
+                self.concluir_grupo(pendentes)
+                pendentes = []
+
+        if pendentes:
+            self.concluir_grupo(pendentes)
+
+    def concluir_grupo(self, pendentes):
+        """Sincroniza os temporários do grupo, renomeia e avisa cada arquivo"""
+        inicio = time.perf_counter()
+        erros = {}
+        renomeados = []
+        for caminho, temporario, arquivo, _, _ in pendentes:
+            try:
+                try:
+                    os.fsync(arquivo.fileno())
+                finally:
+                    arquivo.close()
+                os.replace(temporario, caminho)
+                renomeados.append(caminho)
+            except Exception as e:
+                remover_temporario(temporario)
+                erros[caminho] = e
+
+        try:
+            sincronizar_pastas({os.path.dirname(c) for c in renomeados})
+        except OSError as e:
+            print(f'Erro ao sincronizar pastas de saída: {e}')
+        duracao = time.perf_counter() - inicio
+
+        for caminho, _, _, ao_concluir, medicao in pendentes:
+            # O fsync é feito uma vez para o grupo inteiro
+            medicao.registrar('sincronizar', inicio, duracao, len(pendentes))
+            self.notificar(ao_concluir, erros.get(caminho))
+
+    @staticmethod
+    def notificar(ao_concluir, erro):
+        if ao_concluir is None:
+            if erro is not None:
+                print(f'Erro ao gravar resultado: {erro}')
+            return
+        try:
+            ao_concluir(erro)
+        except Exception as e:
+            print(f'Erro ao concluir gravação: {e}')
@@ -0,0 +1,104 @@
+import os
+import threading
+from collections import OrderedDict
+
+from rembg import new_session
+
+from app.configuracoes import LIMITE_MEMORIA_SESSOES_MB
+
+# Estimativa usada quando o arquivo do modelo ainda não está no disco
+TAMANHO_MODELO_ESTIMADO_MB = 180
+
+
+class GerenciadorSessoes:
+    """Mantém sessões rembg carregadas por modelo, com descarte LRU
+
+    As sessões ficam em memória até que o total estimado ultrapasse o limite
+    configurado; nesse caso as menos usadas recentemente são descartadas.
+    """
+
+    def __init__(self, limite_memoria_mb=LIMITE_MEMORIA_SESSOES_MB):
+        self.limite_memoria_mb = limite_memoria_mb
+        self.sessoes = OrderedDict()
+        self.trava = threading.Lock()
+        # Uma trava por modelo evita carregar o mesmo modelo duas vezes
+        self.travas_carregamento = {}
+
+    def obter_sessao(self, nome_modelo):
+        """Retorna a sessão do modelo, carregando-a se necessário"""
+        with self.trava:
+            if nome_modelo in self.sessoes:
+                self.sessoes.move_to_end(nome_modelo)
+                return self.sessoes[nome_modelo][0]
+            trava_modelo = self.travas_carregamento.setdefault(
+                nome_modelo, threading.Lock()
+            )
+
+        with trava_modelo:
+            # Outra thread pode ter carregado o modelo enquanto esperávamos
+            with self.trava:
+                if nome_modelo in self.sessoes:
+                    self.sessoes.move_to_end(nome_modelo)
+                    return self.sessoes[nome_modelo][0]
+
+            sessao = new_session(nome_modelo)
+            tamanho_mb = self.estimar_tamanho_mb(nome_modelo)
+
+            with self.trava:
+                self.sessoes[nome_modelo] = (sessao, tamanho_mb)
+                self.sessoes.move_to_end(nome_modelo)
+                self.descartar_excedentes()
+            return sessao
+
+    def esta_carregado(self, nome_modelo):
+        """Indica se o modelo já está em memória (troca instantânea)"""
+        with self.trava:
+            return nome_modelo in self.sessoes
+
+    def descartar(self, nome_modelo):
+        """Remove a sessão de um modelo da memória"""
+        with self.trava:
+            self.sessoes.pop(nome_modelo, None)
+
+    def uso_memoria_mb(self):
+        """Retorna a memória total estimada das sessões carregadas"""
+        with self.trava:
+            return sum(tamanho for _, tamanho in self.sessoes.values())
+
+    def descartar_excedentes(self):
+        """Descarta as sessões menos usadas até respeitar o limite
+
+        Deve ser chamado com a trava adquirida. A sessão mais recente nunca
+        é descartada, mesmo que sozinha ultrapasse o limite.
+        """
+        total = sum(tamanho for _, tamanho in self.sessoes.values())
+        while total > self.limite_memoria_mb and len(self.sessoes) > 1:
+            nome_modelo, (_, tamanho) = self.sessoes.popitem(last=False)
+            total -= tamanho
+            print(f'Sessão descartada da memória: {nome_modelo}')
+
+    @staticmethod
+    def estimar_tamanho_mb(nome_modelo):
+        """Estima a memória de uma sessão pelo tamanho do arquivo .onnx"""
+        pasta_modelos = os.getenv(
+            'U2NET_HOME',
+            os.path.join(os.path.expanduser('~'), '.u2net'),
+        )
+        caminho_modelo = os.path.join(pasta_modelos, f'{nome_modelo}.onnx')
+        try:
+            return os.path.getsize(caminho_modelo) / (1024 * 1024)
+        except OSError:
+            return TAMANHO_MODELO_ESTIMADO_MB
+
+
+_gerenciador_padrao = None
+_trava_gerenciador_padrao = threading.Lock()
+
+
+def obter_gerenciador_padrao():
+    """Retorna o gerenciador de sessões compartilhado pelo processo"""
+    global _gerenciador_padrao
+    with _trava_gerenciador_padrao:
+        if _gerenciador_padrao is None:
+            _gerenciador_padrao = GerenciadorSessoes()
+        return _gerenciador_padrao
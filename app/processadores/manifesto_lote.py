@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+
+from app.configuracoes import INTERVALO_GRAVACAO_MANIFESTO
+
+NOME_ARQUIVO_MANIFESTO = '.removebg_manifesto.json'
+VERSAO_MANIFESTO = 1
+
+
+class ManifestoLote:
+    """Registro dos arquivos já processados em uma pasta de destino
+
+    Para cada arquivo de origem guarda tamanho, data de modificação, hash do
+    conteúdo, o arquivo de saída e a configuração usada (modelo e ajustes).
+    Uma nova execução pula as saídas que continuam válidas. O manifesto é
+    gravado de forma atômica a cada `intervalo_gravacao` arquivos, e uma
+    entrada só é registrada depois que a saída foi gravada por completo,
+    com os dados da origem capturados antes do processamento (veja
+    `descrever_origem`).
+    """
+
+    def __init__(
+        self, pasta_destino, intervalo_gravacao=INTERVALO_GRAVACAO_MANIFESTO
+    ):
+        self.caminho = os.path.join(pasta_destino, NOME_ARQUIVO_MANIFESTO)
+        self.intervalo_gravacao = max(1, intervalo_gravacao)
+        self.trava = threading.Lock()
+        self.alteracoes_pendentes = 0
+        self.entradas = self.carregar()
+
+    def carregar(self):
+        """Lê o manifesto existente, ignorando arquivos inválidos"""
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as arquivo:
+                dados = json.load(arquivo)
+            if dados.get('versao') == VERSAO_MANIFESTO:
+                return dados.get('arquivos', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f'Manifesto ignorado ({self.caminho}): {e}')
+        return {}
+
+    def salvar(self):
+        """Grava o manifesto de forma atômica (arquivo temporário + rename)"""
+        with self.trava:
+            dados = {
+                'versao': VERSAO_MANIFESTO,
+                'arquivos': dict(self.entradas),
+            }
+            self.alteracoes_pendentes = 0
+
+        caminho_temporario = f'{self.caminho}.tmp'
+        with open(caminho_temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(dados, arquivo, ensure_ascii=False)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(caminho_temporario, self.caminho)
+
+    @staticmethod
+    def calcular_hash(caminho_arquivo):
+        """Calcula o SHA-256 do conteúdo do arquivo"""
+        resumo = hashlib.sha256()
+        with open(caminho_arquivo, 'rb') as arquivo:
+            for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+                resumo.update(bloco)
+        return resumo.hexdigest()
+
+    @staticmethod
+    def criar_configuracao(nome_modelo, parametros, saida=None):
+        """Descreve o modelo, os ajustes e a codificação da saída"""
+        (
+            usar_alpha_matting,
+            limiar_objeto,
+            limiar_fundo,
+            erosao,
+            refinamento_rapido,
+        ) = parametros
+        configuracao = {
+            'modelo': nome_modelo,
+            'alpha_matting': bool(usar_alpha_matting),
+            'limiar_objeto': limiar_objeto,
+            'limiar_fundo': limiar_fundo,
+            'erosao': erosao,
+        }
+        # Só registrado quando ativo, para manter válidos os manifestos
+        # gravados antes desta opção existir
+        if refinamento_rapido:
+            configuracao['refinamento_rapido'] = True
+        if saida is not None and not saida.eh_padrao():
+            configuracao['saida'] = saida.descrever()
+        return configuracao
+
+    def esta_valido(self, chave, caminho_entrada, caminho_saida, configuracao):
+        """Indica se a saída registrada ainda corresponde à entrada atual"""
+        with self.trava:
+            entrada = self.entradas.get(chave)
+        if entrada is None or entrada.get('configuracao') != configuracao:
+            return False
+
+        try:
+            if os.path.getsize(caminho_saida) != entrada['tamanho_saida']:
+                return False
+            estado = os.stat(caminho_entrada)
+        except OSError:
+            return False
+
+        if estado.st_size != entrada['tamanho']:
+            return False
+        if estado.st_mtime_ns == entrada['mtime_ns']:
+            return True
+
+        # Só a data mudou: confere o conteúdo antes de reprocessar
+        try:
+            if self.calcular_hash(caminho_entrada) != entrada['hash']:
+                return False
+        except OSError:
+            return False
+
+        with self.trava:
+            entrada['mtime_ns'] = estado.st_mtime_ns
+            self.alteracoes_pendentes += 1
+        return True
+
+    @classmethod
+    def descrever_origem(cls, caminho_entrada):
+        """Captura tamanho, data e hash da origem antes de processá-la
+
+        O stat vem antes do hash: se o arquivo mudar durante o processamento,
+        a data registrada fica diferente da atual e a próxima execução
+        confere o hash, que não corresponde mais ao conteúdo, e reprocessa.
+        """
+        estado = os.stat(caminho_entrada)
+        return {
+            'origem': os.path.abspath(caminho_entrada),
+            'tamanho': estado.st_size,
+            'mtime_ns': estado.st_mtime_ns,
+            'hash': cls.calcular_hash(caminho_entrada),
+        }
+
+    def registrar(self, chave, origem, caminho_saida, configuracao):
+        """Registra uma saída gravada com sucesso
+
+        `origem` é a descrição capturada com `descrever_origem` antes de o
+        arquivo ser processado.
+        """
+        entrada = {
+            **origem,
+            'saida': os.path.basename(caminho_saida),
+            'tamanho_saida': os.path.getsize(caminho_saida),
+            'configuracao': configuracao,
+        }
+
+        with self.trava:
+            self.entradas[chave] = entrada
+            self.alteracoes_pendentes += 1
+            gravar = self.alteracoes_pendentes >= self.intervalo_gravacao
+
+        if gravar:
+            self.salvar()
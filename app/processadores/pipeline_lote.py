@@ -0,0 +1,303 @@
+import queue
+import threading
+import time
+from functools import partial
+
+from app.configuracoes import (NUM_ESCRITORES_PIPELINE, NUM_LEITORES_PIPELINE,
+                               TAMANHO_FILA_PIPELINE, TAMANHO_LOTE_INFERENCIA)
+from app.processadores.codificador_saida import ConfiguracaoSaida
+from app.processadores.escritor_resultados import EscritorResultados
+from app.utils.imagem_utils import (carregar_imagem,
+                                    carregar_imagem_reduzida)
+from app.utils.instrumentacao import iniciar_medicao
+
+# Marcador de fim de etapa enviado pelas filas
+_FIM = object()
+
+
+class PipelineLote:
+    """Processa imagens em etapas encadeadas: leitura, inferência e escrita
+
+    Threads de leitura decodificam as próximas imagens enquanto o modelo
+    trabalha, e threads de escrita fazem o matting e codificam os resultados
+    (conforme a ConfiguracaoSaida), que são gravados de forma atômica pelo
+    EscritorResultados. As filas entre as etapas são limitadas, então a
+    memória usada fica restrita a poucas imagens por etapa, e um disco lento
+    segura as etapas anteriores. A vazão se aproxima da etapa mais lenta, e
+    não da soma delas.
+
+    A leitura já entrega a imagem reduzida para perto da resolução do modelo
+    (em JPEG, decodificada direto em escala reduzida), e a inferência agrupa
+    até `tamanho_lote` dessas imagens em uma única chamada ao modelo (veja
+    RemoveFundo.obter_mascaras_lote). A imagem completa só é usada no fim,
+    na escrita, quando a máscara é ampliada e aplicada.
+
+    Cada arquivo leva sua medição (app.utils.instrumentacao) pelas filas,
+    com as etapas 'carregar', 'inferencia', 'ampliar', 'matting',
+    'codificar' e 'gravar' ('sincronizar' com fsync).
+    """
+
+    def __init__(
+        self,
+        removedor_fundo,
+        num_leitores=NUM_LEITORES_PIPELINE,
+        num_escritores=NUM_ESCRITORES_PIPELINE,
+        tamanho_fila=TAMANHO_FILA_PIPELINE,
+        tamanho_lote=TAMANHO_LOTE_INFERENCIA,
+        saida=None,
+    ):
+        self.removedor_fundo = removedor_fundo
+        self.saida = saida or ConfiguracaoSaida()
+        self.num_leitores = max(1, num_leitores)
+        self.num_escritores = max(1, num_escritores)
+        self.tamanho_lote = max(1, tamanho_lote)
+        # A fila precisa comportar um micro-lote inteiro
+        self.tamanho_fila = max(1, tamanho_fila, self.tamanho_lote)
+
+    @staticmethod
+    def carregar(caminho_entrada, tamanho_entrada):
+        """Carrega a imagem para a inferência
+
+        Retorna (imagem_reduzida, imagem_completa); a imagem completa é None
+        quando o arquivo foi decodificado direto em escala reduzida.
+        """
+        if tamanho_entrada is None:
+            imagem = carregar_imagem(caminho_entrada, converter_rgba=False)
+            return imagem, imagem
+        return carregar_imagem_reduzida(caminho_entrada, tamanho_entrada)
+
+    def inferir(self, itens):
+        """Executa o modelo sobre um micro-lote de itens carregados
+
+        Retorna os itens no formato da fila de resultados, com a máscara na
+        resolução da imagem reduzida. Se a inferência em lote falhar, cada
+        imagem é processada individualmente para que o erro fique restrito
+        ao arquivo que o causou.
+        """
+        validos = [item for item in itens if item[3] is None]
+        inicio = time.perf_counter()
+        try:
+            # Imagens do lote não entram no cache de máscaras da interface
+            mascaras = self.removedor_fundo.obter_mascaras_lote(
+                [imagem_reduzida for _, imagem_reduzida, _, _, _ in validos],
+                usar_cache=False,
+            )
+        except Exception:
+            mascaras = [None] * len(validos)
+        duracao = time.perf_counter() - inicio
+        mascaras_por_item = {
+            id(item): mascara for item, mascara in zip(validos, mascaras)
+        }
+
+        resultados = []
+        for item in itens:
+            tarefa, imagem_reduzida, imagem_completa, erro, medicao = item
+            mascara = None
+            if erro is None:
+                try:
+                    mascara = mascaras_por_item[id(item)]
+                    if mascara is None:
+                        with medicao.etapa('inferencia'):
+                            mascara = self.removedor_fundo.obter_mascara(
+                                imagem_reduzida, usar_cache=False
+                            )
+                    else:
+                        # A inferência foi feita uma vez para o micro-lote
+                        medicao.registrar(
+                            'inferencia', inicio, duracao, len(validos)
+                        )
+                except Exception as e:
+                    erro = e
+            resultados.append(
+                (
+                    tarefa,
+                    imagem_reduzida,
+                    imagem_completa,
+                    mascara,
+                    erro,
+                    medicao,
+                )
+            )
+        return resultados
+
+    def finalizar(self, item, parametros):
+        """Amplia a máscara, aplica na imagem completa e codifica o resultado
+
+        Retorna os bytes da saída.
+        """
+        (
+            (_, caminho_entrada, _),
+            imagem_reduzida,
+            imagem_completa,
+            mascara,
+            _,
+            medicao,
+        ) = item
+        if imagem_completa is None:
+            with medicao.etapa('carregar'):
+                imagem_completa = carregar_imagem(
+                    caminho_entrada, converter_rgba=False
+                )
+        with medicao.etapa('ampliar'):
+            mascara = self.removedor_fundo.ampliar_mascara(
+                imagem_completa, imagem_reduzida, mascara
+            )
+        with medicao.etapa('matting'):
+            imagem_resultado = self.removedor_fundo.aplicar_mascara(
+                imagem_completa, mascara, *parametros
+            )
+        with medicao.etapa('codificar'):
+            return self.saida.codificar(imagem_resultado)
+
+    def executar(self, nomes_arquivos, preparar, parametros, ao_concluir):
+        """Executa o pipeline sobre os arquivos
+
+        `preparar(nome_arquivo)` retorna (caminho_entrada, caminho_saida) e
+        é chamado na leitura de cada arquivo. `ao_concluir(nome_arquivo,
+        erro)` é chamado uma vez por arquivo, depois que a saída foi gravada,
+        com `erro=None` em caso de sucesso (erros ao preparar, ler ou gravar
+        também chegam por ele); as chamadas são serializadas, então o
+        callback não precisa ser thread-safe. Um erro do próprio iterável de
+        nomes encerra a leitura e é relançado depois que os arquivos já lidos
+        terminam.
+        """
+        iterador = iter(nomes_arquivos)
+        trava_tarefas = threading.Lock()
+        trava_conclusao = threading.Lock()
+        erros_iteracao = []
+        # Sinaliza aos leitores que a inferência parou (ex.: Ctrl-C)
+        interrompido = threading.Event()
+        fila_carregadas = queue.Queue(maxsize=self.tamanho_fila)
+        fila_resultados = queue.Queue(maxsize=self.tamanho_fila)
+        # O modelo não muda durante o lote
+        tamanho_entrada = self.removedor_fundo.tamanho_entrada()
+
+        escritor = EscritorResultados().iniciar()
+
+        def concluir(nome_arquivo, medicao, erro):
+            medicao.concluir(erro)
+            with trava_conclusao:
+                # Uma falha do callback não pode derrubar a etapa de escrita
+                try:
+                    ao_concluir(nome_arquivo, erro)
+                except Exception as e:
+                    print(f'Erro ao concluir {nome_arquivo}: {e}')
+
+        def etapa_leitura():
+            try:
+                while not interrompido.is_set():
+                    with trava_tarefas:
+                        if erros_iteracao:
+                            break
+                        try:
+                            nome_arquivo = next(iterador, None)
+                        except Exception as e:
+                            erros_iteracao.append(e)
+                            break
+                    if nome_arquivo is None:
+                        break
+
+                    medicao = iniciar_medicao('lote', nome_arquivo)
+                    tarefa = (nome_arquivo, None, None)
+                    try:
+                        tarefa = (nome_arquivo, *preparar(nome_arquivo))
+                        _, caminho_entrada, _ = tarefa
+                        with medicao.etapa('carregar'):
+                            imagem_reduzida, imagem_completa = self.carregar(
+                                caminho_entrada, tamanho_entrada
+                            )
+                        fila_carregadas.put(
+                            (
+                                tarefa,
+                                imagem_reduzida,
+                                imagem_completa,
+                                None,
+                                medicao,
+                            )
+                        )
+                    except Exception as e:
+                        fila_carregadas.put((tarefa, None, None, e, medicao))
+            finally:
+                fila_carregadas.put(_FIM)
+
+        def etapa_escrita():
+            # Só termina ao receber _FIM: a thread da inferência espera por
+            # espaço na fila de resultados
+            while True:
+                item = fila_resultados.get()
+                if item is _FIM:
+                    break
+
+                (nome_arquivo, _, caminho_saida), _, _, _, erro, medicao = item
+                if erro is None:
+                    try:
+                        dados = self.finalizar(item, parametros)
+                    except Exception as e:
+                        erro = e
+                if erro is not None:
+                    concluir(nome_arquivo, medicao, erro)
+                    continue
+
+                # Espera aqui se houver muitas gravações pendentes
+                try:
+                    escritor.enviar(
+                        caminho_saida,
+                        dados,
+                        partial(concluir, nome_arquivo, medicao),
+                        medicao,
+                    )
+                except Exception as e:
+                    concluir(nome_arquivo, medicao, e)
+
+        leitores = [
+            threading.Thread(target=etapa_leitura, daemon=True)
+            for _ in range(self.num_leitores)
+        ]
+        escritores = [
+            threading.Thread(target=etapa_escrita, daemon=True)
+            for _ in range(self.num_escritores)
+        ]
+        for thread in leitores + escritores:
+            thread.start()
+
+        # A inferência roda na thread chamadora, usando a sessão atual
+        leitores_ativos = self.num_leitores
+        try:
+            while leitores_ativos:
+                item = fila_carregadas.get()
+                if item is _FIM:
+                    leitores_ativos -= 1
+                    continue
+
+                # Completa o micro-lote com o que já estiver carregado,
+                # sem esperar por imagens que ainda estão sendo lidas
+                itens = [item]
+                while len(itens) < self.tamanho_lote:
+                    try:
+                        proximo = fila_carregadas.get_nowait()
+                    except queue.Empty:
+                        break
+                    if proximo is _FIM:
+                        leitores_ativos -= 1
+                        if not leitores_ativos:
+                            break
+                        continue
+                    itens.append(proximo)
+
+                for resultado in self.inferir(itens):
+                    fila_resultados.put(resultado)
+        finally:
+            # Se a inferência parou antes do fim, os leitores podem estar
+            # presos na fila cheia: esvazia a fila até todos enviarem _FIM
+            interrompido.set()
+            while leitores_ativos:
+                if fila_carregadas.get() is _FIM:
+                    leitores_ativos -= 1
+            for _ in escritores:
+                fila_resultados.put(_FIM)
+            for thread in leitores + escritores:
+                thread.join()
+            escritor.encerrar()
+
+        if erros_iteracao:
+            raise erros_iteracao[0]
@@ -1,7 +1,59 @@
+import multiprocessing
 import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import chain, islice
 
-from app.configuracoes import EXTENSOES_SUPORTADAS
+from app.configuracoes import (INCLUIR_SUBPASTAS_PADRAO, LOTE_FSYNC_ESCRITA,
+                               NUM_PROCESSOS_LOTE_PADRAO, RETOMAR_LOTE_PADRAO)
+from app.processadores.codificador_saida import ConfiguracaoSaida
+from app.processadores.escritor_resultados import gravar_atomico
+from app.processadores.manifesto_lote import ManifestoLote
+from app.processadores.pipeline_lote import PipelineLote
+from app.processadores.removedor_fundo import RemoveFundo
 from app.utils.imagem_utils import carregar_imagem
+from app.utils.instrumentacao import (MedicaoArquivo, ha_inscritos,
+                                      iniciar_medicao, publicar)
+from app.utils.varredura import VarreduraPasta, varrer_imagens
+
+# Removedor de cada processo trabalhador, criado uma única vez
+_removedor_trabalhador = None
+
+
+def _inicializar_trabalhador(nome_modelo, threads_por_processo):
+    """Cria a sessão do processo trabalhador e a mantém aquecida"""
+    global _removedor_trabalhador
+    # Evita que cada processo use todos os núcleos na inferência
+    os.environ['OMP_NUM_THREADS'] = str(threads_por_processo)
+    _removedor_trabalhador = RemoveFundo(nome_modelo)
+    _removedor_trabalhador.sessao
+
+
+def _processar_arquivo_trabalhador(
+    caminho_entrada, caminho_saida, parametros, saida, medir=False
+):
+    """Processa um arquivo no processo trabalhador (recebe apenas caminhos)
+
+    Retorna (evento, erro). Com `medir`, o evento de medição vai para o
+    processo pai publicar, já que os inscritos da instrumentação vivem apenas
+    no processo pai; numa falha, ele leva as etapas medidas até o erro.
+    """
+    medicao = MedicaoArquivo('lote', None)
+    erro = None
+    try:
+        with medicao.etapa('carregar'):
+            imagem = carregar_imagem(caminho_entrada, converter_rgba=False)
+        imagem_resultado = _removedor_trabalhador.processar_imagem(
+            imagem, *parametros, medicao=medicao, usar_cache=False
+        )
+        with medicao.etapa('codificar'):
+            dados = saida.codificar(imagem_resultado)
+        # Cada processo grava o próprio arquivo, também de forma atômica
+        with medicao.etapa('gravar'):
+            gravar_atomico(dados, caminho_saida, LOTE_FSYNC_ESCRITA > 0)
+    except Exception as e:
+        erro = e
+    return (medicao.criar_evento(erro) if medir else None), erro
 
 
 class ProcessadorLote:
@@ -11,28 +63,196 @@ class ProcessadorLote:
         pasta_origem,
         pasta_destino,
         callback_progresso=None,
+        num_processos=NUM_PROCESSOS_LOTE_PADRAO,
+        usar_manifesto=RETOMAR_LOTE_PADRAO,
+        incluir_subpastas=INCLUIR_SUBPASTAS_PADRAO,
+        saida=None,
     ):
         self.removedor_fundo = removedor_fundo
         self.pasta_origem = pasta_origem
         self.pasta_destino = pasta_destino
         self.callback_progresso = callback_progresso
+        self.num_processos = max(1, num_processos)
+        self.usar_manifesto = usar_manifesto
+        self.incluir_subpastas = incluir_subpastas
+        # Codificação dos resultados (PNG padrão quando não informada)
+        self.saida = saida or ConfiguracaoSaida()
+        self.manifesto = None
+        self.configuracao = None
+        self.varredura = None
+        self.pastas_criadas = set()
+        # Origem de cada arquivo em andamento, capturada antes da leitura
+        self.origens = {}
+        # Nome relativo da saída dos arquivos informados como pares
+        self.nomes_saida = {}
+        # Arquivo de entrada que reservou cada saída, para recusar repetidas
+        self.saidas_reservadas = {}
+        self.trava_saidas = threading.Lock()
+        self.total_listado = 0
+        self.listagem_concluida = False
         self.arquivos_processados = 0
+        self.arquivos_ignorados = 0
         self.arquivos_com_erro = []
+        self.arquivos_concluidos = 0
+        self.total_arquivos = 0
 
     def listar_imagens(self):
-        """Lista todos os arquivos de imagem na pasta de origem"""
-        try:
-            todos_arquivos = os.listdir(self.pasta_origem)
-            imagens = [
-                f
-                for f in todos_arquivos
-                if os.path.isfile(os.path.join(self.pasta_origem, f))
-                and f.lower().endswith(EXTENSOES_SUPORTADAS)
-            ]
-            return imagens
-        except Exception as e:
-            print(f'Erro ao listar arquivos: {e}')
-            return []
+        """Lista todos os arquivos de imagem na pasta de origem
+
+        Com `incluir_subpastas`, os nomes são relativos à pasta de origem.
+        """
+        return list(
+            varrer_imagens(
+                self.pasta_origem,
+                self.incluir_subpastas,
+                ignorar=(self.pasta_destino,),
+            )
+        )
+
+    def obter_caminhos(self, nome_arquivo):
+        """Retorna os caminhos de entrada e saída de um arquivo
+
+        A subpasta do arquivo (relativa à origem, ou o nome relativo informado
+        no par, veja `processar`) é reproduzida no destino.
+        """
+        caminho_entrada = os.path.join(self.pasta_origem, nome_arquivo)
+        nome_relativo = self.nomes_saida.get(nome_arquivo)
+        if nome_relativo is None:
+            if self.pasta_origem:
+                nome_relativo = nome_arquivo
+            else:
+                nome_relativo = os.path.basename(nome_arquivo)
+        nome_base, _ = os.path.splitext(os.path.basename(nome_relativo))
+        nome_saida = (
+            f'{nome_base}_{self.removedor_fundo.nome_modelo}_'
+            f'{self.saida.sufixo}{self.saida.extensao}'
+        )
+        caminho_saida = os.path.join(
+            self.pasta_destino, os.path.dirname(nome_relativo), nome_saida
+        )
+        return caminho_entrada, caminho_saida
+
+    def reservar_saida(self, nome_arquivo, caminho_saida):
+        """Reserva a saída para o arquivo; falha se outro já a gera
+
+        Evita que entradas diferentes com o mesmo nome de saída (como
+        'foto.png' e 'foto.jpg') se sobrescrevam.
+        """
+        chave = os.path.normcase(os.path.abspath(caminho_saida))
+        with self.trava_saidas:
+            dono = self.saidas_reservadas.setdefault(chave, nome_arquivo)
+        if dono != nome_arquivo:
+            raise FileExistsError(
+                f'a saída {caminho_saida} já é gerada a partir de {dono}'
+            )
+
+    def preparar_tarefa(self, nome_arquivo):
+        """Retorna os caminhos do arquivo, criando a subpasta de saída
+
+        Com o manifesto ativo, também captura tamanho, data e hash da origem
+        (veja ManifestoLote.descrever_origem) antes de o arquivo ser lido;
+        eles são registrados quando a saída terminar de ser gravada.
+        """
+        caminho_entrada, caminho_saida = self.obter_caminhos(nome_arquivo)
+        self.reservar_saida(nome_arquivo, caminho_saida)
+        pasta_saida = os.path.dirname(caminho_saida)
+        if pasta_saida not in self.pastas_criadas:
+            os.makedirs(pasta_saida, exist_ok=True)
+            self.pastas_criadas.add(pasta_saida)
+        if self.manifesto is not None:
+            self.origens[nome_arquivo] = ManifestoLote.descrever_origem(
+                caminho_entrada
+            )
+        return caminho_entrada, caminho_saida
+
+    def listar_arquivos(self, arquivos):
+        """Consome sob demanda os arquivos informados, contando-os"""
+        for item in arquivos:
+            if isinstance(item, tuple):
+                nome_arquivo, nome_relativo = item
+                self.nomes_saida[nome_arquivo] = nome_relativo
+            else:
+                nome_arquivo = item
+            self.total_listado += 1
+            yield nome_arquivo
+        self.listagem_concluida = True
+
+    def total_estimado(self):
+        """Total de arquivos do lote, refinado enquanto a varredura avança"""
+        if self.varredura is not None:
+            encontrados = self.varredura.encontrados
+            self.listagem_concluida = self.varredura.concluida
+        else:
+            encontrados = self.total_listado
+        self.total_arquivos = max(
+            self.arquivos_concluidos, encontrados - self.arquivos_ignorados
+        )
+        return self.total_arquivos
+
+    def notificar_progresso(self, concluidos, nome_arquivo):
+        """Repassa o progresso ao callback, se houver"""
+        if self.callback_progresso:
+            total = self.total_estimado()
+            progresso = concluidos / max(total, 1)
+            # '+' indica que a varredura da pasta ainda não terminou
+            if not self.listagem_concluida:
+                total = f'{total}+'
+            status = f'Lote ({self.removedor_fundo.nome_modelo}) {concluidos}/{total}: {nome_arquivo}'
+            self.callback_progresso(progresso, status)
+
+    def registrar_erro(self, nome_arquivo, erro):
+        """Registra a falha de um arquivo na lista de erros"""
+        erro_msg = f"'{nome_arquivo}': {erro}"
+        self.arquivos_com_erro.append(erro_msg)
+        print(f'Erro ao processar {nome_arquivo}: {erro}')
+
+    def registrar_conclusao(self, nome_arquivo, erro):
+        """Contabiliza um arquivo terminado (com ou sem erro)"""
+        self.arquivos_concluidos += 1
+        origem = self.origens.pop(nome_arquivo, None)
+        self.notificar_progresso(self.arquivos_concluidos, nome_arquivo)
+
+        if erro is not None:
+            self.nomes_saida.pop(nome_arquivo, None)
+            self.registrar_erro(nome_arquivo, erro)
+            return
+
+        self.arquivos_processados += 1
+        if self.manifesto is not None and origem is not None:
+            _, caminho_saida = self.obter_caminhos(nome_arquivo)
+            try:
+                self.manifesto.registrar(
+                    nome_arquivo,
+                    origem,
+                    caminho_saida,
+                    self.configuracao,
+                )
+            except OSError as e:
+                print(f'Erro ao registrar {nome_arquivo} no manifesto: {e}')
+        self.nomes_saida.pop(nome_arquivo, None)
+
+    def filtrar_pendentes(self, imagens):
+        """Reserva as saídas na ordem da listagem e pula as que são válidas
+
+        Reservar aqui, e não na leitura em paralelo, faz a primeira entrada
+        listada sempre ficar com uma saída disputada. Sem manifesto, nenhum
+        arquivo é pulado.
+        """
+        for nome_arquivo in imagens:
+            caminho_entrada, caminho_saida = self.obter_caminhos(nome_arquivo)
+            try:
+                self.reservar_saida(nome_arquivo, caminho_saida)
+            except FileExistsError:
+                # A falha é informada quando a tarefa for preparada
+                yield nome_arquivo
+                continue
+            if self.manifesto is not None and self.manifesto.esta_valido(
+                nome_arquivo, caminho_entrada, caminho_saida, self.configuracao
+            ):
+                self.arquivos_ignorados += 1
+                self.nomes_saida.pop(nome_arquivo, None)
+            else:
+                yield nome_arquivo
 
     def processar(
         self,
@@ -40,56 +260,175 @@ class ProcessadorLote:
         limiar_objeto=250,
         limiar_fundo=10,
         tamanho_erosao=5,
+        refinamento_rapido=False,
+        arquivos=None,
     ):
-        """Processa todas as imagens da pasta de origem"""
-        imagens = self.listar_imagens()
+        """Processa todas as imagens da pasta de origem
+
+        Se `arquivos` for informado, processa apenas esses nomes (relativos à
+        pasta de origem) em vez de varrer a pasta; podem ser um gerador,
+        consumido sob demanda. Um item também pode ser um par (caminho,
+        nome_relativo): o arquivo é lido de `caminho` e a saída reproduz
+        `nome_relativo` no destino. Arquivos que gerariam uma saída já
+        gerada por outro falham com FileExistsError. A varredura roda em
+        segundo plano (veja VarreduraPasta): o processamento começa com os
+        primeiros arquivos encontrados e o total é refinado durante o lote.
+        Com o manifesto ativo, arquivos já processados com a mesma
+        configuração são pulados e contados em `arquivos_ignorados`.
+        """
         self.arquivos_processados = 0
+        self.arquivos_ignorados = 0
         self.arquivos_com_erro = []
-        total_arquivos = len(imagens)
+        self.arquivos_concluidos = 0
+        self.origens = {}
+        self.nomes_saida = {}
+        self.saidas_reservadas = {}
+        self.total_listado = 0
+        self.listagem_concluida = False
+        if arquivos is None:
+            self.varredura = VarreduraPasta(
+                self.pasta_origem,
+                self.incluir_subpastas,
+                ignorar=(self.pasta_destino,),
+            ).iniciar()
+            imagens = iter(self.varredura)
+        else:
+            self.varredura = None
+            imagens = self.listar_arquivos(arquivos)
 
-        if total_arquivos == 0:
+        # Espera só os dois primeiros arquivos para decidir como processar
+        # (com um único processo, o primeiro basta)
+        primeiros = list(islice(imagens, 2 if self.num_processos > 1 else 1))
+        if not primeiros:
+            self.total_arquivos = 0
             return 0, 0, []
+        imagens = chain(primeiros, imagens)
 
-        for i, nome_arquivo in enumerate(imagens):
-            caminho_entrada = os.path.join(self.pasta_origem, nome_arquivo)
-            nome_base, _ = os.path.splitext(nome_arquivo)
-            nome_saida = (
-                f'{nome_base}_{self.removedor_fundo.nome_modelo}_sem_fundo.png'
-            )
-            caminho_saida = os.path.join(self.pasta_destino, nome_saida)
-
-            # Atualiza o progresso
-            if self.callback_progresso:
-                progresso = (i + 1) / total_arquivos
-                status = f'Lote ({self.removedor_fundo.nome_modelo}) {i+1}/{total_arquivos}: {nome_arquivo}'
-                self.callback_progresso(progresso, status)
-
-            try:
-                # Carrega a imagem
-                imagem = carregar_imagem(caminho_entrada)
-
-                # Processa a remoção de fundo
-                bytes_resultado = self.removedor_fundo.obter_bytes_processados(
-                    imagem,
-                    usar_alpha_matting,
-                    limiar_objeto,
-                    limiar_fundo,
-                    tamanho_erosao,
-                )
-
-                # Salva o resultado
-                with open(caminho_saida, 'wb') as f_out:
-                    f_out.write(bytes_resultado)
+        parametros = (
+            usar_alpha_matting,
+            limiar_objeto,
+            limiar_fundo,
+            tamanho_erosao,
+            refinamento_rapido,
+        )
+        self.configuracao = ManifestoLote.criar_configuracao(
+            self.removedor_fundo.nome_modelo, parametros, self.saida
+        )
 
-                self.arquivos_processados += 1
+        if self.usar_manifesto:
+            self.manifesto = ManifestoLote(self.pasta_destino)
+        else:
+            self.manifesto = None
+        imagens = self.filtrar_pendentes(imagens)
 
-            except Exception as e:
-                erro_msg = f"'{nome_arquivo}': {e}"
-                self.arquivos_com_erro.append(erro_msg)
-                print(f'Erro ao processar {nome_arquivo}: {e}')
+        try:
+            if self.num_processos > 1 and len(primeiros) > 1:
+                self.processar_em_processos(imagens, parametros)
+            else:
+                self.processar_pipeline(imagens, parametros)
+        finally:
+            if self.varredura is not None:
+                self.varredura.parar()
+            if self.manifesto is not None:
+                self.manifesto.salvar()
 
+        # Terminado o lote, o total é o que de fato foi processado
+        self.total_arquivos = self.arquivos_concluidos
         return (
             self.arquivos_processados,
-            total_arquivos,
+            self.total_arquivos,
             self.arquivos_com_erro,
         )
+
+    def processar_pipeline(self, imagens, parametros):
+        """Processa as imagens na sessão do removedor atual
+
+        Leitura, inferência e escrita rodam em etapas paralelas (veja
+        PipelineLote), então a sessão não fica ociosa durante o I/O.
+        """
+        PipelineLote(self.removedor_fundo, saida=self.saida).executar(
+            imagens,
+            self.preparar_tarefa,
+            parametros,
+            self.registrar_conclusao,
+        )
+
+    @staticmethod
+    def publicar_medicao(nome_arquivo, evento, erro):
+        """Publica a medição devolvida por um processo trabalhador
+
+        Sem evento (o processo falhou antes de devolvê-lo), publica só o
+        erro.
+        """
+        if evento is not None:
+            evento['arquivo'] = nome_arquivo
+            publicar(evento)
+        elif erro is not None:
+            iniciar_medicao('lote', nome_arquivo).concluir(erro)
+
+    def processar_em_processos(self, imagens, parametros):
+        """Distribui as imagens entre processos, cada um com sua sessão
+
+        Os trabalhadores recebem apenas caminhos de arquivo, então a
+        comunicação entre processos continua barata. O número de tarefas em
+        andamento é limitado para não acumular resultados pendentes, e as
+        imagens são consumidas sob demanda, conforme a varredura avança.
+        """
+        num_processos = self.num_processos
+        threads_por_processo = max(1, (os.cpu_count() or 1) // num_processos)
+
+        # 'spawn' evita herdar as threads do onnxruntime do processo pai
+        contexto = multiprocessing.get_context('spawn')
+
+        with ProcessPoolExecutor(
+            max_workers=num_processos,
+            mp_context=contexto,
+            initializer=_inicializar_trabalhador,
+            initargs=(self.removedor_fundo.nome_modelo, threads_por_processo),
+        ) as executor:
+            pendentes = {}
+            iterador = iter(imagens)
+
+            def enviar_proximo():
+                # Um arquivo que não pode ser preparado falha sozinho, como
+                # no pipeline, e o próximo é enviado no lugar dele
+                while True:
+                    nome_arquivo = next(iterador, None)
+                    if nome_arquivo is None:
+                        return False
+                    try:
+                        caminho_entrada, caminho_saida = self.preparar_tarefa(
+                            nome_arquivo
+                        )
+                        break
+                    except Exception as e:
+                        iniciar_medicao('lote', nome_arquivo).concluir(e)
+                        self.registrar_conclusao(nome_arquivo, e)
+                futuro = executor.submit(
+                    _processar_arquivo_trabalhador,
+                    caminho_entrada,
+                    caminho_saida,
+                    parametros,
+                    self.saida,
+                    ha_inscritos(),
+                )
+                pendentes[futuro] = nome_arquivo
+                return True
+
+            for _ in range(num_processos * 2):
+                if not enviar_proximo():
+                    break
+
+            while pendentes:
+                prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    nome_arquivo = pendentes.pop(futuro)
+                    # Falhas do próprio processo (como um processo morto)
+                    # chegam pelo futuro; as do arquivo, pelo resultado
+                    evento = None
+                    erro = futuro.exception()
+                    if erro is None:
+                        evento, erro = futuro.result()
+                    self.publicar_medicao(nome_arquivo, evento, erro)
+                    self.registrar_conclusao(nome_arquivo, erro)
+                    enviar_proximo()
@@ -0,0 +1,358 @@
+import numpy as np
+from PIL import Image
+from pymatting.alpha.estimate_alpha_cf import estimate_alpha_cf
+from pymatting.foreground.estimate_foreground_ml import estimate_foreground_ml
+from scipy.ndimage import binary_erosion, minimum_filter1d
+
+from app.configuracoes import (ALTURA_FAIXA_REFINAMENTO,
+                               EPS_REFINAMENTO_RAPIDO,
+                               RAIO_AMPLIACAO_MASCARA,
+                               RESOLUCAO_BASE_REFINAMENTO,
+                               SOBREPOSICAO_BLOCO_MATTING,
+                               TAMANHO_BLOCO_MATTING)
+
+# Valores do trimap (mesma convenção do rembg)
+_FUNDO = 0
+_DESCONHECIDO = 128
+_OBJETO = 255
+
+
+class RefinamentoBordas:
+    """Refinamento das bordas da máscara (alpha matting e filtro guiado)"""
+
+    @staticmethod
+    def criar_trimap(mascara_array, limiar_objeto, limiar_fundo, tamanho_erosao):
+        """Monta o trimap exatamente como o alpha matting do rembg
+
+        A erosão por um quadrado é separável: um filtro de mínimo por linha e
+        outro por coluna dão o mesmo resultado, com custo que não depende do
+        tamanho da erosão.
+        """
+        eh_objeto = mascara_array > limiar_objeto
+        eh_fundo = mascara_array < limiar_fundo
+
+        if tamanho_erosao > 0:
+            eh_objeto = eh_objeto.view(np.uint8)
+            eh_fundo = eh_fundo.view(np.uint8)
+            for eixo in (0, 1):
+                eh_objeto = minimum_filter1d(
+                    eh_objeto, tamanho_erosao, axis=eixo, mode='constant', cval=0
+                )
+                eh_fundo = minimum_filter1d(
+                    eh_fundo, tamanho_erosao, axis=eixo, mode='constant', cval=1
+                )
+            eh_objeto = eh_objeto.view(bool)
+            eh_fundo = eh_fundo.view(bool)
+        else:
+            eh_objeto = binary_erosion(eh_objeto)
+            eh_fundo = binary_erosion(eh_fundo, border_value=1)
+
+        trimap = np.full(mascara_array.shape, _DESCONHECIDO, dtype=np.uint8)
+        trimap[eh_objeto] = _OBJETO
+        trimap[eh_fundo] = _FUNDO
+        return trimap
+
+    @staticmethod
+    def estimar_bloco(imagem_array, trimap, mascara_array, caixa, sobreposicao):
+        """Executa o matting em um bloco com margem de contexto
+
+        A margem cresce até o bloco conter objeto e fundo conhecidos (exigido
+        pelo matting). Se nem assim houver os dois, usa a máscara do modelo.
+        Retorna (alpha, frente) em float, já recortados para a `caixa`.
+        """
+        altura, largura = trimap.shape
+        x0, y0, x1, y1 = caixa
+        margem = sobreposicao
+        limite_margem = max(sobreposicao, 1) * 4
+
+        while True:
+            ex0, ey0 = max(0, x0 - margem), max(0, y0 - margem)
+            ex1, ey1 = min(largura, x1 + margem), min(altura, y1 + margem)
+            trimap_bloco = trimap[ey0:ey1, ex0:ex1]
+            tem_objeto = (trimap_bloco == _OBJETO).any()
+            tem_fundo = (trimap_bloco == _FUNDO).any()
+            if (tem_objeto and tem_fundo) or margem >= limite_margem:
+                break
+            margem *= 2
+
+        imagem_bloco = imagem_array[ey0:ey1, ex0:ex1] / 255.0
+        if tem_objeto and tem_fundo:
+            alpha = estimate_alpha_cf(imagem_bloco, trimap_bloco / 255.0)
+        else:
+            alpha = mascara_array[ey0:ey1, ex0:ex1] / 255.0
+        alpha = np.clip(alpha, 0.0, 1.0)
+        frente = estimate_foreground_ml(imagem_bloco, alpha)
+
+        recorte = (slice(y0 - ey0, y1 - ey0), slice(x0 - ex0, x1 - ex0))
+        return alpha[recorte], frente[recorte]
+
+    @staticmethod
+    def matting_em_blocos(
+        imagem,
+        mascara,
+        limiar_objeto,
+        limiar_fundo,
+        tamanho_erosao,
+        tamanho_bloco=TAMANHO_BLOCO_MATTING,
+        sobreposicao=SOBREPOSICAO_BLOCO_MATTING,
+    ):
+        """Alpha matting só na faixa desconhecida do trimap, bloco a bloco
+
+        Produz o mesmo tipo de resultado que rembg.bg.alpha_matting_cutout,
+        mas os cálculos em ponto flutuante ficam restritos a cada bloco (com
+        `sobreposicao` pixels de contexto), então a memória de pico depende
+        do tamanho do bloco. Fora da faixa desconhecida o alpha é 0 ou 255 e
+        a cor é a da imagem original. Levanta ValueError, como o rembg, se o
+        trimap não tiver objeto ou fundo.
+        """
+        if imagem.mode in ('RGBA', 'CMYK'):
+            imagem = imagem.convert('RGB')
+
+        imagem_array = np.asarray(imagem)
+        mascara_array = np.asarray(mascara)
+        trimap = RefinamentoBordas.criar_trimap(
+            mascara_array, limiar_objeto, limiar_fundo, tamanho_erosao
+        )
+        if not (trimap == _OBJETO).any() or not (trimap == _FUNDO).any():
+            raise ValueError('O trimap precisa conter objeto e fundo')
+
+        resultado = np.empty(trimap.shape + (4,), dtype=np.uint8)
+        resultado[..., :3] = imagem_array
+        resultado[..., 3] = np.where(trimap == _OBJETO, 255, 0)
+
+        desconhecido = trimap == _DESCONHECIDO
+        altura, largura = trimap.shape
+        for y0 in range(0, altura, tamanho_bloco):
+            y1 = min(y0 + tamanho_bloco, altura)
+            for x0 in range(0, largura, tamanho_bloco):
+                x1 = min(x0 + tamanho_bloco, largura)
+                if not desconhecido[y0:y1, x0:x1].any():
+                    continue
+
+                alpha, frente = RefinamentoBordas.estimar_bloco(
+                    imagem_array,
+                    trimap,
+                    mascara_array,
+                    (x0, y0, x1, y1),
+                    sobreposicao,
+                )
+                bloco = resultado[y0:y1, x0:x1]
+                bloco[..., :3] = np.clip(frente * 255, 0, 255)
+                bloco[..., 3] = np.clip(alpha * 255, 0, 255)
+
+        return Image.fromarray(resultado)
+
+    @staticmethod
+    def filtro_caixa(matriz, raio):
+        """Média em janelas (2r+1) x (2r+1) nos dois primeiros eixos
+
+        Usa somas acumuladas, então o custo não depende do raio. Nas bordas
+        a média considera só os pixels dentro da imagem.
+        """
+        resultado = matriz
+        for eixo in (0, 1):
+            tamanho = resultado.shape[eixo]
+            soma = np.cumsum(resultado, axis=eixo, dtype=np.float64)
+            forma_zero = list(soma.shape)
+            forma_zero[eixo] = 1
+            soma = np.concatenate((np.zeros(forma_zero), soma), axis=eixo)
+
+            posicoes = np.arange(tamanho)
+            fim = np.minimum(posicoes + raio + 1, tamanho)
+            inicio = np.maximum(posicoes - raio, 0)
+            contagem = (fim - inicio).astype(np.float64)
+            forma_contagem = [1] * soma.ndim
+            forma_contagem[eixo] = tamanho
+
+            resultado = (
+                (np.take(soma, fim, axis=eixo) - np.take(soma, inicio, axis=eixo))
+                / contagem.reshape(forma_contagem)
+            ).astype(np.float32)
+        return resultado
+
+    @staticmethod
+    def coeficientes_filtro_guiado(guia, entrada, raio, eps):
+        """Coeficientes do filtro guiado colorido (He et al.)
+
+        `guia` é A x L x 3 e `entrada` é A x L, ambos float32 em [0, 1].
+        Retorna (a, b) já suavizados: a saída filtrada é sum(a * guia) + b,
+        que segue as bordas da guia. O custo é linear no número de pixels.
+        """
+        caixa = RefinamentoBordas.filtro_caixa
+        media_guia = caixa(guia, raio)
+        media_entrada = caixa(entrada, raio)
+        cov_guia_entrada = (
+            caixa(guia * entrada[..., None], raio)
+            - media_guia * media_entrada[..., None]
+        )
+
+        # Covariância 3x3 da guia em cada pixel (só os 6 termos distintos)
+        def covariancia(i, j):
+            return (
+                caixa(guia[..., i] * guia[..., j], raio)
+                - media_guia[..., i] * media_guia[..., j]
+            )
+
+        rr = covariancia(0, 0) + eps
+        rg = covariancia(0, 1)
+        rb = covariancia(0, 2)
+        gg = covariancia(1, 1) + eps
+        gb = covariancia(1, 2)
+        bb = covariancia(2, 2) + eps
+
+        # Inversa da matriz simétrica pelos cofatores
+        inv_rr = gg * bb - gb * gb
+        inv_rg = gb * rb - rg * bb
+        inv_rb = rg * gb - gg * rb
+        inv_gg = rr * bb - rb * rb
+        inv_gb = rb * rg - rr * gb
+        inv_bb = rr * gg - rg * rg
+        determinante = rr * inv_rr + rg * inv_rg + rb * inv_rb
+
+        cov_r = cov_guia_entrada[..., 0]
+        cov_g = cov_guia_entrada[..., 1]
+        cov_b = cov_guia_entrada[..., 2]
+        coeficientes = np.stack(
+            (
+                inv_rr * cov_r + inv_rg * cov_g + inv_rb * cov_b,
+                inv_rg * cov_r + inv_gg * cov_g + inv_gb * cov_b,
+                inv_rb * cov_r + inv_gb * cov_g + inv_bb * cov_b,
+            ),
+            axis=-1,
+        ) / determinante[..., None]
+        deslocamento = media_entrada - np.sum(
+            coeficientes * media_guia, axis=-1
+        )
+
+        return caixa(coeficientes, raio), caixa(deslocamento, raio)
+
+    @staticmethod
+    def ampliar_regiao(matriz, caixa, tamanho):
+        """Amplia (bilinear) a região `caixa` de uma matriz float32 A x L"""
+        return np.asarray(
+            Image.fromarray(matriz).resize(
+                tamanho, Image.Resampling.BILINEAR, box=caixa
+            )
+        )
+
+    @staticmethod
+    def array_rgb(imagem):
+        """Retorna os canais RGB da imagem como array uint8 A x L x 3"""
+        if imagem.mode == 'RGBA':
+            return np.asarray(imagem)[..., :3]
+        if imagem.mode != 'RGB':
+            imagem = imagem.convert('RGB')
+        return np.asarray(imagem)
+
+    @staticmethod
+    def aplicar_coeficientes(guia_array, coeficientes, deslocamento, altura_faixa):
+        """Aplica coeficientes de baixa resolução à guia em resolução cheia
+
+        Os coeficientes (a, b) do filtro guiado são ampliados (bilinear) em
+        faixas horizontais e combinados com a guia: alpha = sum(a * guia) + b.
+        Gera (y0, y1, alpha) por faixa, com alpha em float32.
+        """
+        altura, largura = guia_array.shape[:2]
+        altura_reduzida, largura_reduzida = deslocamento.shape
+        fator_y = altura / altura_reduzida
+        canais = [
+            np.ascontiguousarray(coeficientes[..., canal]) for canal in range(3)
+        ]
+
+        for y0 in range(0, altura, altura_faixa):
+            y1 = min(y0 + altura_faixa, altura)
+            caixa = (0, y0 / fator_y, largura_reduzida, y1 / fator_y)
+            tamanho = (largura, y1 - y0)
+
+            alpha = RefinamentoBordas.ampliar_regiao(
+                deslocamento, caixa, tamanho
+            ).copy()
+            guia_faixa = guia_array[y0:y1].astype(np.float32) / 255
+            for canal, coeficiente in enumerate(canais):
+                alpha += (
+                    RefinamentoBordas.ampliar_regiao(coeficiente, caixa, tamanho)
+                    * guia_faixa[..., canal]
+                )
+            yield y0, y1, alpha
+
+    @staticmethod
+    def ampliar_mascara_guiada(
+        imagem,
+        imagem_reduzida,
+        mascara_reduzida,
+        raio=RAIO_AMPLIACAO_MASCARA,
+        eps=EPS_REFINAMENTO_RAPIDO,
+        altura_faixa=ALTURA_FAIXA_REFINAMENTO,
+    ):
+        """Amplia a máscara da resolução de inferência para a da imagem
+
+        Em vez de só interpolar a máscara, ajusta na resolução reduzida um
+        modelo linear local entre a imagem e a máscara (filtro guiado) e o
+        aplica à imagem completa, então as bordas ampliadas seguem as bordas
+        reais da imagem. Retorna uma máscara modo 'L' do tamanho de `imagem`.
+        """
+        coeficientes, deslocamento = RefinamentoBordas.coeficientes_filtro_guiado(
+            RefinamentoBordas.array_rgb(imagem_reduzida).astype(np.float32)
+            / 255,
+            np.asarray(mascara_reduzida, dtype=np.float32) / 255,
+            raio,
+            eps,
+        )
+
+        guia_array = RefinamentoBordas.array_rgb(imagem)
+        mascara = np.empty(guia_array.shape[:2], dtype=np.uint8)
+        for y0, y1, alpha in RefinamentoBordas.aplicar_coeficientes(
+            guia_array, coeficientes, deslocamento, altura_faixa
+        ):
+            mascara[y0:y1] = np.clip(alpha * 255 + 0.5, 0, 255)
+        return Image.fromarray(mascara)
+
+    @staticmethod
+    def refinamento_rapido(
+        imagem,
+        mascara,
+        limiar_objeto,
+        limiar_fundo,
+        tamanho_erosao,
+        eps=EPS_REFINAMENTO_RAPIDO,
+        altura_faixa=ALTURA_FAIXA_REFINAMENTO,
+    ):
+        """Refina as bordas da máscara com o filtro guiado pela imagem
+
+        Alternativa rápida ao alpha matting, com os mesmos parâmetros: os
+        limiares e a erosão definem o trimap (objeto e fundo certos são
+        mantidos) e a faixa desconhecida recebe a máscara filtrada. O raio do
+        filtro é a erosão. Em imagens grandes, os coeficientes do filtro são
+        calculados sobre a imagem reduzida e ampliados em faixas horizontais
+        (filtro guiado rápido), então custo e memória ficam lineares.
+        """
+        imagem_array = RefinamentoBordas.array_rgb(imagem)
+        mascara_array = np.asarray(mascara)
+        trimap = RefinamentoBordas.criar_trimap(
+            mascara_array, limiar_objeto, limiar_fundo, tamanho_erosao
+        )
+
+        altura, largura = trimap.shape
+        escala = max(1, round(max(largura, altura) / RESOLUCAO_BASE_REFINAMENTO))
+        guia = Image.fromarray(imagem_array)
+        if escala > 1:
+            guia = guia.reduce(escala)
+            mascara = mascara.reduce(escala)
+        coeficientes, deslocamento = RefinamentoBordas.coeficientes_filtro_guiado(
+            np.asarray(guia, dtype=np.float32) / 255,
+            np.asarray(mascara, dtype=np.float32) / 255,
+            max(2, tamanho_erosao),
+            eps,
+        )
+
+        resultado = np.empty((altura, largura, 4), dtype=np.uint8)
+        resultado[..., :3] = imagem_array
+        for y0, y1, alpha in RefinamentoBordas.aplicar_coeficientes(
+            imagem_array, coeficientes, deslocamento, altura_faixa
+        ):
+            trimap_faixa = trimap[y0:y1]
+            alpha[trimap_faixa == _OBJETO] = 1.0
+            alpha[trimap_faixa == _FUNDO] = 0.0
+            resultado[y0:y1, :, 3] = np.clip(alpha * 255 + 0.5, 0, 255)
+
+        return Image.fromarray(resultado)
@@ -1,22 +1,292 @@
-import io
+import threading
+import weakref
+from collections import OrderedDict
 
+import numpy as np
 from PIL import Image
-from rembg import new_session, remove
+from rembg.bg import alpha_matting_cutout, naive_cutout
+
+from app.configuracoes import (AMPLIACAO_GUIADA_MASCARA,
+                               LIMITE_PIXELS_MATTING_COMPLETO,
+                               TAMANHO_CACHE_MASCARAS)
+from app.processadores.codificador_saida import ConfiguracaoSaida
+from app.processadores.gerenciador_sessoes import obter_gerenciador_padrao
+from app.processadores.refinamento import RefinamentoBordas
+from app.utils.imagem_utils import reduzir_imagem
+from app.utils.instrumentacao import iniciar_medicao
+
+# Resolução de entrada, média e desvio usados por cada modelo no rembg
+# (confira com python -m benchmarks.verificar_normalizacao)
+_MEDIA_IMAGENET = (0.485, 0.456, 0.406)
+_DESVIO_IMAGENET = (0.229, 0.224, 0.225)
+PARAMETROS_MODELOS = {
+    'u2net': ((320, 320), _MEDIA_IMAGENET, _DESVIO_IMAGENET),
+    'u2netp': ((320, 320), _MEDIA_IMAGENET, _DESVIO_IMAGENET),
+    'u2net_human_seg': ((320, 320), _MEDIA_IMAGENET, _DESVIO_IMAGENET),
+    'silueta': ((320, 320), _MEDIA_IMAGENET, _DESVIO_IMAGENET),
+    'isnet-general-use': ((1024, 1024), (0.5, 0.5, 0.5), (1.0, 1.0, 1.0)),
+    'isnet-anime': ((1024, 1024), _MEDIA_IMAGENET, (1.0, 1.0, 1.0)),
+}
 
 
 class RemoveFundo:
-    def __init__(self, nome_modelo='u2net'):
+    def __init__(self, nome_modelo='u2net', gerenciador_sessoes=None):
         self.nome_modelo = nome_modelo
-        self.sessao = new_session(nome_modelo)
+        self.gerenciador_sessoes = (
+            gerenciador_sessoes or obter_gerenciador_padrao()
+        )
+        # Modelos cujo grafo falhou ao receber mais de uma imagem
+        self.modelos_sem_lote = set()
+        # Máscaras brutas por (id da imagem, modelo), com descarte LRU
+        self.cache_mascaras = OrderedDict()
+        self.trava_cache = threading.Lock()
+
+    @property
+    def sessao(self):
+        """Sessão do modelo atual, carregada sob demanda e mantida em cache"""
+        return self.gerenciador_sessoes.obter_sessao(self.nome_modelo)
 
     def mudar_modelo(self, novo_modelo):
-        """Muda para um novo modelo e atualiza a sessão"""
+        """Muda para um novo modelo e atualiza a sessão
+
+        A troca é instantânea quando o modelo já está no cache de sessões.
+        """
         if self.nome_modelo != novo_modelo:
+            self.gerenciador_sessoes.obter_sessao(novo_modelo)
             self.nome_modelo = novo_modelo
-            self.sessao = new_session(novo_modelo)
             return True
         return False
 
+    def modelo_carregado(self, nome_modelo):
+        """Indica se o modelo pode ser usado sem carregar pesos do disco"""
+        return self.gerenciador_sessoes.esta_carregado(nome_modelo)
+
+    def tamanho_entrada(self):
+        """Resolução de entrada do modelo atual, ou None se desconhecida"""
+        parametros = PARAMETROS_MODELOS.get(self.nome_modelo)
+        return parametros[0] if parametros else None
+
+    def reduzir_para_modelo(self, imagem):
+        """Reduz a imagem para perto da resolução de entrada do modelo
+
+        O modelo só enxerga a resolução de entrada; reduzir antes deixa o
+        redimensionamento para o tensor muito mais barato em fotos grandes.
+        """
+        tamanho = self.tamanho_entrada()
+        if tamanho is None:
+            return imagem
+        return reduzir_imagem(imagem, tamanho)
+
+    @staticmethod
+    def ampliar_mascara(imagem, imagem_reduzida, mascara):
+        """Leva a máscara da resolução de `imagem_reduzida` à de `imagem`"""
+        if mascara.size == imagem.size:
+            return mascara
+        if AMPLIACAO_GUIADA_MASCARA:
+            return RefinamentoBordas.ampliar_mascara_guiada(
+                imagem, imagem_reduzida, mascara
+            )
+        return mascara.resize(imagem.size, Image.Resampling.LANCZOS)
+
+    def obter_mascara(self, imagem, usar_cache=True):
+        """Executa apenas o modelo e retorna a máscara bruta (modo 'L')
+
+        A máscara fica em cache para a combinação (imagem, modelo): mudanças
+        nos limiares, na erosão ou no alpha matting reaproveitam a máscara
+        sem executar o modelo de novo. O lote usa `usar_cache=False`, para
+        que suas imagens, vistas uma única vez, não tirem do cache a máscara
+        da imagem aberta na interface.
+        """
+        nome_modelo = self.nome_modelo
+        if usar_cache:
+            mascara = self.buscar_mascara_cache(imagem, nome_modelo)
+            if mascara is not None:
+                return mascara
+
+        # A sessão recebe a imagem PIL diretamente, sem passar por PNG
+        imagem_reduzida = self.reduzir_para_modelo(imagem)
+        mascara = self.gerenciador_sessoes.obter_sessao(nome_modelo).predict(
+            imagem_reduzida
+        )[0]
+        mascara = self.ampliar_mascara(imagem, imagem_reduzida, mascara)
+        if usar_cache:
+            self.guardar_mascara_cache(imagem, nome_modelo, mascara)
+        return mascara
+
+    def mascara_em_cache(self, imagem):
+        """Indica se a máscara da imagem já está disponível no modelo atual"""
+        return self.buscar_mascara_cache(imagem, self.nome_modelo) is not None
+
+    def buscar_mascara_cache(self, imagem, nome_modelo):
+        """Retorna a máscara em cache ou None"""
+        chave = (id(imagem), nome_modelo)
+        with self.trava_cache:
+            entrada = self.cache_mascaras.get(chave)
+            # O id só vale enquanto a imagem original ainda existir
+            if entrada is None or entrada[0]() is not imagem:
+                return None
+            self.cache_mascaras.move_to_end(chave)
+            return entrada[1]
+
+    def guardar_mascara_cache(self, imagem, nome_modelo, mascara):
+        """Guarda a máscara no cache, descartando as mais antigas"""
+        chave = (id(imagem), nome_modelo)
+        with self.trava_cache:
+            # Descarta entradas de imagens que já foram liberadas
+            for chave_antiga in [
+                c for c, (ref, _) in self.cache_mascaras.items() if ref() is None
+            ]:
+                del self.cache_mascaras[chave_antiga]
+
+            self.cache_mascaras[chave] = (weakref.ref(imagem), mascara)
+            self.cache_mascaras.move_to_end(chave)
+            while len(self.cache_mascaras) > TAMANHO_CACHE_MASCARAS:
+                self.cache_mascaras.popitem(last=False)
+
+    def limpar_cache_mascaras(self):
+        """Remove todas as máscaras em cache"""
+        with self.trava_cache:
+            self.cache_mascaras.clear()
+
+    def obter_mascaras_lote(self, imagens, usar_cache=True):
+        """Executa o modelo sobre várias imagens em um único tensor
+
+        Retorna uma máscara (modo 'L') por imagem, na mesma ordem. Modelos
+        sem parâmetros conhecidos, ou cujo grafo não aceita lotes, recaem na
+        inferência imagem a imagem (com `usar_cache`, veja obter_mascara).
+        """
+        parametros = PARAMETROS_MODELOS.get(self.nome_modelo)
+        sessao = self.sessao
+        sessao_onnx = getattr(sessao, 'inner_session', None)
+
+        if (
+            len(imagens) < 2
+            or parametros is None
+            or sessao_onnx is None
+            or self.nome_modelo in self.modelos_sem_lote
+        ):
+            return [
+                self.obter_mascara(imagem, usar_cache) for imagem in imagens
+            ]
+
+        tamanho, media, desvio = parametros
+        entrada = sessao_onnx.get_inputs()[0]
+        imagens_reduzidas = [
+            reduzir_imagem(imagem, tamanho) for imagem in imagens
+        ]
+        tensores = [
+            self.preparar_tensor(imagem, tamanho, media, desvio)
+            for imagem in imagens_reduzidas
+        ]
+
+        # Dimensão de lote fixa no grafo: executa em blocos desse tamanho
+        dimensao_lote = entrada.shape[0] if entrada.shape else None
+        if isinstance(dimensao_lote, int) and dimensao_lote > 0:
+            tamanho_bloco = dimensao_lote
+        else:
+            tamanho_bloco = len(tensores)
+
+        try:
+            predicoes = []
+            for inicio in range(0, len(tensores), tamanho_bloco):
+                bloco = tensores[inicio:inicio + tamanho_bloco]
+                quantidade = len(bloco)
+                # Completa o último bloco repetindo a última imagem
+                bloco += [bloco[-1]] * (tamanho_bloco - quantidade)
+                saidas = sessao_onnx.run(
+                    None, {entrada.name: np.stack(bloco)}
+                )
+                predicoes.extend(saidas[0][:quantidade, 0, :, :])
+        except Exception as e:
+            print(
+                f'Modelo {self.nome_modelo} não aceita lotes, '
+                f'usando inferência individual: {e}'
+            )
+            self.modelos_sem_lote.add(self.nome_modelo)
+            return [
+                self.obter_mascara(imagem, usar_cache) for imagem in imagens
+            ]
+
+        return [
+            self.ampliar_mascara(
+                imagem,
+                reduzida,
+                self.predicao_para_mascara(predicao, reduzida.size),
+            )
+            for predicao, imagem, reduzida in zip(
+                predicoes, imagens, imagens_reduzidas
+            )
+        ]
+
+    @staticmethod
+    def preparar_tensor(imagem, tamanho, media, desvio):
+        """Normaliza a imagem como o rembg faz e retorna um tensor 3 x A x L"""
+        imagem_rgb = imagem.convert('RGB').resize(
+            tamanho, Image.Resampling.LANCZOS
+        )
+        dados = np.asarray(imagem_rgb, dtype=np.float32)
+        dados /= max(float(dados.max()), 1e-6)
+        dados = (dados - np.array(media, dtype=np.float32)) / np.array(
+            desvio, dtype=np.float32
+        )
+        return dados.transpose((2, 0, 1))
+
+    @staticmethod
+    def predicao_para_mascara(predicao, tamanho_original):
+        """Converte a saída do modelo em máscara no tamanho original"""
+        minimo = float(predicao.min())
+        maximo = float(predicao.max())
+        predicao = (predicao - minimo) / max(maximo - minimo, 1e-6)
+        mascara = Image.fromarray((predicao * 255).astype(np.uint8))
+        return mascara.resize(tamanho_original, Image.Resampling.LANCZOS)
+
+    def aplicar_mascara(
+        self,
+        imagem,
+        mascara,
+        usar_alpha_matting=True,
+        limiar_objeto=250,
+        limiar_fundo=10,
+        tamanho_erosao=5,
+        refinamento_rapido=False,
+    ):
+        """Aplica a máscara na imagem e retorna o recorte RGBA
+
+        Com `refinamento_rapido`, as bordas são refinadas pelo filtro guiado
+        (veja RefinamentoBordas.refinamento_rapido) no lugar do alpha matting.
+        Em imagens com mais de LIMITE_PIXELS_MATTING_COMPLETO pixels, o alpha
+        matting roda em blocos, só na faixa desconhecida do trimap.
+        """
+        if refinamento_rapido:
+            return RefinamentoBordas.refinamento_rapido(
+                imagem,
+                mascara,
+                limiar_objeto,
+                limiar_fundo,
+                tamanho_erosao,
+            )
+        if usar_alpha_matting:
+            if imagem.width * imagem.height > LIMITE_PIXELS_MATTING_COMPLETO:
+                funcao_matting = RefinamentoBordas.matting_em_blocos
+            else:
+                funcao_matting = alpha_matting_cutout
+            try:
+                return funcao_matting(
+                    imagem,
+                    mascara,
+                    limiar_objeto,
+                    limiar_fundo,
+                    tamanho_erosao,
+                )
+            except ValueError:
+                # Mesmo comportamento do rembg: recai no recorte simples
+                pass
+        imagem_resultado = naive_cutout(imagem, mascara)
+
+        if imagem_resultado.mode != 'RGBA':
+            imagem_resultado = imagem_resultado.convert('RGBA')
+        return imagem_resultado
+
     def processar_imagem(
         self,
         imagem,
@@ -24,29 +294,68 @@ class RemoveFundo:
         limiar_objeto=250,
         limiar_fundo=10,
         tamanho_erosao=5,
+        refinamento_rapido=False,
+        medicao=None,
+        usar_cache=True,
     ):
-        """Remove o fundo de uma imagem usando as configurações especificadas"""
-        # Converte a imagem PIL para bytes
-        buffer = io.BytesIO()
-        imagem.save(buffer, format='PNG')
-        dados_imagem = buffer.getvalue()
-
-        # Processa a remoção de fundo
-        bytes_resultado = remove(
-            dados_imagem,
-            session=self.sessao,
-            alpha_matting=usar_alpha_matting,
-            alpha_matting_foreground_threshold=limiar_objeto,
-            alpha_matting_background_threshold=limiar_fundo,
-            alpha_matting_erode_size=tamanho_erosao,
-        )
+        """Remove o fundo de uma imagem usando as configurações especificadas
 
-        # Converte o resultado de volta para imagem PIL
-        imagem_resultado = Image.open(io.BytesIO(bytes_resultado)).convert(
-            'RGBA'
-        )
+        As etapas são registradas em `medicao` (veja app.utils.instrumentacao);
+        sem ela, a chamada publica a própria medição com origem 'removedor'.
+        `usar_cache` é repassado a obter_mascara.
+        """
+        medicao_propria = medicao is None
+        if medicao_propria:
+            medicao = iniciar_medicao('removedor')
+
+        with medicao.etapa('inferencia'):
+            mascara = self.obter_mascara(imagem, usar_cache)
+        with medicao.etapa('matting'):
+            imagem_resultado = self.aplicar_mascara(
+                imagem,
+                mascara,
+                usar_alpha_matting,
+                limiar_objeto,
+                limiar_fundo,
+                tamanho_erosao,
+                refinamento_rapido,
+            )
+
+        if medicao_propria:
+            medicao.concluir()
         return imagem_resultado
 
+    def processar_array(
+        self,
+        dados,
+        usar_alpha_matting=True,
+        limiar_objeto=250,
+        limiar_fundo=10,
+        tamanho_erosao=5,
+        refinamento_rapido=False,
+        apenas_mascara=False,
+    ):
+        """Processa um array NumPy (A x L x C) e retorna o resultado como array
+
+        Retorna o recorte RGBA (A x L x 4) ou, com apenas_mascara=True, a
+        máscara alfa bruta (A x L).
+        """
+        imagem = Image.fromarray(dados)
+
+        if apenas_mascara:
+            return np.asarray(self.obter_mascara(imagem))
+
+        return np.asarray(
+            self.processar_imagem(
+                imagem,
+                usar_alpha_matting,
+                limiar_objeto,
+                limiar_fundo,
+                tamanho_erosao,
+                refinamento_rapido,
+            )
+        )
+
     def obter_bytes_processados(
         self,
         imagem,
@@ -54,19 +363,21 @@ class RemoveFundo:
         limiar_objeto=250,
         limiar_fundo=10,
         tamanho_erosao=5,
+        refinamento_rapido=False,
+        saida=None,
     ):
-        """Processa a imagem e retorna os bytes resultantes (útil para salvar arquivo)"""
-        buffer = io.BytesIO()
-        imagem.save(buffer, format='PNG')
-        dados_imagem = buffer.getvalue()
-
-        bytes_resultado = remove(
-            dados_imagem,
-            session=self.sessao,
-            alpha_matting=usar_alpha_matting,
-            alpha_matting_foreground_threshold=limiar_objeto,
-            alpha_matting_background_threshold=limiar_fundo,
-            alpha_matting_erode_size=tamanho_erosao,
+        """Processa a imagem e retorna os bytes resultantes (útil para salvar arquivo)
+
+        `saida` (ConfiguracaoSaida) define o formato; o padrão é PNG.
+        """
+        imagem_resultado = self.processar_imagem(
+            imagem,
+            usar_alpha_matting,
+            limiar_objeto,
+            limiar_fundo,
+            tamanho_erosao,
+            refinamento_rapido,
         )
 
-        return bytes_resultado
+        # Única codificação do fluxo: apenas na saída
+        return (saida or ConfiguracaoSaida()).codificar(imagem_resultado)
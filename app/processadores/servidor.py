@@ -0,0 +1,384 @@
+"""Serviço HTTP local de remoção de fundo
+
+Uso:
+    python -m app.processadores.servidor [--porta 8765] [--modelos u2net ...]
+
+Rotas:
+    POST /remover?modelo=u2net&formato=png|webp|mascara&alpha_matting=1
+                 &refinamento_rapido=0&limiar_objeto=250&limiar_fundo=10
+                 &erosao=5&compressao=6&qualidade=90&sem_perdas=1
+        Corpo: bytes da imagem. Resposta: PNG ou WebP do recorte, ou PNG da
+        máscara (veja ConfiguracaoSaida).
+    GET /saude
+        Resposta: JSON com os modelos carregados e o tamanho das filas.
+
+Os pedidos de cada modelo entram em uma fila limitada (503 quando cheia) e
+são agrupados em micro-lotes de até TAMANHO_LOTE_INFERENCIA imagens,
+esperando no máximo LATENCIA_MAXIMA_LOTE_MS pelo lote encher. O serviço
+escuta apenas em 127.0.0.1 por padrão e não importa o PyQt6.
+"""
+import argparse
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from app.configuracoes import (ALPHA_MATTING_PADRAO, EROSAO_MASCARA_PADRAO,
+                               FORMATO_SAIDA_PADRAO, FORMATOS_SAIDA,
+                               LATENCIA_MAXIMA_LOTE_MS, LIMIAR_FUNDO_PADRAO,
+                               LIMIAR_OBJETO_PADRAO, MODELO_PADRAO,
+                               MODELOS_DISPONIVEIS,
+                               NIVEL_COMPRESSAO_PNG_PADRAO,
+                               PORTA_SERVIDOR_PADRAO, QUALIDADE_WEBP_PADRAO,
+                               REFINAMENTO_RAPIDO_PADRAO,
+                               TAMANHO_FILA_SERVIDOR, TAMANHO_LOTE_INFERENCIA,
+                               TAMANHO_MAXIMO_UPLOAD_MB,
+                               WEBP_SEM_PERDAS_PADRAO)
+from app.processadores.codificador_saida import ConfiguracaoSaida
+from app.processadores.removedor_fundo import RemoveFundo
+from app.utils.imagem_utils import carregar_imagem
+
+MENSAGENS_STATUS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class ErroRequisicao(Exception):
+    """Erro que deve ser devolvido ao cliente com um status HTTP"""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class FilaModelo:
+    """Fila de pedidos de um modelo, atendida em micro-lotes"""
+
+    def __init__(self, nome_modelo, tamanho_fila, tamanho_lote, latencia_s):
+        self.removedor = RemoveFundo(nome_modelo)
+        self.fila = asyncio.Queue(maxsize=tamanho_fila)
+        self.tamanho_lote = tamanho_lote
+        self.latencia_s = latencia_s
+        # Um executor por modelo: as inferências do modelo ficam em série
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.tarefa = asyncio.get_running_loop().create_task(self.atender())
+
+    def enfileirar(self, dados, parametros, saida):
+        """Adiciona um pedido à fila e retorna o futuro da resposta"""
+        futuro = asyncio.get_running_loop().create_future()
+        try:
+            self.fila.put_nowait((dados, parametros, saida, futuro))
+        except asyncio.QueueFull:
+            raise ErroRequisicao(503, 'Fila de processamento cheia')
+        return futuro
+
+    async def atender(self):
+        """Agrupa pedidos em micro-lotes e os processa"""
+        loop = asyncio.get_running_loop()
+        while True:
+            pedidos = [await self.fila.get()]
+            limite = loop.time() + self.latencia_s
+            while len(pedidos) < self.tamanho_lote:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    pedidos.append(
+                        await asyncio.wait_for(self.fila.get(), restante)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            resultados = await loop.run_in_executor(
+                self.executor, self.processar_lote, pedidos
+            )
+            for (_, _, _, futuro), resultado in zip(pedidos, resultados):
+                if futuro.cancelled():
+                    continue
+                if isinstance(resultado, Exception):
+                    futuro.set_exception(resultado)
+                else:
+                    futuro.set_result(resultado)
+
+    def processar_lote(self, pedidos):
+        """Decodifica, infere em lote e codifica as respostas (em thread)"""
+        resultados = [None] * len(pedidos)
+        imagens = []
+        indices = []
+        for indice, (dados, _, _, _) in enumerate(pedidos):
+            try:
+                imagens.append(
+                    carregar_imagem(io.BytesIO(dados), converter_rgba=False)
+                )
+                indices.append(indice)
+            except Exception as e:
+                resultados[indice] = ErroRequisicao(
+                    400, f'Imagem inválida: {e}'
+                )
+
+        try:
+            mascaras = self.removedor.obter_mascaras_lote(
+                imagens, usar_cache=False
+            )
+        except Exception as e:
+            for indice in indices:
+                resultados[indice] = e
+            return resultados
+
+        for indice, imagem, mascara in zip(indices, imagens, mascaras):
+            _, parametros, saida, _ = pedidos[indice]
+            try:
+                imagem_resultado = self.removedor.aplicar_mascara(
+                    imagem, mascara, *parametros
+                )
+                resultados[indice] = saida.codificar(imagem_resultado)
+            except Exception as e:
+                resultados[indice] = e
+        return resultados
+
+    def encerrar(self):
+        """Cancela o atendimento e libera o executor"""
+        self.tarefa.cancel()
+        self.executor.shutdown(wait=False)
+
+
+class ServidorRemocao:
+    """Servidor HTTP mínimo (asyncio) em torno do RemoveFundo"""
+
+    def __init__(
+        self,
+        tamanho_fila=TAMANHO_FILA_SERVIDOR,
+        tamanho_lote=TAMANHO_LOTE_INFERENCIA,
+        latencia_ms=LATENCIA_MAXIMA_LOTE_MS,
+        tamanho_maximo_mb=TAMANHO_MAXIMO_UPLOAD_MB,
+    ):
+        self.tamanho_fila = tamanho_fila
+        self.tamanho_lote = tamanho_lote
+        self.latencia_s = latencia_ms / 1000
+        self.tamanho_maximo = int(tamanho_maximo_mb * 1024 * 1024)
+        self.filas = {}
+
+    def obter_fila(self, nome_modelo):
+        """Retorna (criando se necessário) a fila do modelo"""
+        if nome_modelo not in self.filas:
+            self.filas[nome_modelo] = FilaModelo(
+                nome_modelo,
+                self.tamanho_fila,
+                self.tamanho_lote,
+                self.latencia_s,
+            )
+        return self.filas[nome_modelo]
+
+    async def aquecer(self, modelos):
+        """Carrega as sessões dos modelos antes de aceitar pedidos"""
+        loop = asyncio.get_running_loop()
+        for nome_modelo in modelos:
+            fila = self.obter_fila(nome_modelo)
+            await loop.run_in_executor(
+                fila.executor, lambda: fila.removedor.sessao
+            )
+            print(f'Modelo pronto: {nome_modelo}')
+
+    async def tratar_conexao(self, leitor, escritor):
+        """Lê um pedido HTTP, processa e responde"""
+        try:
+            try:
+                status, tipo, corpo = await self.tratar_pedido(
+                    leitor, escritor
+                )
+            except ErroRequisicao as e:
+                status, tipo, corpo = self.resposta_erro(e.status, str(e))
+            except Exception as e:
+                print(f'Erro ao processar pedido: {e}')
+                status, tipo, corpo = self.resposta_erro(500, str(e))
+
+            cabecalho = (
+                f'HTTP/1.1 {status} {MENSAGENS_STATUS.get(status, "")}\r\n'
+                f'Content-Type: {tipo}\r\n'
+                f'Content-Length: {len(corpo)}\r\n'
+                'Connection: close\r\n\r\n'
+            )
+            escritor.write(cabecalho.encode('latin-1') + corpo)
+            await escritor.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def tratar_pedido(self, leitor, escritor):
+        """Interpreta o pedido e retorna (status, content-type, corpo)
+
+        Com `Expect: 100-continue`, o cliente só envia a imagem depois da
+        resposta '100 Continue', enviada quando os cabeçalhos e parâmetros
+        são válidos; nos erros, ele recebe a resposta final sem enviar nada.
+        """
+        try:
+            bruto = await leitor.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise ErroRequisicao(400, 'Cabeçalho muito grande')
+
+        linhas = bruto.decode('latin-1').split('\r\n')
+        try:
+            metodo, alvo, _ = linhas[0].split(' ', 2)
+        except ValueError:
+            raise ErroRequisicao(400, 'Linha de pedido inválida')
+
+        cabecalhos = {}
+        for linha in linhas[1:]:
+            if ':' in linha:
+                nome, valor = linha.split(':', 1)
+                cabecalhos[nome.strip().lower()] = valor.strip()
+
+        url = urlsplit(alvo)
+        consulta = {
+            chave: valores[-1] for chave, valores in parse_qs(url.query).items()
+        }
+
+        if url.path == '/saude':
+            if metodo != 'GET':
+                raise ErroRequisicao(405, 'Use GET')
+            estado = {
+                nome: {
+                    'carregado': fila.removedor.modelo_carregado(nome),
+                    'pedidos_na_fila': fila.fila.qsize(),
+                }
+                for nome, fila in self.filas.items()
+            }
+            corpo = json.dumps({'modelos': estado}).encode('utf-8')
+            return 200, 'application/json', corpo
+
+        if url.path != '/remover':
+            raise ErroRequisicao(404, 'Rota não encontrada')
+        if metodo != 'POST':
+            raise ErroRequisicao(405, 'Use POST')
+
+        try:
+            tamanho = int(cabecalhos.get('content-length', ''))
+        except ValueError:
+            raise ErroRequisicao(400, 'Content-Length obrigatório')
+        if tamanho < 0:
+            raise ErroRequisicao(400, 'Content-Length inválido')
+        if tamanho > self.tamanho_maximo:
+            raise ErroRequisicao(413, 'Imagem maior que o limite')
+        nome_modelo, parametros, saida = self.ler_parametros(consulta)
+
+        if cabecalhos.get('expect', '').lower() == '100-continue':
+            escritor.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await escritor.drain()
+        dados = await leitor.readexactly(tamanho)
+
+        futuro = self.obter_fila(nome_modelo).enfileirar(
+            dados, parametros, saida
+        )
+        corpo = await futuro
+        return 200, saida.tipo_mime, corpo
+
+    @staticmethod
+    def ler_parametros(consulta):
+        """Valida o modelo, os ajustes e o formato pedidos"""
+        nome_modelo = consulta.get('modelo', MODELO_PADRAO)
+        if nome_modelo not in MODELOS_DISPONIVEIS:
+            raise ErroRequisicao(400, f'Modelo desconhecido: {nome_modelo}')
+
+        formato = consulta.get('formato', FORMATO_SAIDA_PADRAO)
+        if formato not in FORMATOS_SAIDA:
+            raise ErroRequisicao(400, f'Formato desconhecido: {formato}')
+
+        def ler_booleano(nome, padrao):
+            return consulta.get(nome, str(int(padrao))) not in (
+                '0',
+                'false',
+                'nao',
+            )
+
+        try:
+            parametros = (
+                ler_booleano('alpha_matting', ALPHA_MATTING_PADRAO),
+                int(consulta.get('limiar_objeto', LIMIAR_OBJETO_PADRAO)),
+                int(consulta.get('limiar_fundo', LIMIAR_FUNDO_PADRAO)),
+                int(consulta.get('erosao', EROSAO_MASCARA_PADRAO)),
+                ler_booleano('refinamento_rapido', REFINAMENTO_RAPIDO_PADRAO),
+            )
+            saida = ConfiguracaoSaida(
+                formato,
+                nivel_compressao=int(
+                    consulta.get('compressao', NIVEL_COMPRESSAO_PNG_PADRAO)
+                ),
+                webp_sem_perdas=ler_booleano(
+                    'sem_perdas', WEBP_SEM_PERDAS_PADRAO
+                ),
+                qualidade_webp=int(
+                    consulta.get('qualidade', QUALIDADE_WEBP_PADRAO)
+                ),
+            )
+        except ValueError:
+            raise ErroRequisicao(400, 'Parâmetros de ajuste inválidos')
+
+        return nome_modelo, parametros, saida
+
+    @staticmethod
+    def resposta_erro(status, mensagem):
+        """Monta uma resposta de erro em JSON"""
+        corpo = json.dumps({'erro': mensagem}).encode('utf-8')
+        return status, 'application/json', corpo
+
+    async def executar(self, host, porta, modelos):
+        """Aquece os modelos e atende pedidos até ser interrompido"""
+        await self.aquecer(modelos)
+        servidor = await asyncio.start_server(
+            self.tratar_conexao, host, porta
+        )
+        print(f'Servidor ouvindo em http://{host}:{porta}')
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            for fila in self.filas.values():
+                fila.encerrar()
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m app.processadores.servidor',
+        description='Serviço HTTP local de remoção de fundo.',
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=PORTA_SERVIDOR_PADRAO)
+    parser.add_argument(
+        '--modelos',
+        nargs='*',
+        choices=MODELOS_DISPONIVEIS,
+        default=[MODELO_PADRAO],
+        help='modelos carregados antes de aceitar pedidos',
+    )
+    parser.add_argument(
+        '--tamanho-fila', type=int, default=TAMANHO_FILA_SERVIDOR
+    )
+    parser.add_argument(
+        '--tamanho-lote', type=int, default=TAMANHO_LOTE_INFERENCIA
+    )
+    parser.add_argument(
+        '--latencia-ms', type=float, default=LATENCIA_MAXIMA_LOTE_MS
+    )
+    args = parser.parse_args(argumentos)
+
+    servidor = ServidorRemocao(
+        tamanho_fila=args.tamanho_fila,
+        tamanho_lote=args.tamanho_lote,
+        latencia_ms=args.latencia_ms,
+    )
+    try:
+        asyncio.run(servidor.executar(args.host, args.porta, args.modelos))
+    except KeyboardInterrupt:
+        print('Servidor encerrado.')
+
+
+if __name__ == '__main__':
+    main()
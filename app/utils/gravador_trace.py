@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+
+
+def nome_arquivo_trace(prefixo='trace_lote'):
+    """Gera um nome de arquivo de trace com data e hora"""
+    return f"{prefixo}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+
+
+class GravadorTrace:
+    """Inscrito da instrumentação que grava uma linha do tempo do lote
+
+    Cada etapa medida vira um intervalo no processo e na thread em que foi
+    executada, no formato de eventos de trace do Chrome (abre no Perfetto
+    ou em chrome://tracing). Inferências em micro-lote aparecem uma única
+    vez, com a lista de arquivos do lote.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.trava = threading.Lock()
+        self.intervalos = {}
+        self.erros = []
+
+    def __call__(self, evento):
+        arquivo = evento['arquivo']
+        with self.trava:
+            for etapa, inicio, duracao, pid, tid in evento['intervalos']:
+                chave = (etapa, inicio, pid, tid)
+                intervalo = self.intervalos.get(chave)
+                if intervalo is None:
+                    self.intervalos[chave] = {
+                        'name': etapa,
+                        'cat': evento['origem'],
+                        'ph': 'X',
+                        'inicio': inicio,
+                        'dur': duracao * 1e6,
+                        'pid': pid,
+                        'tid': tid,
+                        'args': {'arquivos': [arquivo]},
+                    }
+                else:
+                    intervalo['args']['arquivos'].append(arquivo)
+
+            if evento['erro'] is not None and evento['intervalos']:
+                _, inicio, duracao, pid, tid = evento['intervalos'][-1]
+                self.erros.append(
+                    {
+                        'name': 'erro',
+                        'cat': evento['origem'],
+                        'ph': 'i',
+                        's': 't',
+                        'inicio': inicio + duracao,
+                        'pid': pid,
+                        'tid': tid,
+                        'args': {'arquivo': arquivo, 'erro': evento['erro']},
+                    }
+                )
+
+    def criar_eventos(self):
+        """Converte os intervalos para a lista `traceEvents`"""
+        with self.trava:
+            registros = list(self.intervalos.values()) + list(self.erros)
+        if not registros:
+            return []
+
+        # Tempos em microssegundos a partir do primeiro intervalo
+        origem = min(registro['inicio'] for registro in registros)
+        eventos = []
+        for registro in registros:
+            evento = {
+                chave: valor
+                for chave, valor in registro.items()
+                if chave != 'inicio'
+            }
+            evento['ts'] = (registro['inicio'] - origem) * 1e6
+            eventos.append(evento)
+        eventos.sort(key=lambda evento: evento['ts'])
+
+        pid_principal = os.getpid()
+        for pid in sorted({evento['pid'] for evento in eventos}):
+            nome = (
+                'RemoveBG' if pid == pid_principal else f'Trabalhador {pid}'
+            )
+            eventos.append(
+                {
+                    'name': 'process_name',
+                    'ph': 'M',
+                    'pid': pid,
+                    'tid': 0,
+                    'args': {'name': nome},
+                }
+            )
+        return eventos
+
+    def salvar(self):
+        """Grava o arquivo de trace e retorna o caminho"""
+        dados = {
+            'traceEvents': self.criar_eventos(),
+            'displayTimeUnit': 'ms',
+        }
+        with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(dados, arquivo, ensure_ascii=False)
+        return self.caminho
@@ -1,8 +1,12 @@
 from PIL import Image, ImageOps
 
 
-def criar_preview(imagem, largura_max, altura_max):
-    """Cria uma versão redimensionada da imagem para preview"""
+def criar_preview(imagem, largura_max, altura_max, piramide=None):
+    """Cria uma versão redimensionada da imagem para preview
+
+    Com a `piramide` da imagem (app.utils.piramide_imagem), a redução parte
+    do nível mais próximo em vez da resolução completa.
+    """
     if not imagem:
         return None
 
@@ -17,6 +21,8 @@ def criar_preview(imagem, largura_max, altura_max):
             max(1, int(img_alt * proporcao)),
         )
         try:
+            if piramide is not None:
+                return piramide.redimensionar(novo_tamanho)
             return imagem.resize(novo_tamanho, Image.Resampling.LANCZOS)
         except Exception as e:
             print(f'Erro ao redimensionar preview: {e}')
@@ -24,10 +30,74 @@ def criar_preview(imagem, largura_max, altura_max):
     return imagem
 
 
-def carregar_imagem(caminho_arquivo):
-    """Carrega uma imagem de um arquivo e a prepara para processamento"""
+def carregar_imagem(caminho_arquivo, converter_rgba=True):
+    """Carrega uma imagem de um arquivo e a prepara para processamento
+
+    Com converter_rgba=False, imagens RGB são mantidas como estão: os modelos
+    só precisam dos canais RGB, e a conversão copiaria a imagem inteira.
+    """
     imagem = Image.open(caminho_arquivo)
     imagem = ImageOps.exif_transpose(imagem)
-    if imagem.mode != 'RGBA':
+    if converter_rgba:
+        modos_aceitos = ('RGBA',)
+    else:
+        modos_aceitos = ('RGB', 'RGBA')
+    if imagem.mode not in modos_aceitos:
         imagem = imagem.convert('RGBA')
     return imagem
+
+
+def carregar_rascunho(caminho_arquivo, tamanho_maximo):
+    """Decodifica rapidamente uma versão reduzida da imagem, se possível
+
+    Em JPEG usa o modo draft, que decodifica direto em escala 1/2 a 1/8 (o
+    resultado fica pouco acima de `tamanho_maximo`). Retorna None nos
+    formatos sem decodificação reduzida, em que um rascunho custaria quase o
+    mesmo que a imagem inteira.
+    """
+    with Image.open(caminho_arquivo) as imagem:
+        if imagem.format != 'JPEG':
+            return None
+        imagem.draft('RGB', tamanho_maximo)
+        imagem = ImageOps.exif_transpose(imagem)
+        return imagem.convert('RGBA')
+
+
+def reduzir_imagem(imagem, tamanho_minimo):
+    """Reduz a imagem por um fator inteiro, mantendo cada lado >= o mínimo
+
+    Usa Image.reduce (média de blocos), bem mais barato que um resize
+    LANCZOS a partir da resolução cheia. Retorna a própria imagem quando
+    não há redução possível.
+    """
+    largura_minima, altura_minima = tamanho_minimo
+    fator = min(imagem.width // largura_minima, imagem.height // altura_minima)
+    if fator < 2:
+        return imagem
+    return imagem.reduce(fator)
+
+
+def carregar_imagem_reduzida(caminho_arquivo, tamanho_minimo):
+    """Carrega a imagem já reduzida para perto de `tamanho_minimo`
+
+    Em JPEG, a decodificação é feita direto em escala reduzida (modo draft),
+    sem decodificar a imagem inteira; nesse caso retorna
+    (imagem_reduzida, None) e a imagem completa precisa ser lida depois. Nos
+    outros formatos a imagem é decodificada por completo e retorna
+    (imagem_reduzida, imagem_completa), evitando uma segunda leitura.
+    """
+    imagem = Image.open(caminho_arquivo)
+    tamanho_original = imagem.size
+    # Lado quadrado: continua válido depois da rotação EXIF
+    lado = max(tamanho_minimo)
+    imagem.draft('RGB', (lado, lado))
+    decodificada_reduzida = imagem.size != tamanho_original
+
+    imagem = ImageOps.exif_transpose(imagem)
+    if imagem.mode not in ('RGB', 'RGBA'):
+        imagem = imagem.convert('RGBA')
+
+    imagem_reduzida = reduzir_imagem(imagem, tamanho_minimo)
+    if decodificada_reduzida:
+        return imagem_reduzida, None
+    return imagem_reduzida, imagem
@@ -0,0 +1,185 @@
+"""Instrumentação leve das etapas de processamento
+
+Cada arquivo processado gera um evento com o tempo de cada etapa (carregar,
+inferencia, matting, salvar...). Os eventos são entregues às funções
+inscritas com `inscrever`. Sem inscritos, `iniciar_medicao` devolve uma
+medição nula que não mede nada, então o custo no caminho quente é apenas
+uma verificação de lista vazia.
+
+Formato do evento (dicionário):
+    origem     -- quem processou ('lote', 'removedor', 'recorte_massa')
+    arquivo    -- nome do arquivo (ou None)
+    etapas     -- {etapa: milissegundos}
+    intervalos -- [(etapa, inicio_s, duracao_s, pid, tid)], com inicio_s em
+                  time.perf_counter()
+    erro       -- mensagem de erro ou None
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+_inscritos = []
+_trava_inscritos = threading.Lock()
+
+
+def inscrever(funcao):
+    """Passa a entregar os eventos de medição para `funcao(evento)`"""
+    with _trava_inscritos:
+        if funcao not in _inscritos:
+            _inscritos.append(funcao)
+
+
+def cancelar_inscricao(funcao):
+    """Deixa de entregar eventos para `funcao`"""
+    with _trava_inscritos:
+        if funcao in _inscritos:
+            _inscritos.remove(funcao)
+
+
+def ha_inscritos():
+    """Indica se alguém está recebendo eventos"""
+    return bool(_inscritos)
+
+
+def publicar(evento):
+    """Entrega um evento a todos os inscritos"""
+    with _trava_inscritos:
+        inscritos = list(_inscritos)
+    for funcao in inscritos:
+        try:
+            funcao(evento)
+        except Exception as e:
+            print(f'Erro em inscrito da instrumentação: {e}')
+
+
+class MedicaoArquivo:
+    """Acumula os tempos das etapas de um arquivo"""
+
+    def __init__(self, origem, arquivo):
+        self.origem = origem
+        self.arquivo = arquivo
+        self.etapas = {}
+        self.intervalos = []
+
+    @contextmanager
+    def etapa(self, nome):
+        """Mede o bloco como a etapa `nome`"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, inicio, time.perf_counter() - inicio)
+
+    def registrar(self, nome, inicio, duracao, compartilhada_por=1):
+        """Registra uma etapa já medida
+
+        Etapas executadas uma vez para vários arquivos (inferência em lote)
+        contam apenas a fração `duracao / compartilhada_por` no total do
+        arquivo, mas o intervalo completo é mantido para a linha do tempo.
+        """
+        self.etapas[nome] = (
+            self.etapas.get(nome, 0.0)
+            + duracao * 1000 / max(1, compartilhada_por)
+        )
+        self.intervalos.append(
+            (nome, inicio, duracao, os.getpid(), threading.get_ident())
+        )
+
+    def criar_evento(self, erro=None):
+        """Monta o evento publicado para os inscritos"""
+        return {
+            'origem': self.origem,
+            'arquivo': self.arquivo,
+            'etapas': dict(self.etapas),
+            'intervalos': list(self.intervalos),
+            'erro': None if erro is None else str(erro),
+        }
+
+    def concluir(self, erro=None):
+        """Publica o evento do arquivo"""
+        publicar(self.criar_evento(erro))
+
+
+class _MedicaoNula:
+    """Medição usada quando não há inscritos: não faz nada"""
+
+    origem = None
+    arquivo = None
+
+    def etapa(self, nome):
+        return nullcontext()
+
+    def registrar(self, nome, inicio, duracao, compartilhada_por=1):
+        pass
+
+    def concluir(self, erro=None):
+        pass
+
+
+MEDICAO_NULA = _MedicaoNula()
+
+
+def iniciar_medicao(origem, arquivo=None):
+    """Cria a medição de um arquivo (nula se ninguém estiver inscrito)"""
+    if not _inscritos:
+        return MEDICAO_NULA
+    return MedicaoArquivo(origem, arquivo)
+
+
+class EstatisticasDesempenho:
+    """Inscrito que calcula imagens/s e o tempo médio de cada etapa
+
+    Usa uma janela deslizante dos últimos `janela_s` segundos. É seguro
+    receber eventos de várias threads e consultar o resumo de outra.
+    """
+
+    def __init__(self, janela_s=10.0):
+        self.janela_s = janela_s
+        self.eventos = deque()
+        self.trava = threading.Lock()
+
+    def __call__(self, evento):
+        with self.trava:
+            self.eventos.append((time.perf_counter(), evento['etapas']))
+            self.descartar_antigos()
+
+    def descartar_antigos(self):
+        """Remove eventos fora da janela (chamar com a trava adquirida)"""
+        limite = time.perf_counter() - self.janela_s
+        while self.eventos and self.eventos[0][0] < limite:
+            self.eventos.popleft()
+
+    def resumo(self):
+        """Retorna (imagens_por_segundo, {etapa: ms_medio})"""
+        with self.trava:
+            self.descartar_antigos()
+            eventos = list(self.eventos)
+
+        if not eventos:
+            return 0.0, {}
+
+        decorrido = max(time.perf_counter() - eventos[0][0], 1e-6)
+        if len(eventos) > 1:
+            decorrido = max(eventos[-1][0] - eventos[0][0], 1e-6)
+            imagens_por_segundo = (len(eventos) - 1) / decorrido
+        else:
+            imagens_por_segundo = 1 / decorrido
+
+        totais = {}
+        for _, etapas in eventos:
+            for etapa, ms in etapas.items():
+                totais[etapa] = totais.get(etapa, 0.0) + ms
+        medias = {etapa: total / len(eventos) for etapa, total in totais.items()}
+        return imagens_por_segundo, medias
+
+    def texto_resumo(self):
+        """Resumo curto para a barra de status"""
+        imagens_por_segundo, medias = self.resumo()
+        if not medias:
+            return ''
+        etapas = ' · '.join(
+            f'{etapa} {ms:.0f} ms' for etapa, ms in medias.items()
+        )
+        return f'{imagens_por_segundo:.1f} img/s | {etapas}'
@@ -0,0 +1,104 @@
+import math
+import threading
+
+from PIL import Image
+
+
+class PiramideImagem:
+    """Reduções sucessivas de uma imagem pela metade (mipmaps)
+
+    O nível 0 é a própria imagem e cada nível seguinte é o anterior reduzido
+    pela metade com `Image.reduce(2)` (média de blocos 2×2). Os níveis são
+    criados na primeira vez em que são pedidos e reaproveitados depois, então
+    prévias e zooms reduzidos partem do nível mais próximo do tamanho pedido
+    e só fazem um redimensionamento pequeno no fim.
+
+    Quem altera a imagem no lugar (a borracha) chama `atualizar_regiao`,
+    que também avança a `versao` (usada pelo cache de previews); quem a
+    substitui (processamento, recorte) usa uma nova pirâmide.
+    """
+
+    def __init__(self, imagem):
+        self.imagem = imagem
+        self.niveis = [imagem]
+        self.versao = 0
+        # A prévia ao vivo usa a pirâmide fora da thread da interface
+        self.trava = threading.Lock()
+        # Último nível em que o menor lado ainda tem ao menos 1 pixel
+        self.nivel_maximo = int(math.log2(max(1, min(imagem.size))))
+
+    def nivel(self, indice):
+        """Retorna o nível `indice`, criando os que ainda faltam"""
+        indice = min(max(0, indice), self.nivel_maximo)
+        with self.trava:
+            while len(self.niveis) <= indice:
+                self.niveis.append(self.niveis[-1].reduce(2))
+            return self.niveis[indice]
+
+    def indice_para_escala(self, escala):
+        """Nível mais reduzido que ainda tem resolução para a `escala`"""
+        if escala >= 1:
+            return 0
+        # A folga evita cair um nível abaixo por arredondamento (0.5 → 1)
+        return min(int(math.log2(1 / escala) + 1e-9), self.nivel_maximo)
+
+    def redimensionar(self, tamanho, filtro=Image.Resampling.LANCZOS):
+        """Redimensiona a imagem inteira partindo do nível mais próximo"""
+        escala = max(
+            tamanho[0] / self.imagem.width, tamanho[1] / self.imagem.height
+        )
+        nivel = self.nivel(self.indice_para_escala(escala))
+        if nivel.size == tuple(tamanho):
+            return nivel
+        return nivel.resize(tamanho, filtro)
+
+    def regiao(self, tamanho, caixa, indice, filtro=Image.Resampling.NEAREST):
+        """Reamostra a `caixa` (coordenadas da imagem) a partir de um nível
+
+        Quem desenha em blocos escolhe o `indice` uma vez para todos eles
+        (veja `indice_para_escala`), para que blocos vizinhos venham do
+        mesmo nível.
+        """
+        fator = 2**indice
+        return self.nivel(indice).resize(
+            tamanho, filtro, box=tuple(c / fator for c in caixa)
+        )
+
+    def alinhar_caixa(self, caixa, indice):
+        """Expande a caixa para os blocos que um pixel do nível cobre"""
+        fator = 2**indice
+        x1, y1, x2, y2 = caixa
+        return (
+            x1 // fator * fator,
+            y1 // fator * fator,
+            min(self.imagem.width, -(-x2 // fator) * fator),
+            min(self.imagem.height, -(-y2 // fator) * fator),
+        )
+
+    def atualizar_regiao(self, caixa):
+        """Refaz, nos níveis já criados, a `caixa` alterada na imagem
+
+        Cada nível é refeito só na região correspondente, a partir do nível
+        anterior, com o mesmo resultado de reduzir a imagem inteira.
+        """
+        x1, y1, x2, y2 = caixa
+        with self.trava:
+            self.versao += 1
+            for indice in range(1, len(self.niveis)):
+                anterior = self.niveis[indice - 1]
+                nivel = self.niveis[indice]
+                # Blocos 2×2 do nível anterior que tocam a caixa
+                x1, y1 = x1 // 2, y1 // 2
+                x2 = min(nivel.width, -(-x2 // 2))
+                y2 = min(nivel.height, -(-y2 // 2))
+                if x2 <= x1 or y2 <= y1:
+                    break
+                bloco = anterior.crop(
+                    (
+                        x1 * 2,
+                        y1 * 2,
+                        min(anterior.width, x2 * 2),
+                        min(anterior.height, y2 * 2),
+                    )
+                ).reduce(2)
+                nivel.paste(bloco, (x1, y1))
@@ -0,0 +1,108 @@
+import os
+import queue
+import threading
+
+from app.configuracoes import EXTENSOES_SUPORTADAS
+
+# Marcador de fim da varredura enviado pela fila
+_FIM = object()
+
+
+def varrer_imagens(
+    pasta, incluir_subpastas=False, ignorar=(), extensoes=EXTENSOES_SUPORTADAS
+):
+    """Gera, sob demanda, os caminhos das imagens relativos a `pasta`
+
+    Usa os.scandir: o tipo de cada entrada vem da própria listagem, sem um
+    stat por arquivo, e a extensão é conferida antes do tipo. Os arquivos de
+    cada pasta saem em ordem alfabética, depois de a pasta ser listada, para
+    que a ordem não dependa do sistema de arquivos (ela decide, por exemplo,
+    qual de 'foto.png' e 'foto.jpg' gera a saída 'foto.png'). Com
+    `incluir_subpastas`, desce nas subpastas (sem seguir links simbólicos),
+    exceto nas listadas em `ignorar`. Pastas que não podem ser lidas são
+    informadas no console e puladas.
+    """
+    ignoradas = {
+        os.path.normcase(os.path.abspath(caminho)) for caminho in ignorar
+    }
+    pendentes = ['']
+    while pendentes:
+        relativa = pendentes.pop()
+        arquivos = []
+        subpastas = []
+        caminho_pasta = os.path.join(pasta, relativa)
+        try:
+            with os.scandir(caminho_pasta) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.name.lower().endswith(extensoes):
+                            if entrada.is_file():
+                                arquivos.append(entrada.name)
+                        elif incluir_subpastas and entrada.is_dir(
+                            follow_symlinks=False
+                        ):
+                            caminho = os.path.normcase(
+                                os.path.abspath(entrada.path)
+                            )
+                            if caminho not in ignoradas:
+                                subpastas.append(
+                                    os.path.join(relativa, entrada.name)
+                                )
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f'Erro ao listar arquivos em {caminho_pasta}: {e}')
+        for nome in sorted(arquivos):
+            yield os.path.join(relativa, nome)
+        # Pilha em ordem inversa: as subpastas saem em ordem alfabética
+        pendentes.extend(sorted(subpastas, reverse=True))
+
+
+class VarreduraPasta:
+    """Varredura de pasta em segundo plano, com contagem parcial
+
+    Uma thread percorre a pasta (veja `varrer_imagens`) e entrega cada
+    arquivo pela iteração assim que ele é encontrado, então o processamento
+    começa antes de a varredura terminar. `encontrados` cresce durante a
+    varredura e só é o total definitivo quando `concluida` for True.
+    """
+
+    def __init__(self, pasta, incluir_subpastas=False, ignorar=()):
+        self.pasta = pasta
+        self.incluir_subpastas = incluir_subpastas
+        self.ignorar = ignorar
+        self.encontrados = 0
+        self.concluida = False
+        self.parada = False
+        self.fila = queue.Queue()
+        self.thread = None
+
+    def iniciar(self):
+        """Inicia a varredura em segundo plano e retorna a própria varredura"""
+        self.thread = threading.Thread(target=self.executar, daemon=True)
+        self.thread.start()
+        return self
+
+    def executar(self):
+        try:
+            for caminho in varrer_imagens(
+                self.pasta, self.incluir_subpastas, self.ignorar
+            ):
+                if self.parada:
+                    break
+                self.encontrados += 1
+                self.fila.put(caminho)
+        finally:
+            self.concluida = True
+            self.fila.put(_FIM)
+
+    def parar(self):
+        """Interrompe a varredura; a iteração termina no próximo arquivo"""
+        self.parada = True
+
+    def __iter__(self):
+        while True:
+            caminho = self.fila.get()
+            if caminho is _FIM:
+                return
+            yield caminho
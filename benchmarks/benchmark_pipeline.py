@@ -0,0 +1,381 @@
+"""Benchmark do pipeline de remoção de fundo, separado por etapa
+
+Uso:
+    python -m benchmarks.benchmark_pipeline [--modelos u2net ...]
+        [--resolucoes 1920x1080,4000x3000] [--repeticoes 3]
+        [--saida resultados.json]
+
+Gera imagens sintéticas (JPEG com orientação EXIF) em várias resoluções e
+proporções e executa cada modelo com alpha matting ligado e desligado. Para
+cada caso mede a média, em milissegundos, das etapas: decodificação,
+correção EXIF, conversão RGBA, codificação para bytes (o caminho antigo do
+rembg), inferência, matting, codificação da saída e escrita. Também informa
+imagens por segundo e o pico de memória (RSS) do processo até aquele caso.
+Os resultados são gravados em JSON para comparar execuções.
+
+Com --comparar-blocos, os casos com alpha matting também comparam o matting
+da imagem inteira com o matting em blocos (tempo e diferença do alpha na
+faixa desconhecida, em relação a TOLERANCIA_MATTING_BLOCOS).
+
+Com --comparar-saidas, o resultado de cada caso é codificado em cada formato
+de CONFIGURACOES_SAIDA (PNG em vários níveis, otimizado e com paleta, WebP
+sem e com perdas e só a máscara), informando o tempo médio e o tamanho.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageOps
+
+from rembg.bg import alpha_matting_cutout
+
+from app.configuracoes import (EROSAO_MASCARA_PADRAO, LIMIAR_FUNDO_PADRAO,
+                               LIMIAR_OBJETO_PADRAO, MODELOS_DISPONIVEIS,
+                               TOLERANCIA_MATTING_BLOCOS, VERSAO)
+from app.processadores.codificador_saida import ConfiguracaoSaida
+from app.processadores.refinamento import RefinamentoBordas
+from app.processadores.removedor_fundo import RemoveFundo
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESOLUCOES_PADRAO = '640x480,1920x1080,1080x1920,3000x3000,4000x3000'
+ETAPAS = (
+    'decodificar',
+    'exif',
+    'converter_rgba',
+    'codificar_bytes',
+    'inferencia',
+    'matting',
+    'codificar_saida',
+    'gravar',
+)
+
+CONFIGURACOES_SAIDA = {
+    'png_nivel_1': ConfiguracaoSaida('png', nivel_compressao=1),
+    'png_nivel_6': ConfiguracaoSaida('png', nivel_compressao=6),
+    'png_nivel_9': ConfiguracaoSaida('png', nivel_compressao=9),
+    'png_otimizado': ConfiguracaoSaida('png', otimizar=True),
+    'png_paleta_256': ConfiguracaoSaida('png', cores_paleta=256),
+    'webp_sem_perdas': ConfiguracaoSaida('webp'),
+    'webp_qualidade_90': ConfiguracaoSaida(
+        'webp', webp_sem_perdas=False, qualidade_webp=90
+    ),
+    'mascara_png': ConfiguracaoSaida('mascara'),
+}
+
+
+def pico_rss_mb():
+    """Retorna o pico de memória residente do processo, em MB"""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    if sys.platform == 'darwin':
+        return pico / (1024 * 1024)
+    return pico / 1024
+
+
+def gerar_imagem_sintetica(largura, altura, semente=0):
+    """Gera um JPEG com fundo em gradiente, um objeto e ruído
+
+    A imagem é gravada girada com orientação EXIF 6, para que a correção
+    EXIF tenha trabalho real a fazer.
+    """
+    gerador = np.random.default_rng(semente)
+    eixo_x = np.linspace(0, 255, altura, dtype=np.float32)[None, :]
+    eixo_y = np.linspace(0, 255, largura, dtype=np.float32)[:, None]
+    dados = np.empty((largura, altura, 3), dtype=np.uint8)
+    dados[..., 0] = eixo_y.astype(np.uint8)
+    dados[..., 1] = ((eixo_x + eixo_y) / 2).astype(np.uint8)
+    dados[..., 2] = eixo_x.astype(np.uint8)
+    dados = np.clip(
+        dados + gerador.normal(0, 8, dados.shape), 0, 255
+    ).astype(np.uint8)
+
+    imagem = Image.fromarray(dados)
+    desenho = ImageDraw.Draw(imagem)
+    desenho.ellipse(
+        (altura * 0.25, largura * 0.2, altura * 0.75, largura * 0.8),
+        fill=(220, 60, 40),
+    )
+
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    imagem.save(buffer, format='JPEG', quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+def comparar_matting_blocos(imagem, mascara):
+    """Compara o matting da imagem inteira com o matting em blocos"""
+    parametros = (
+        LIMIAR_OBJETO_PADRAO,
+        LIMIAR_FUNDO_PADRAO,
+        EROSAO_MASCARA_PADRAO,
+    )
+    try:
+        inicio = time.perf_counter()
+        completo = alpha_matting_cutout(imagem, mascara, *parametros)
+        meio = time.perf_counter()
+        blocos = RefinamentoBordas.matting_em_blocos(
+            imagem, mascara, *parametros
+        )
+        fim = time.perf_counter()
+    except ValueError as e:
+        # Máscara sem objeto ou sem fundo: nenhum dos dois faz matting
+        return {'erro': str(e)}
+
+    trimap = RefinamentoBordas.criar_trimap(np.asarray(mascara), *parametros)
+    desconhecido = trimap == 128
+    diferenca = np.abs(
+        np.asarray(completo)[..., 3].astype(np.int16)
+        - np.asarray(blocos)[..., 3].astype(np.int16)
+    )[desconhecido]
+    media = float(diferenca.mean()) if diferenca.size else 0.0
+    return {
+        'completo_ms': round((meio - inicio) * 1000, 3),
+        'blocos_ms': round((fim - meio) * 1000, 3),
+        'diferenca_media': round(media, 3),
+        'diferenca_maxima': int(diferenca.max()) if diferenca.size else 0,
+        'dentro_tolerancia': media <= TOLERANCIA_MATTING_BLOCOS,
+    }
+
+
+def comparar_saidas(imagem_resultado, repeticoes):
+    """Mede a codificação do resultado em cada formato de saída
+
+    Retorna, por formato, o tempo médio em ms, o tamanho em bytes e o
+    tamanho relativo ao PNG padrão (nível 6).
+    """
+    comparacao = {}
+    for nome, saida in CONFIGURACOES_SAIDA.items():
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            dados = saida.codificar(imagem_resultado)
+        duracao = (time.perf_counter() - inicio) / repeticoes
+        comparacao[nome] = {
+            'configuracao': saida.descrever(),
+            'codificar_ms': round(duracao * 1000, 3),
+            'bytes': len(dados),
+        }
+    referencia = comparacao['png_nivel_6']['bytes']
+    for medida in comparacao.values():
+        medida['tamanho_relativo'] = round(medida['bytes'] / referencia, 3)
+    return comparacao
+
+
+def medir_caso(removedor, dados_jpeg, usar_alpha_matting, pasta_temporaria):
+    """Executa o pipeline uma vez
+
+    Retorna (tempos de cada etapa em ms, imagem decodificada, máscara,
+    imagem resultante).
+    """
+    tempos = {}
+
+    def medir(etapa, funcao):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos[etapa] = (time.perf_counter() - inicio) * 1000
+        return resultado
+
+    def decodificar():
+        imagem = Image.open(io.BytesIO(dados_jpeg))
+        imagem.load()
+        return imagem
+
+    def codificar_bytes():
+        buffer = io.BytesIO()
+        imagem_rgba.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def codificar_saida():
+        buffer = io.BytesIO()
+        imagem_resultado.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def gravar():
+        caminho = os.path.join(pasta_temporaria, 'saida.png')
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(bytes_saida)
+
+    imagem = medir('decodificar', decodificar)
+    imagem = medir('exif', lambda: ImageOps.exif_transpose(imagem))
+    imagem_rgba = medir('converter_rgba', lambda: imagem.convert('RGBA'))
+    medir('codificar_bytes', codificar_bytes)
+
+    # Sem cache: cada repetição executa o modelo de verdade
+    removedor.limpar_cache_mascaras()
+    mascara = medir('inferencia', lambda: removedor.obter_mascara(imagem))
+    imagem_resultado = medir(
+        'matting',
+        lambda: removedor.aplicar_mascara(
+            imagem,
+            mascara,
+            usar_alpha_matting,
+            LIMIAR_OBJETO_PADRAO,
+            LIMIAR_FUNDO_PADRAO,
+            EROSAO_MASCARA_PADRAO,
+        ),
+    )
+    bytes_saida = medir('codificar_saida', codificar_saida)
+    medir('gravar', gravar)
+    return tempos, imagem, mascara, imagem_resultado
+
+
+def executar(
+    modelos,
+    resolucoes,
+    repeticoes,
+    alpha_matting_opcoes,
+    comparar_blocos,
+    comparar_formatos=False,
+):
+    """Executa todos os casos e retorna os resultados"""
+    casos = []
+    with tempfile.TemporaryDirectory() as pasta_temporaria:
+        for nome_modelo in modelos:
+            removedor = RemoveFundo(nome_modelo)
+            # Carrega a sessão fora da medição
+            removedor.sessao
+
+            for largura, altura in resolucoes:
+                dados_jpeg = gerar_imagem_sintetica(largura, altura)
+
+                for usar_alpha_matting in alpha_matting_opcoes:
+                    medicoes = []
+                    for _ in range(repeticoes):
+                        (
+                            tempos,
+                            imagem,
+                            mascara,
+                            imagem_resultado,
+                        ) = medir_caso(
+                            removedor,
+                            dados_jpeg,
+                            usar_alpha_matting,
+                            pasta_temporaria,
+                        )
+                        medicoes.append(tempos)
+                    etapas_ms = {
+                        etapa: round(
+                            sum(m[etapa] for m in medicoes) / len(medicoes), 3
+                        )
+                        for etapa in ETAPAS
+                    }
+                    # O caminho atual não codifica a entrada em bytes nem
+                    # converte para RGBA: essas etapas ficam fora do total
+                    total_ms = sum(
+                        tempo
+                        for etapa, tempo in etapas_ms.items()
+                        if etapa not in ('codificar_bytes', 'converter_rgba')
+                    )
+                    caso = {
+                        'modelo': nome_modelo,
+                        'resolucao': f'{largura}x{altura}',
+                        'alpha_matting': usar_alpha_matting,
+                        'repeticoes': repeticoes,
+                        'etapas_ms': etapas_ms,
+                        'total_ms': round(total_ms, 3),
+                        'imagens_por_segundo': round(1000 / total_ms, 3)
+                        if total_ms > 0
+                        else None,
+                        'pico_rss_mb': pico_rss_mb(),
+                    }
+                    if comparar_blocos and usar_alpha_matting:
+                        caso['matting_blocos'] = comparar_matting_blocos(
+                            imagem, mascara
+                        )
+                    if comparar_formatos:
+                        caso['saidas'] = comparar_saidas(
+                            imagem_resultado, repeticoes
+                        )
+                    casos.append(caso)
+                    print(
+                        f"{nome_modelo} {caso['resolucao']} "
+                        f"alpha_matting={usar_alpha_matting}: "
+                        f"{caso['total_ms']:.1f} ms/imagem",
+                        file=sys.stderr,
+                    )
+    return casos
+
+
+def ler_resolucoes(texto):
+    """Converte '1920x1080,4000x3000' em [(1920, 1080), (4000, 3000)]"""
+    resolucoes = []
+    for item in texto.split(','):
+        largura, altura = item.lower().split('x')
+        resolucoes.append((int(largura), int(altura)))
+    return resolucoes
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.benchmark_pipeline',
+        description='Mede o tempo de cada etapa da remoção de fundo.',
+    )
+    parser.add_argument(
+        '--modelos',
+        nargs='*',
+        choices=MODELOS_DISPONIVEIS,
+        default=MODELOS_DISPONIVEIS,
+    )
+    parser.add_argument('--resolucoes', default=RESOLUCOES_PADRAO)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument(
+        '--alpha-matting',
+        choices=('ambos', 'ligado', 'desligado'),
+        default='ambos',
+    )
+    parser.add_argument('--saida', default='resultados_benchmark.json')
+    parser.add_argument(
+        '--comparar-blocos',
+        action='store_true',
+        help='compara o matting da imagem inteira com o matting em blocos',
+    )
+    parser.add_argument(
+        '--comparar-saidas',
+        action='store_true',
+        help='mede tempo e tamanho da saída em cada formato (PNG, WebP...)',
+    )
+    args = parser.parse_args(argumentos)
+
+    alpha_matting_opcoes = {
+        'ambos': (False, True),
+        'ligado': (True,),
+        'desligado': (False,),
+    }[args.alpha_matting]
+
+    casos = executar(
+        args.modelos,
+        ler_resolucoes(args.resolucoes),
+        max(1, args.repeticoes),
+        alpha_matting_opcoes,
+        args.comparar_blocos,
+        args.comparar_saidas,
+    )
+
+    resultado = {
+        'ambiente': {
+            'versao_app': VERSAO,
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'casos': casos,
+    }
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f'Resultados gravados em {args.saida}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Confere a normalização do lote contra a da própria sessão do rembg
+
+Uso:
+    python -m benchmarks.verificar_normalizacao [--modelos u2net ...]
+
+A inferência em lote (RemoveFundo.obter_mascaras_lote) monta o tensor com
+RemoveFundo.preparar_tensor e os parâmetros de PARAMETROS_MODELOS, sem passar
+pelo `predict` da sessão. Para cada modelo, este script executa o `predict` da
+sessão numa imagem sintética, captura o tensor que ela gerou com
+`normalize(...)` e o compara com o de preparar_tensor. Termina com código 1
+se algum modelo divergir (por exemplo, depois de atualizar o rembg).
+"""
+import argparse
+import io
+import sys
+
+import numpy as np
+
+from app.configuracoes import MODELOS_DISPONIVEIS
+from app.processadores.gerenciador_sessoes import obter_gerenciador_padrao
+from app.processadores.removedor_fundo import PARAMETROS_MODELOS, RemoveFundo
+from app.utils.imagem_utils import carregar_imagem
+from benchmarks.benchmark_pipeline import gerar_imagem_sintetica
+
+# Diferença máxima aceita entre os tensores (o rembg calcula em float64)
+TOLERANCIA = 1e-4
+
+
+def tensor_da_sessao(sessao, imagem):
+    """Executa o predict da sessão e retorna o tensor gerado por normalize"""
+    tensores = []
+    normalizar = sessao.normalize
+
+    def capturar(*args, **kwargs):
+        entrada = normalizar(*args, **kwargs)
+        tensores.append(next(iter(entrada.values())))
+        return entrada
+
+    # Substitui só nesta instância; a sessão volta ao normal no fim
+    sessao.normalize = capturar
+    try:
+        sessao.predict(imagem)
+    finally:
+        del sessao.normalize
+    if len(tensores) != 1:
+        raise RuntimeError(
+            f'normalize chamado {len(tensores)} vezes no predict'
+        )
+    return tensores[0][0]
+
+
+def verificar_modelo(nome_modelo, sessao, imagem):
+    """Retorna a diferença máxima entre o tensor da sessão e o do lote"""
+    tamanho, media, desvio = PARAMETROS_MODELOS[nome_modelo]
+    esperado = tensor_da_sessao(sessao, imagem)
+    obtido = RemoveFundo.preparar_tensor(imagem, tamanho, media, desvio)
+    if esperado.shape != obtido.shape:
+        return float('inf')
+    return float(np.abs(esperado - obtido).max())
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.verificar_normalizacao',
+        description=(
+            'Compara a normalização do lote com a da sessão de cada modelo.'
+        ),
+    )
+    parser.add_argument(
+        '--modelos',
+        nargs='*',
+        choices=MODELOS_DISPONIVEIS,
+        default=MODELOS_DISPONIVEIS,
+    )
+    args = parser.parse_args(argumentos)
+
+    imagem = carregar_imagem(io.BytesIO(gerar_imagem_sintetica(640, 480)))
+    gerenciador = obter_gerenciador_padrao()
+    divergentes = []
+    for nome_modelo in args.modelos:
+        if nome_modelo not in PARAMETROS_MODELOS:
+            print(f'{nome_modelo}: sem parâmetros de lote (usa o predict)')
+            continue
+        diferenca = verificar_modelo(
+            nome_modelo, gerenciador.obter_sessao(nome_modelo), imagem
+        )
+        situacao = 'ok' if diferenca <= TOLERANCIA else 'DIVERGENTE'
+        print(f'{nome_modelo}: diferença máxima {diferenca:.2e} ({situacao})')
+        if diferenca > TOLERANCIA:
+            divergentes.append(nome_modelo)
+
+    if divergentes:
+        print(
+            'Atualize PARAMETROS_MODELOS para: ' + ', '.join(divergentes),
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
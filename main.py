@@ -1,12 +1,18 @@
+import multiprocessing
 import sys
 
-from PyQt6.QtWidgets import QApplication
 
-from app.gui.app_principal import AplicativoRemoveFundo
-from app.utils.estilos import configurar_paleta
+def main():
+    # Necessário para o pool de processos do lote em executáveis congelados
+    multiprocessing.freeze_support()
 
+    # A interface é importada só aqui: os processos trabalhadores do lote
+    # reimportam este módulo e precisam apenas do motor de processamento
+    from PyQt6.QtWidgets import QApplication
+
+    from app.gui.app_principal import AplicativoRemoveFundo
+    from app.utils.estilos import configurar_paleta
 
-def main():
     # Inicialização da aplicação Qt
     app = QApplication(sys.argv)
     app.setStyle('Fusion')  # Estilo visual consistente